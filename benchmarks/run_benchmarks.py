@@ -0,0 +1,244 @@
+"""
+Benchmark suite of the dhnpype calculations on synthetic branches (see src/synthetic_network.py).
+
+Timed separately for each network size:
+    - 'section_arrays': build_section_arrays() of the supply and return lines,
+    - 'kernel_python' / 'kernel_numba': solve_branch() with the python and numba backends,
+    - 'branch.calculate_supply', 'branch.calculate_return', 'branch.calculate_system_heat_flow': Branch methods (section by section),
+    - 'plot_branch', 'plot_insulation', 'plot_output_heatmap': Plotly figure builders (figures are built, not shown),
+and once per run (size = number of calls):
+    - 'calculate_fluid_density', 'calculate_fluid_specific_heat', 'calculate_r_total', 'calculate_output_temperature'.
+
+Each size runs in its own Python process (data_input.py reads the input file at import, Branch appends to module-level DataFrames).
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py --sizes 100 1000 10000 --output results.json
+    python benchmarks/run_benchmarks.py --sizes 100 1000 --output new.json --baseline results.json --threshold 0.2
+
+With --baseline the exit code is 1 if any benchmark is slower than the baseline median by more than the threshold.
+
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+
+
+#==============================================================================
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_DIR, "src")
+
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000, 1_000_000)
+PROPERTY_CALLS = 1_000
+
+
+def _time_call(function, repeat:int) -> list:
+    times_s = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times_s.append(time.perf_counter() - start)
+    return times_s
+
+
+def _result(name:str, size:int, times_s:list) -> dict:
+    return {"name": name, "size": size, "repeat": len(times_s), "times_s": times_s,
+            "median_s": statistics.median(times_s), "min_s": min(times_s)}
+
+
+#==========================| WORKER |==========================================
+def run_worker(args) -> list:
+    """
+    Runs the benchmarks of one network size. Called in a subprocess with the working directory 'src'
+    and DHNPYPE_INPUT_FILE pointing to the synthetic input file.
+
+    """
+    sys.path.insert(0, SRC_DIR)
+    import data_input
+    import data_output
+    import kernels
+    from branch import Branch
+    from section_arrays import build_section_arrays
+
+    size, repeat = args.size, args.repeat
+    results = []
+    network = Branch()
+
+    def build_arrays():
+        return (build_section_arrays(data_input.df_supply_in, "supply", network.th_all, network.ins_damage_mode, network.th_ins_damage_avg_m),
+                build_section_arrays(data_input.df_return_in, "return", network.th_all, network.ins_damage_mode, network.th_ins_damage_avg_m))
+    results.append(_result("section_arrays", size, _time_call(build_arrays, repeat)))
+
+    arrays_supply, arrays_return = build_arrays()
+    property_table = kernels.build_property_table(network.iv.p_nominal_pa, network.iv.fluid, -20, 200)
+    backends = ["python"] if size <= args.python_max else []
+    if kernels.numba is not None:
+        backends.append("numba")
+    for backend in backends:
+        solve = lambda: kernels.solve_branch(arrays_supply, arrays_return, network.iv, property_table, network.tolerance, backend)
+        solve()                                                                # warm-up (JIT compilation)
+        results.append(_result(f"kernel_{backend}", size, _time_call(solve, repeat)))
+
+    if size <= args.branch_max:
+        for method in ("calculate_supply", "calculate_return", "calculate_system_heat_flow"):
+            times_s = []
+            for _ in range(repeat):
+                if method == "calculate_supply":
+                    data_output.clear_output_frames()                          # Branch appends rows ---> same starting state in every repeat
+                elif method == "calculate_return":
+                    data_output.df_return_out = data_output.df_return_out.iloc[0:0]
+                else:
+                    data_output.df_system_out = data_output.df_system_out.iloc[0:0]
+                times_s += _time_call(getattr(network, method), 1)
+            results.append(_result(f"branch.{method}", size, times_s))
+
+    if size <= args.plot_max:
+        import plots
+        kernels.calculate_branch_kernel(network)
+        plot_builders = {
+            "plot_branch": lambda: plots.plot_branch("all", show = False),
+            "plot_insulation": lambda: plots.plot_insulation("supply", show = False),
+            "plot_output_heatmap": lambda: plots.plot_output_heatmap("supply", "T [°C]", show = False)
+        }
+        for name, builder in plot_builders.items():
+            try:
+                builder()                                                      # warm-up (imports, templates)
+            except (AttributeError, ImportError) as error:                     # Plotly version without the map traces used in plots.py (Plotly >= 7)
+                if "Scattermapbox" not in str(error):                          # other errors are regressions ---> the benchmark fails
+                    raise
+                print(f"Skipping {name}: {type(error).__name__}: {error}", file = sys.stderr)
+                continue
+            results.append(_result(name, size, _time_call(builder, repeat)))
+
+    if args.properties:
+        results += run_property_benchmarks(network, repeat)
+    return results
+
+
+def run_property_benchmarks(network, repeat:int) -> list:
+    """
+    Times PROPERTY_CALLS calls of the scalar functions in utils/functions.py.
+
+    """
+    from utils.constants import TZERO
+    from utils.functions import calculate_fluid_density, calculate_fluid_specific_heat, calculate_r_total, calculate_output_temperature
+
+    p_pa, fluid = network.iv.p_nominal_pa, network.iv.fluid
+    t_k = [network.iv.t_in_supply_c - TZERO - 20 * i / PROPERTY_CALLS for i in range(PROPERTY_CALLS)]
+    functions = {
+        "calculate_fluid_density": lambda: [calculate_fluid_density(p_pa, t, fluid) for t in t_k],
+        "calculate_fluid_specific_heat": lambda: [calculate_fluid_specific_heat(p_pa, t, fluid) for t in t_k],
+        "calculate_r_total": lambda: [calculate_r_total(0.2101, 30.0 + i % 50, 4000, 0.219, 50, 0.3, 0.026, 8) for i in range(PROPERTY_CALLS)],
+        "calculate_output_temperature": lambda: [calculate_output_temperature(t - 273.15, 10.0, 50.0, 4190.0, 0.025) for t in t_k]
+    }
+    return [_result(name, PROPERTY_CALLS, _time_call(function, repeat)) for name, function in functions.items()]
+
+
+#==========================| BASELINE COMPARISON |=============================
+def compare_with_baseline(results:list, baseline_results:list, threshold:float) -> list:
+    """
+    Compares median times with a baseline run.
+
+    :param results: List of benchmark results.
+    :param baseline_results: List of benchmark results of the baseline.
+    :param threshold: Allowed relative slowdown (e.g. 0.2 = 20 %).
+    :return comparison: List of dictionaries (name, size, baseline_s, current_s, ratio, regression) for benchmarks present in both runs.
+
+    """
+    baseline = {(r["name"], r["size"]): r["median_s"] for r in baseline_results}
+    comparison = []
+    for r in results:
+        key = (r["name"], r["size"])
+        if key not in baseline or baseline[key] <= 0:
+            continue
+        ratio = r["median_s"] / baseline[key]
+        comparison.append({"name": r["name"], "size": r["size"], "baseline_s": baseline[key], "current_s": r["median_s"],
+                           "ratio": ratio, "regression": ratio > 1 + threshold})
+    return comparison
+
+
+#==========================| MAIN |============================================
+def run_size(size:int, input_dir:str, args, properties:bool) -> list:
+    sys.path.insert(0, SRC_DIR)
+    from synthetic_network import write_synthetic_branch
+
+    data_file = write_synthetic_branch(os.path.join(input_dir, f"branch_{size}.{args.input_format}"), size, seed = args.seed)
+    env = dict(os.environ, DHNPYPE_INPUT_FILE = data_file, MPLBACKEND = "Agg")
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--size", str(size), "--repeat", str(args.repeat),
+               "--branch-max", str(args.branch_max), "--plot-max", str(args.plot_max), "--python-max", str(args.python_max)]
+    if properties:
+        command.append("--properties")
+    completed = subprocess.run(command, cwd = SRC_DIR, env = env, capture_output = True, text = True)
+    sys.stderr.write(completed.stderr)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark of size {size} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(description = "Benchmarks of the dhnpype calculations on synthetic branches.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = list(DEFAULT_SIZES), help = "Numbers of sections per line.")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Repeats of each benchmark.")
+    parser.add_argument("--seed", type = int, default = 0, help = "Seed of the synthetic network generator.")
+    parser.add_argument("--branch-max", type = int, default = 1_000, help = "Largest size timed with the Branch methods.")
+    parser.add_argument("--plot-max", type = int, default = 10_000, help = "Largest size timed with the plot builders.")
+    parser.add_argument("--python-max", type = int, default = 100_000, help = "Largest size timed with the python kernel backend.")
+    parser.add_argument("--input-format", default = "npz", choices = ["csv", "npz", "parquet", "feather"], help = "Format of the synthetic input files.")
+    parser.add_argument("--output", default = "benchmark_results.json", help = "Results file (JSON).")
+    parser.add_argument("--baseline", default = None, help = "Results file of a baseline run.")
+    parser.add_argument("--threshold", type = float, default = 0.2, help = "Allowed relative slowdown against the baseline.")
+    parser.add_argument("--worker", action = "store_true", help = argparse.SUPPRESS)
+    parser.add_argument("--size", type = int, help = argparse.SUPPRESS)
+    parser.add_argument("--properties", action = "store_true", help = argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as input_dir:
+        for i, size in enumerate(sorted(args.sizes)):
+            size_results = run_size(size, input_dir, args, properties = i == 0)
+            for r in size_results:
+                print(f"{r['name']:<36} {r['size']:>9}   median {r['median_s']:.4f} s   min {r['min_s']:.4f} s")
+            results += size_results
+
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "platform": platform.platform(),
+                 "processor": platform.processor(), "cpu_count": os.cpu_count(), "numba": numba_version,
+                 "seed": args.seed, "repeat": args.repeat, "input_format": args.input_format},
+        "results": results
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            comparison = compare_with_baseline(results, json.load(baseline_file)["results"], args.threshold)
+        report["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "results": comparison}
+        regressions = [c for c in comparison if c["regression"]]
+        for c in regressions:
+            print(f"REGRESSION: {c['name']} (size {c['size']}): {c['baseline_s']:.4f} s ---> {c['current_s']:.4f} s ({c['ratio']:.2f}x)")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%}).")
+
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent = 2)
+    print(f"Results written to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
+import functools
+import numpy as np
 import pandas as pd
-import json
+from time import perf_counter
 
 import data_input
 # Supply
@@ -9,29 +11,45 @@ from data_input import (d_pipe_ext_supply_m, d_pipe_nom_supply_mm, l_pipesection
 from data_input import (d_pipe_ext_return_m, d_pipe_nom_return_mm, l_pipesection_return_m, th_insulation_return_percent, location_return, 
                         mdot_takeoff_return_kg_per_s, lat_return, lon_return, )
 import data_output
-from data_output import PipeRow, SystemRow 
+from data_output import PipeRow, SystemRow, SolverDiagnostics
 from config_data import BranchInitialConfig
 from utils.constants import TZERO
 from utils.functions import (calculate_flow_velocity, calculate_fluid_density, calculate_fluid_specific_heat, calculate_pipe_internal_diameter, 
                             calculate_insulation_external_diameter, calculate_insulation_thickness, 
                             select_heat_transfer_coeff, calculate_r_total, select_ambient_temperature, 
                             calculate_output_temperature, )
-from utils.validation import validate_damage
-from utils.exceptions import SupplyDataMissingError
+from utils.validation import validate_damage, validate_input_frame
+from utils.exceptions import SupplyDataMissingError, CalculationCancelledError
+from utils.readers import read_thickness_data
+from utils.instrumentation import RunReport, instrumented
+from utils.progress import ProgressReporter
 from model_param import ThermalCoeff, PipeSectionLocation
 
 
 #==============================================================================
 # Reading thickness data from the JSON data:
 thickness_data_location = "../data/insulation_thickness.json"
+th_mm = read_thickness_data(thickness_data_location)
 
-try:
-    with open(thickness_data_location, "r") as th_file:
-        data = json.load(th_file)
-        th_mm = data.get("thickness_data", {})
-except FileNotFoundError:
-    print("File not found.")
-    th_mm = {}
+
+def _clear_output_on_cancel(*frames:str):
+    """
+    Decorator of the calculation methods: a cancelled calculation (CalculationCancelledError) leaves no partial rows in the output
+    DataFrames of data_output.py - the frames written by the method are replaced with empty ones before the error is passed on.
+    
+    :param frames: Names of the output DataFrames written by the decorated method (see clear_output_frames() in data_output.py)
+    
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except CalculationCancelledError:
+                data_output.clear_output_frames(*frames)
+                raise
+        return wrapper
+    return decorator
 
 
 #==========================| CALCULATIONS |====================================
@@ -45,6 +63,10 @@ class Branch:
         th_values (None): Pipe and insulation thickness data. Data can be read from a dedicated JSON file.
         damage_mode (str): Defines how insulation damage is modelled. See the __init__ definition for more information.
         damage (float): Amaunt of insulation damage. See the __initi__ definition for more information.
+        instrument (bool): Enables the instrumentation of the calculations. See the __init__ definition for more information.
+        max_iterations (int): Maximum number of iterations of the outlet temperature calculation. See the __init__ definition for more information.
+        progress (function): Progress callback. See the __init__ definition for more information.
+        cancel (CancellationToken): Token for stopping the calculations. See the __init__ definition for more information.
         
     Helper methods:
         _calculate_internal_diameter()
@@ -75,6 +97,15 @@ class Branch:
                                    Option 'element': Each element has residual thickness assigned in the input file.
         :param damage (optional): Value(s) of damaged insulation thickness. For the 'average' damage mode, the thickness value is defined in the BranchInitialConfig class in config_data.py. Alternatively, the value can be passed directly to the class.
                                 For the 'element' damage mode, thickness values are read from the input file as percentage of intact thickness for the section's nominal diameter.
+        :param instrument (optional): If True, wall time per phase, property evaluations, iterations of the temperature solver, peak memory and rows written are recorded
+                                      in self.report (RunReport object in utils/instrumentation.py, dumpable as JSON). Default: False.
+        :param max_iterations (optional): Maximum number of iterations of the outlet temperature calculation per section. Default: 100.
+                                          Per-section iterations, residuals and ambient clamps are stored in self.diagnostics['supply'] and self.diagnostics['return'] (SolverDiagnostics objects).
+        :param progress (optional): Function called with ProgressEvent objects (sections done, rate, ETA) while the lines are calculated, e.g. print_progress in utils/progress.py. Default: None.
+        :param cancel (optional): CancellationToken object (utils/progress.py). When it is set, the calculation stops with CalculationCancelledError (the output DataFrames are cleared). Default: None.
+        :param progress_chunk (optional): Number of sections between two progress reports and cancellation checks. Default: 100.
+        :param validate (optional): If True, the whole input frame is checked before any calculation (validate_input_frame() in utils/validation.py);
+                                    all problems are raised at once in an InputValidationError with the row numbers. Default: True.
         
         """
         
@@ -82,6 +113,8 @@ class Branch:
         self.th_all = th_values or th_mm                                       # pipe & insulation thickness from data in the JSON file
         
         self.tolerance = 0.001                                                 # for the while loop in the <calculate_output_temperature> function
+        self.max_iterations = kwargs.get("max_iterations", 100)                # guard of the while loop in the <calculate_output_temperature> function
+        self.diagnostics = {}                                                  # SolverDiagnostics of the supply and return lines (filled by the calculation methods)
         
         # Pipe thickness                                                       # data from the JSON file
         self.th_pipe = self.th_all["th_pipe"] 
@@ -111,6 +144,18 @@ class Branch:
         if self.class_instance_name is not None:
             self.__class__.class_instances_created += 1            
         
+        # From **kwargs: instrumentation (None ---> disabled)
+        self.report = RunReport() if kwargs.get("instrument", False) else None
+        
+        # From **kwargs: progress reporting & cancellation (checked every <progress_chunk> sections)
+        self.progress = kwargs.get("progress", None)
+        self.cancel = kwargs.get("cancel", None)
+        self.progress_chunk = max(int(kwargs.get("progress_chunk", 100)), 1)
+        
+        # From **kwargs: validation of the input data (all rows at once, before the calculations)
+        if kwargs.get("validate", True):
+            validate_input_frame(data_input.df_input_data, self.th_all, raise_on_error = True)
+        
    
     #______________________ Helper methods ____________________________________
       
@@ -155,6 +200,16 @@ class Branch:
         print(f"Damage (avg, per-element): {self.th_ins_damage_avg_m}, {self.th_ins_damage_elem_percent}")   
     
 
+    def _progress_reporter(self, total:int, task:str):
+        """
+        Returns a ProgressReporter object for a line or None if neither a progress callback nor a cancellation token is set.
+        
+        """
+        if self.progress is None and self.cancel is None:
+            return None
+        return ProgressReporter(total, task, self.progress, self.cancel)
+    
+    
     def calculate_branch_length(self) -> float:
         """
         Sums lengths of all pipeline elements to get the length of the analysed branch.
@@ -169,6 +224,8 @@ class Branch:
     
     #____________________ CALCULATIONS - SUPPLY _______________________________
     
+    @_clear_output_on_cancel("df_supply_out")
+    @instrumented("supply")
     def calculate_supply(self):
         """
         Performs calculations for the supply line.
@@ -195,9 +252,23 @@ class Branch:
                                                                                t = (t_in_s_i_c - TZERO),
                                                                                fluid = self.iv.fluid)           
         
+        iterations_s, residuals_s, clamped_s = [], [], []                      # diagnostics of the outlet temperature calculation
+        report = self.report                                                   # instrumentation (None ---> disabled)
+        if report is not None:
+            report.count_property("density")
+            report.count_property("specific_heat")
+        
+        # Progress & cancellation (None ---> disabled):
+        progress = self._progress_reporter(len(data_input.df_supply_in), "supply")
+        
         i = 0
         
         for i in range(len(data_input.df_supply_in)):           
+            if progress is not None and i % self.progress_chunk == 0:
+                progress.update(i)
+            if report is not None:
+                t_lap = perf_counter()
+            
             ### PART 1: DEFINING GEOMETRY & COEFFICIENTS & THERMAL RESISTANCE FOR EACH ELEMENT
             location_s_i = location_supply[i]
             
@@ -238,13 +309,27 @@ class Branch:
             r_total_s_i_w_per_k = calculate_r_total(d_pipe_int_s_i_m, l_s_i_m, ThermalCoeff.h_water_w_per_m2k, d_pipe_ext_s_i_m, ThermalCoeff.k_pipe_w_per_mk, d_insulation_ext_s_i_m, k_ins_s_i_w_per_mk, h_ins2ambient_s_i_w_per_m2k)
             
             
+            if report is not None:
+                t_lap = report.lap("supply.geometry", t_lap)
+            
             ### PART 2: HEAT FLOW LOSS CALCULATION FOR EACH ELEMENT
             t_ambient_s_i_c = select_ambient_temperature(location_s_i)
             
             cp_s_i_ws_per_kgk = calculate_fluid_specific_heat(self.iv.p_nominal_pa, (t_in_s_i_c - TZERO))
             
+            if report is not None:
+                t_lap = report.lap("supply.properties", t_lap)
+            
             # Calculates outlet node temperature and element heat flow loss (contains: while loop)
-            t_out_s_i_c, qdot_loss_s_i_w = calculate_output_temperature(t_in_s_i_c, t_ambient_s_i_c, mdot_s_i_kg_per_s, cp_s_i_ws_per_kgk, r_total_s_i_w_per_k, self.tolerance)
+            t_out_s_i_c, qdot_loss_s_i_w, n_iterations_s_i, residual_s_i, clamped_s_i = calculate_output_temperature(t_in_s_i_c, t_ambient_s_i_c, mdot_s_i_kg_per_s, cp_s_i_ws_per_kgk, r_total_s_i_w_per_k, 
+                                                                                                                  self.tolerance, self.max_iterations, return_diagnostics = True)
+            iterations_s.append(n_iterations_s_i)
+            residuals_s.append(residual_s_i)
+            clamped_s.append(clamped_s_i)
+            
+            if report is not None:
+                report.add_iterations("supply", n_iterations_s_i)
+                t_lap = report.lap("supply.temperature", t_lap)
             
             
             ### PART 3: OTHER CALCULATIONS 
@@ -267,6 +352,11 @@ class Branch:
             # (vi) Total heat flow in the system
             qdot_in_tot_s_i_w = qdot_in_tot_s_i_w - qdot_loss_s_i_w - qdot_cons_abs_s_i_w
             
+            if report is not None:
+                t_lap = report.lap("supply.properties", t_lap)
+                report.count_property("density")
+                report.count_property("specific_heat")
+            
             
             # ### PART 4: WRITING CALCULATED VALUES TO THE DATAFRAMES
             row_supply_i = PipeRow(
@@ -285,18 +375,29 @@ class Branch:
                 qdot_tot          = qdot_in_tot_s_i_w
             ) 
             data_output.df_supply_out = pd.concat([data_output.df_supply_out, pd.DataFrame([row_supply_i.convert_to_dict_pipe()])], ignore_index = True)   
+            
+            if report is not None:
+                report.lap("supply.dataframe", t_lap)
+                report.add_rows("df_supply_out")
            
            
             ### PART 5: SETTING VALUES FOR THE NEXT NODE (i --> i+1)
             t_in_s_i_c = t_out_s_i_c                                           # the inlet temperature of the next element is the same as the outlet temperature of the preceding element                                                      
             mdot_s_i_kg_per_s += mdot_takeoff_supply_kg_per_s[i]               # reducing the supply mass flow by the take-off amount (take-off is specified in a separate file)
         
+        if progress is not None:
+            progress.finish()
+        self.diagnostics["supply"] = SolverDiagnostics(np.array(iterations_s, dtype = np.int64), np.array(residuals_s, dtype = np.float64), 
+                                                       np.array(clamped_s, dtype = bool), self.tolerance, self.max_iterations)
+        
     #''''''''''''''''''''''' SUPPLY END '''''''''''''''''''''''''''''''''''''''
  
     
     #____________________ CALCULATIONS - RETURTN ______________________________
     
     
+    @_clear_output_on_cancel("df_return_out", "df_system_out")
+    @instrumented("return")
     def calculate_return(self):
         """
         Performs calculations for the return line.
@@ -325,11 +426,24 @@ class Branch:
                                                                                t = (t_in_r_i_c - TZERO),
                                                                                fluid = self.iv.fluid)           
         
+        iterations_r, residuals_r, clamped_r = [], [], []                      # diagnostics of the outlet temperature calculation
+        report = self.report                                                   # instrumentation (None ---> disabled)
+        if report is not None:
+            report.count_property("specific_heat")
+        
         i = 0                                                                  # for the for loop ---> loops through all elements of the return line
         
         j = len(data_input.df_supply_in) - 1                                   # for the if loop for the consumer in the for loop ---> to determine the return flow from the consumer
 
+        # Progress & cancellation (None ---> disabled):
+        progress = self._progress_reporter(len(data_input.df_return_in), "return")
+        
         for i in range(len(data_input.df_return_in)):           
+            if progress is not None and i % self.progress_chunk == 0:
+                progress.update(i)
+            if report is not None:
+                t_lap = perf_counter()
+            
             ### PART 1: DEFINING GEOMETRY & COEFFICIENTS & THERMAL RESISTANCE FOR EACH ELEMENT
             location_r_i = location_return[i]
             
@@ -370,13 +484,27 @@ class Branch:
             r_total_r_i_w_per_k = calculate_r_total(d_pipe_int_r_i_m, l_r_i_m, ThermalCoeff.h_water_w_per_m2k, d_pipe_ext_r_i_m, ThermalCoeff.k_pipe_w_per_mk, d_insulation_ext_r_i_m, k_ins_r_i_w_per_mk, h_ins2ambient_r_i_w_per_m2k)
             
             
+            if report is not None:
+                t_lap = report.lap("return.geometry", t_lap)
+            
             ### PART 2: HEAT FLOW LOSS CALCULATION FOR EACH ELEMENT
             t_ambient_r_i_c = select_ambient_temperature(location_r_i)
             
             cp_r_i_ws_per_kgk = calculate_fluid_specific_heat(self.iv.p_nominal_pa, (t_in_r_i_c - TZERO))
             
+            if report is not None:
+                t_lap = report.lap("return.properties", t_lap)
+            
             # Calculates outlet node temperature and element heat flow loss (contains: while loop)
-            t_out_r_i_c, qdot_loss_r_i_w = calculate_output_temperature(t_in_r_i_c, t_ambient_r_i_c, mdot_r_i_kg_per_s, cp_r_i_ws_per_kgk, r_total_r_i_w_per_k, self.tolerance)         
+            t_out_r_i_c, qdot_loss_r_i_w, n_iterations_r_i, residual_r_i, clamped_r_i = calculate_output_temperature(t_in_r_i_c, t_ambient_r_i_c, mdot_r_i_kg_per_s, cp_r_i_ws_per_kgk, r_total_r_i_w_per_k, 
+                                                                                                                  self.tolerance, self.max_iterations, return_diagnostics = True)
+            iterations_r.append(n_iterations_r_i)
+            residuals_r.append(residual_r_i)
+            clamped_r.append(clamped_r_i)
+            
+            if report is not None:
+                report.add_iterations("return", n_iterations_r_i)
+                t_lap = report.lap("return.temperature", t_lap)
             
             # Connecting the correct sections of the supply and return lines, because they may not have the same number of elements (non-symmetrical pipelines)
             if data_input.df_return_in["mdot take-off [kg/s]"][i] != 0:
@@ -391,6 +519,9 @@ class Branch:
             # Temperature of the mixture on the return line: fluid from the consumer mixes with the fluid in the return line ---> residual heat flows from the consumer into the return line
             t_mix_r_i_c = ((t_out_r_i_c * mdot_r_i_kg_per_s) + (self.iv.t_consumer_release_c * mdot_consumer_r_i_kg_per_s)) / (mdot_r_i_kg_per_s + mdot_consumer_r_i_kg_per_s)                 
             
+            if report is not None:
+                t_lap = report.lap("return.consumers", t_lap)
+            
 
             ### PART 3: OTHER CALCULATIONS 
             # (i) Position on the pipeline
@@ -412,6 +543,11 @@ class Branch:
             # (vi) Total heat flow in the system
             qdot_in_tot_r_i_w = qdot_in_tot_r_i_w - qdot_loss_r_i_w + qdot_cons_abs_r_i_w
             
+            if report is not None:
+                t_lap = report.lap("return.properties", t_lap)
+                report.count_property("density")
+                report.count_property("specific_heat")
+            
             
             # ### PART 4: WRITING CALCULATED VALUES TO THE DATAFRAMES
             row_return_i = PipeRow(
@@ -431,16 +567,26 @@ class Branch:
             ) 
             data_output.df_return_out = pd.concat([data_output.df_return_out, pd.DataFrame([row_return_i.convert_to_dict_pipe()])], ignore_index = True)   
             
+            if report is not None:
+                report.lap("return.dataframe", t_lap)
+                report.add_rows("df_return_out")
+            
            
             ### PART 5: SETTING VALUES FOR THE NEXT NODE (i --> i+1)
             t_in_r_i_c = t_mix_r_i_c                                           # the inlet temperature of the next element is the same as the outlet temperature of the preceding element                                                      
             mdot_r_i_kg_per_s += mdot_consumer_r_i_kg_per_s                    # reducing the supply mass flow by the take-off amount (take-off is specified in a separate file)
+        
+        if progress is not None:
+            progress.finish()
+        self.diagnostics["return"] = SolverDiagnostics(np.array(iterations_r, dtype = np.int64), np.array(residuals_r, dtype = np.float64), 
+                                                       np.array(clamped_r, dtype = bool), self.tolerance, self.max_iterations)
             
     #''''''''''''''''''''''' RETURN END '''''''''''''''''''''''''''''''''''''''
 
     
     #____________________ CALCULATIONS - SYSTEM _______________________________
  
+    @instrumented("system")
     def calculate_system_heat_flow(self) -> None:
         """
         Gathers total heat flow data from the supply and return calculations to calculate the total system heat flow:
@@ -481,6 +627,9 @@ class Branch:
                 qdot_system = qdot_system_i_w  
             )
             data_output.df_system_out = pd.concat([data_output.df_system_out, pd.DataFrame([row_system_i.convert_to_dict_system()])], ignore_index = True)   
+            
+            if self.report is not None:
+                self.report.add_rows("df_system_out")
 
     #''''''''''''''''''''''' SYSTEM END '''''''''''''''''''''''''''''''''''''''
 
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+
+from utils.constants import SOLVER_VERSION
+
+
+#==============================================================================
+FORMAT_VERSION = 1                                                             # increased when the layout of the files changes
+_MANIFEST = "manifest.json"
+_SEPARATOR = "::"                                                              # chunk id / array name in the NPZ files
+
+
+#==========================| CHECKPOINT |======================================
+class Checkpoint:
+    """
+    Periodic checkpoints of long runs (Monte Carlo, sweeps, yearly simulations) in a folder.
+
+    A run is split into chunks with ids (e.g. rows of a design, years). Results of finished chunks are kept in memory and written
+    together every interval_s seconds (one NPZ part file per write), so the time spent on writing can be set with the interval.
+    Runs that carry a state from chunk to chunk (random generator, damaged sections, ...) save the latest state with save_state().
+    The manifest (list of chunks, part files and the state file) is replaced atomically after the files it refers to are on disk,
+    so a run stopped at any moment resumes from the last manifest. Runs resumed with the same key give bit-identical results.
+
+    Attributes:
+        directory (str): Folder with the checkpoint files.
+        interval_s (float): Minimum time between two writes in [s] (0 ---> write after every chunk).
+        write_time_s (float): Total time spent on writing checkpoints in [s].
+
+    """
+
+    def __init__(self, directory:str, key = None, interval_s:float = 60.0, resume:bool = True):
+        """
+        :param directory: Folder with the checkpoint files (created if missing).
+        :param key: JSON-serialisable value identifying the run (e.g. input file and settings). Runs with another key are not resumed.
+        :param interval_s: Minimum time between two writes in [s].
+        :param resume: If False, existing checkpoints in the folder are removed and the run starts from the beginning.
+
+        """
+        self.directory = directory
+        self.interval_s = interval_s
+        self.write_time_s = 0.0
+        self.user_key = key
+        os.makedirs(directory, exist_ok = True)
+
+        self._manifest = {"format_version": FORMAT_VERSION, "solver_version": SOLVER_VERSION, "key": None, "chunks": {}, "state": None, "parts": 0}
+        self._pending = {}
+        self._pending_state = None
+        self._last_write = time.perf_counter()
+        self._parts = {}                                                       # opened part files
+
+        manifest_path = os.path.join(directory, _MANIFEST)
+        if os.path.exists(manifest_path):
+            if resume:
+                with open(manifest_path, "r") as manifest_file:
+                    manifest = json.load(manifest_file)
+                if manifest.get("format_version") != FORMAT_VERSION:
+                    raise ValueError(f"Checkpoint in {directory} has format version {manifest.get('format_version')}, "
+                                     f"this version of dhnpype reads version {FORMAT_VERSION}. Use resume = False.")
+                if manifest.get("solver_version") != SOLVER_VERSION:           # results of another solver would be mixed with new ones
+                    raise ValueError(f"Checkpoint in {directory} was written by solver version {manifest.get('solver_version')}, "
+                                     f"the current solver version is {SOLVER_VERSION}. Use resume = False.")
+                self._manifest = manifest
+            else:
+                self.clear()
+
+    def __enter__(self) -> "Checkpoint":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.flush()                                                           # also when the run fails ---> finished chunks are kept
+
+
+    #______________________ Helper methods ____________________________________
+
+    def _path(self, file_name:str) -> str:
+        return os.path.join(self.directory, file_name)
+
+    def _write_npz(self, file_name:str, arrays:dict) -> None:
+        """
+        Writes an NPZ file atomically and makes sure it is on disk before the manifest refers to it.
+
+        """
+        temporary_path = self._path(file_name + ".tmp")
+        with open(temporary_path, "wb") as npz_file:
+            np.savez(npz_file, **arrays)
+            npz_file.flush()
+            os.fsync(npz_file.fileno())
+        os.replace(temporary_path, self._path(file_name))
+
+    def _part(self, file_name:str):
+        if file_name not in self._parts:
+            self._parts[file_name] = np.load(self._path(file_name), allow_pickle = False)
+        return self._parts[file_name]
+
+
+    #______________________ Run identity ______________________________________
+
+    def bind(self, run_key:dict) -> None:
+        """
+        Connects the checkpoint to a run. Called by the functions that support checkpoints with their own settings; the hash of these
+        settings and the key of the constructor must match the hash in the manifest, otherwise ValueError is raised.
+
+        :param run_key: JSON-serialisable settings of the run.
+
+        """
+        digest = hashlib.sha256(json.dumps({"run": run_key, "key": self.user_key}, sort_keys = True, default = str).encode()).hexdigest()
+        if self._manifest["key"] is None:
+            self._manifest["key"] = digest
+        elif self._manifest["key"] != digest:
+            raise ValueError(f"Checkpoint in {self.directory} belongs to another run (different settings or key). "
+                             f"Use another folder or resume = False.")
+
+    @staticmethod
+    def fingerprint(*arrays) -> str:
+        """
+        SHA-256 hash of the contents of arrays (e.g. section arrays of a network) for the run key.
+
+        """
+        sha = hashlib.sha256()
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            sha.update(str((array.dtype, array.shape)).encode())
+            sha.update(array.tobytes())
+        return sha.hexdigest()
+
+
+    #______________________ Chunks & state ____________________________________
+
+    @property
+    def completed(self) -> set:
+        """
+        Ids of the finished chunks (written and pending).
+
+        """
+        return set(self._manifest["chunks"]) | set(self._pending)
+
+    def __contains__(self, chunk_id) -> bool:
+        return str(chunk_id) in self._manifest["chunks"] or str(chunk_id) in self._pending
+
+    def save(self, chunk_id, **arrays) -> None:
+        """
+        Adds the results of a finished chunk. Written to disk with the next flush (at the latest interval_s after the last write).
+
+        :param chunk_id: Id of the chunk (converted to str).
+        :param arrays: Arrays with the results of the chunk.
+
+        """
+        # Copies ---> the run may reuse its arrays:
+        self._pending[str(chunk_id)] = {name: np.array(value) for name, value in arrays.items()}
+        if time.perf_counter() - self._last_write >= self.interval_s:
+            self.flush()
+
+    def save_state(self, **arrays) -> None:
+        """
+        Sets the state of the run after the chunks saved so far (replaces the previous state). Call before save() of the same chunk.
+
+        """
+        self._pending_state = {name: np.array(value) for name, value in arrays.items()}
+
+    def load(self, chunk_id) -> dict:
+        """
+        Reads the results of a finished chunk.
+
+        :param chunk_id: Id of the chunk.
+        :return arrays: Dictionary name ---> array.
+
+        """
+        chunk_id = str(chunk_id)
+        if chunk_id in self._pending:
+            return dict(self._pending[chunk_id])
+        if chunk_id not in self._manifest["chunks"]:
+            raise KeyError(f"Chunk {chunk_id} is not in the checkpoint.")
+        part = self._part(self._manifest["chunks"][chunk_id])
+        prefix = chunk_id + _SEPARATOR
+        return {name[len(prefix):]: part[name] for name in part.files if name.startswith(prefix)}
+
+    def load_state(self):
+        """
+        Reads the latest state of the run (see save_state()).
+
+        :return state: Dictionary name ---> array or None if no state was saved.
+
+        """
+        if self._pending_state is not None:
+            return dict(self._pending_state)
+        if self._manifest["state"] is None:
+            return None
+        with np.load(self._path(self._manifest["state"]), allow_pickle = False) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    def flush(self) -> None:
+        """
+        Writes pending chunks and the state to disk and replaces the manifest.
+
+        """
+        if not self._pending and self._pending_state is None:
+            return
+        start = time.perf_counter()
+        manifest = dict(self._manifest, chunks = dict(self._manifest["chunks"]))
+        number = manifest["parts"]
+        if self._pending:
+            part_name = f"part_{number:06d}.npz"
+            self._write_npz(part_name, {f"{chunk_id}{_SEPARATOR}{name}": value for chunk_id, arrays in self._pending.items() for name, value in arrays.items()})
+            manifest["chunks"].update({chunk_id: part_name for chunk_id in self._pending})
+        state_old = manifest["state"]
+        if self._pending_state is not None:
+            manifest["state"] = f"state_{number:06d}.npz"
+            self._write_npz(manifest["state"], self._pending_state)
+        manifest["parts"] = number + 1
+
+        temporary_path = self._path(_MANIFEST + ".tmp")
+        with open(temporary_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent = 1)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(temporary_path, self._path(_MANIFEST))                      # atomic ---> the run resumes from the old or the new manifest
+
+        if state_old is not None and state_old != manifest["state"]:
+            os.remove(self._path(state_old))
+        self._manifest = manifest
+        self._pending, self._pending_state = {}, None
+        self._last_write = time.perf_counter()
+        self.write_time_s += self._last_write - start
+
+    def clear(self) -> None:
+        """
+        Removes all checkpoint files of the folder.
+
+        """
+        for part in self._parts.values():
+            part.close()
+        self._parts = {}
+        for file_name in os.listdir(self.directory):
+            if file_name == _MANIFEST or file_name.startswith(("part_", "state_")) and file_name.endswith((".npz", ".tmp")):
+                os.remove(self._path(file_name))
+        self._manifest = {"format_version": FORMAT_VERSION, "solver_version": SOLVER_VERSION, "key": None, "chunks": {}, "state": None, "parts": 0}
+        self._pending, self._pending_state = {}, None
@@ -0,0 +1,165 @@
+import os
+import numpy as np
+
+from config_data import BranchInitialConfig, AmbientTemp
+from data_output import pipe_arrays_to_frame
+from kernels import build_property_table, solve_line, line_state_after, COL_MDOT
+from section_arrays import build_section_arrays
+from utils.constants import TZERO
+from utils.functions import calculate_fluid_density, calculate_fluid_specific_heat
+from utils.progress import ProgressReporter
+from utils.readers import read_input_chunks, read_thickness_data
+
+
+#==============================================================================
+thickness_data_location = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "insulation_thickness.json")
+
+OUTPUT_FORMATS = ("csv", "parquet")
+
+
+#==========================| OUTPUT WRITER |===================================
+class _ChunkWriter:
+    """
+    Appends output chunks to a single CSV (';' separator) or Parquet file.
+
+    """
+
+    def __init__(self, path:str, output_format:str):
+        self.path = path
+        self.output_format = output_format
+        self.rows_written = 0
+        self._parquet_writer = None
+
+    def write(self, df_chunk) -> None:
+        if self.output_format == "csv":
+            df_chunk.to_csv(self.path, sep=';', index = False, mode = "w" if self.rows_written == 0 else "a", header = self.rows_written == 0)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df_chunk, preserve_index = False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        self.rows_written += len(df_chunk)
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+#==========================| CHUNKED SOLVER |==================================
+def solve_chunked(data_file:str, output_dir:str, chunksize:int = 100_000, th_values:dict = None, initial_values = None,
+                  damage_mode:str = "average", damage:float = None, tolerance:float = 0.001, backend:str = "auto",
+                  output_format:str = "csv", progress = None, cancel = None) -> dict:
+    """
+    Solves the supply and return lines of a branch by streaming the input file in chunks and writing output chunks as soon as they are solved.
+    Only the state of the line recurrence (temperature, mass flow, position, cumulative loss, total heat flow) is carried from one chunk to the next,
+    so peak memory depends on the chunk size and not on the size of the network.
+
+    The file is read twice: the supply line is solved in the first pass, the return line in the second.
+    The non-zero supply take-offs are kept between the passes to connect the consumers on the return line (memory grows with the number of consumers only).
+    System heat flow (Branch.calculate_system_heat_flow()) is not calculated.
+
+    :param data_file: Path to the input file (any format of read_input_file() in utils/readers.py).
+    :param output_dir: Folder for the output files 'supply_out.<format>' and 'return_out.<format>'.
+    :param chunksize: Number of input rows read at once.
+    :param th_values: Pipe and insulation thickness data. Default: 'insulation_thickness.json' in the 'data' folder.
+    :param initial_values: BranchInitialConfig object. Default: BranchInitialConfig().
+    :param damage_mode: 'average' or 'element'. See the Branch class.
+    :param damage: Average thickness of the damaged insulation in [m]. Default: value from BranchInitialConfig.
+    :param tolerance: Convergence tolerance of the outlet temperature iteration.
+    :param backend: Kernel backend: 'auto', 'python' or 'numba'.
+    :param output_format: 'csv' or 'parquet' (requires pyarrow).
+    :param progress: Function called with ProgressEvent objects (sections done per line, rate), e.g. print_progress in utils/progress.py.
+    :param cancel: CancellationToken object (utils/progress.py), checked before each chunk ---> CalculationCancelledError (written chunks are kept).
+    :return summary: Dictionary with output paths, number of rows written and final values of both lines.
+
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Output format must be one of: {OUTPUT_FORMATS}.")
+
+    iv = initial_values or BranchInitialConfig()
+    th_all = th_values or read_thickness_data(thickness_data_location)
+    th_ins_damage_avg_m = damage if damage is not None else iv.th_avg_ins_damage_m
+
+    t_min_c = min(AmbientTemp.t_surface_c, AmbientTemp.t_channel_c, AmbientTemp.t_soil_c) - 1
+    t_max_c = max(iv.t_in_supply_c, iv.t_in_return_c, iv.t_consumer_release_c) + 1
+    property_table = build_property_table(iv.p_nominal_pa, iv.fluid, t_min_c, t_max_c)
+
+    os.makedirs(output_dir, exist_ok = True)
+    summary = {}
+
+    # (i) SUPPLY - first pass:
+    den_in_kg_per_m3 = calculate_fluid_density(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid)
+    mdot_in_kg_per_s = iv.vdot_m3_per_h * den_in_kg_per_m3 / 3600
+    state = {
+        "t_in_c": iv.t_in_supply_c,
+        "mdot_kg_per_s": mdot_in_kg_per_s,
+        "l_tot_m": 0.0,
+        "qdot_tot_w": mdot_in_kg_per_s * (iv.t_in_supply_c - TZERO) * calculate_fluid_specific_heat(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid),
+        "qdot_loss_tot_w": 0.0
+    }
+    takeoffs_supply = []                                                       # non-zero take-offs (for the consumers on the return line)
+    mdot_end_supply_kg_per_s = mdot_in_kg_per_s
+
+    writer = _ChunkWriter(os.path.join(output_dir, f"supply_out.{output_format}"), output_format)
+    reporter = ProgressReporter(None, "supply", progress, cancel)              # number of sections unknown until the file is read
+    try:
+        for df_chunk in read_input_chunks(data_file, chunksize):
+            df_supply_chunk = df_chunk[df_chunk["Direction"] == "Supply"].reset_index(drop=True)
+            if df_supply_chunk.empty:
+                continue
+            reporter.update(writer.rows_written)
+            arrays = build_section_arrays(df_supply_chunk, "supply", th_all, damage_mode, th_ins_damage_avg_m)
+            out = solve_line(arrays, property_table = property_table, t_consumer_release_c = iv.t_consumer_release_c,
+                             tolerance = tolerance, backend = backend, **state)
+            writer.write(pipe_arrays_to_frame(out))
+
+            takeoffs_supply.append(arrays.mdot_takeoff_kg_per_s[arrays.mdot_takeoff_kg_per_s != 0])
+            mdot_end_supply_kg_per_s = out[-1, COL_MDOT]                       # mass flow of the last node (start of the return line)
+            state = line_state_after(out, False, iv.t_consumer_release_c)
+    finally:
+        writer.close()
+    reporter.update(writer.rows_written)
+    reporter.finish()
+    summary["supply"] = dict(state, path = writer.path, rows_written = writer.rows_written)
+
+    # (ii) RETURN - second pass:
+    mdot_consumer_pool_kg_per_s = - np.concatenate(takeoffs_supply)[::-1] if takeoffs_supply else np.zeros(0)   # consumers from the end of the supply line
+    n_consumers_used = 0
+    state = {
+        "t_in_c": iv.t_in_return_c,
+        "mdot_kg_per_s": mdot_end_supply_kg_per_s,
+        "l_tot_m": summary["supply"]["l_tot_m"],                               # branch length
+        "qdot_tot_w": mdot_end_supply_kg_per_s * (iv.t_in_return_c - TZERO) * calculate_fluid_specific_heat(iv.p_nominal_pa, iv.t_in_return_c - TZERO, iv.fluid),
+        "qdot_loss_tot_w": 0.0
+    }
+
+    writer = _ChunkWriter(os.path.join(output_dir, f"return_out.{output_format}"), output_format)
+    reporter = ProgressReporter(None, "return", progress, cancel)
+    try:
+        for df_chunk in read_input_chunks(data_file, chunksize):
+            df_return_chunk = df_chunk[df_chunk["Direction"] == "Return"].reset_index(drop=True)
+            if df_return_chunk.empty:
+                continue
+            reporter.update(writer.rows_written)
+            arrays = build_section_arrays(df_return_chunk, "return", th_all, damage_mode, th_ins_damage_avg_m)
+
+            consumer_nodes = np.flatnonzero(arrays.mdot_takeoff_kg_per_s != 0)
+            if n_consumers_used + len(consumer_nodes) > len(mdot_consumer_pool_kg_per_s):
+                raise ValueError(f"The return line has more consumers than the supply line ({len(mdot_consumer_pool_kg_per_s)}).")
+            mdot_step_kg_per_s = np.zeros(len(arrays))
+            mdot_step_kg_per_s[consumer_nodes] = mdot_consumer_pool_kg_per_s[n_consumers_used:n_consumers_used + len(consumer_nodes)]
+            n_consumers_used += len(consumer_nodes)
+
+            out = solve_line(arrays, property_table = property_table, t_consumer_release_c = iv.t_consumer_release_c,
+                             mdot_step_kg_per_s = mdot_step_kg_per_s, tolerance = tolerance, backend = backend, **state)
+            writer.write(pipe_arrays_to_frame(out))
+            state = line_state_after(out, True, iv.t_consumer_release_c)
+    finally:
+        writer.close()
+    reporter.update(writer.rows_written)
+    reporter.finish()
+    summary["return"] = dict(state, path = writer.path, rows_written = writer.rows_written)
+
+    return summary
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from dataclasses import dataclass, fields, asdict, is_dataclass
+
+from config_data import BranchInitialConfig, AmbientTemp
+from kernels import PropertyTable, build_property_table, solve_branch
+from model_param import ThermalCoeff
+from section_arrays import SectionArrays, build_section_arrays, pair_return_consumers
+from utils.readers import read_input_file, split_input_data, read_thickness_data, _memmap_npz
+from utils.validation import validate_input_frame
+
+
+#==============================================================================
+thickness_data_location = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "insulation_thickness.json")
+
+FORMAT_VERSION = 1                                                             # increased when the layout of the file changes
+_ARRAY_FIELDS = tuple(field.name for field in fields(SectionArrays) if field.name != "direction")
+
+
+#==========================| COMPILED NETWORK |================================
+@dataclass(frozen = True)
+class CompiledNetwork:
+    """
+    Immutable branch model with everything the solvers need: section arrays of both lines, pairing of the return consumers with
+    the supply take-offs and a fluid property table. Created by compile(), saved with save() and loaded with load() (memory-mapped).
+    All arrays are read-only; use dataclasses.replace() (e.g. with update_insulation() in section_arrays.py) for variants.
+
+    :param arrays_supply: SectionArrays object of the supply line.
+    :param arrays_return: SectionArrays object of the return line.
+    :param mdot_consumer_return_kg_per_s: Consumer flows into the return nodes in [kg/s] (see pair_return_consumers()).
+    :param property_table: PropertyTable object for the pressure and fluid of the compiled initial values.
+    :param metadata: Dictionary with the format version, source file, initial values, coefficients and damage settings used.
+
+    """
+    arrays_supply: SectionArrays
+    arrays_return: SectionArrays
+    mdot_consumer_return_kg_per_s: np.ndarray
+    property_table: PropertyTable
+    metadata: dict
+
+    @property
+    def initial_values(self) -> BranchInitialConfig:
+        return BranchInitialConfig(**self.metadata["initial_values"])
+
+    def solve(self, initial_values = None, tolerance:float = 0.001, backend:str = "auto", max_iterations:int = 100, return_diagnostics:bool = False) -> tuple:
+        """
+        Solves the branch with the array kernel (see solve_branch() in kernels.py).
+
+        :param initial_values: BranchInitialConfig object. Default: initial values of compile().
+        :param tolerance, backend, max_iterations, return_diagnostics: See solve_branch().
+        :return out_supply, out_return (and diagnostics): See solve_branch().
+
+        """
+        iv = initial_values or self.initial_values
+        table = self.property_table
+        t_max_c = max(iv.t_in_supply_c, iv.t_in_return_c, iv.t_consumer_release_c)
+        if (iv.p_nominal_pa, iv.fluid) != (self.metadata["initial_values"]["p_nominal_pa"], self.metadata["initial_values"]["fluid"]) \
+                or t_max_c > table.t_grid_c()[-1]:
+            table = None                                                       # built by solve_branch()
+        return solve_branch(self.arrays_supply, self.arrays_return, iv, table, tolerance, backend, max_iterations, return_diagnostics,
+                            self.mdot_consumer_return_kg_per_s)
+
+    def save(self, path:str) -> str:
+        """
+        Writes the model to a single uncompressed NPZ file (arrays can be memory-mapped by load()). The file is replaced atomically.
+
+        :param path: Path to the file.
+        :return path: Path to the file.
+
+        """
+        arrays = {"metadata": np.array(json.dumps(self.metadata))}
+        for prefix, line_arrays in (("supply", self.arrays_supply), ("return", self.arrays_return)):
+            for name in _ARRAY_FIELDS:
+                arrays[f"{prefix}.{name}"] = np.ascontiguousarray(getattr(line_arrays, name))
+        arrays["mdot_consumer_return_kg_per_s"] = self.mdot_consumer_return_kg_per_s
+        arrays["property_table.cp_ws_per_kgk"] = self.property_table.cp_ws_per_kgk
+        arrays["property_table.den_kg_per_m3"] = self.property_table.den_kg_per_m3
+
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as model_file:                         # file object ---> np.savez does not append '.npz'
+            np.savez(model_file, **arrays)
+        os.replace(temporary_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path:str) -> "CompiledNetwork":
+        """
+        Loads a model written by save(). Arrays are memory-mapped (read-only), so loading does not depend on the number of sections.
+
+        :param path: Path to the file.
+        :return network: CompiledNetwork object.
+
+        """
+        arrays = _memmap_npz(path)
+        if "metadata" not in arrays:
+            raise ValueError(f"{path} is not a compiled network file.")
+        metadata = json.loads(str(arrays["metadata"]))
+        if metadata.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {metadata.get('format_version')}, this version of dhnpype reads version {FORMAT_VERSION}. "
+                             f"Compile the network again.")
+        lines = {prefix: SectionArrays(direction = prefix, **{name: arrays[f"{prefix}.{name}"] for name in _ARRAY_FIELDS}) for prefix in ("supply", "return")}
+        table = metadata["property_table"]
+        return cls(arrays_supply = lines["supply"], arrays_return = lines["return"],
+                   mdot_consumer_return_kg_per_s = arrays["mdot_consumer_return_kg_per_s"],
+                   property_table = PropertyTable(t_min_c = table["t_min_c"], dt_c = table["dt_c"],
+                                                  cp_ws_per_kgk = arrays["property_table.cp_ws_per_kgk"],
+                                                  den_kg_per_m3 = arrays["property_table.den_kg_per_m3"]),
+                   metadata = metadata)
+
+
+#==========================| COMPILING |=======================================
+def _read_only(line_arrays:SectionArrays) -> SectionArrays:
+    for name in _ARRAY_FIELDS:
+        getattr(line_arrays, name).flags.writeable = False
+    return line_arrays
+
+
+def _file_sha256(path:str) -> str:
+    with open(path, "rb") as source_file:
+        return hashlib.sha256(source_file.read()).hexdigest()
+
+
+def _as_dict(values) -> dict:
+    """
+    Values of a configuration dataclass (class with defaults or object) as a dictionary.
+
+    """
+    if is_dataclass(values) and not isinstance(values, type):
+        return asdict(values)
+    return {field.name: getattr(values, field.name) for field in fields(values)}
+
+
+def compile(data, th_values:dict = None, initial_values = None, damage_mode:str = "average", damage:float = None,
+            thermal_coeff = ThermalCoeff, ambient_temp = AmbientTemp, t_max_c:float = 150.0, validate:bool = True) -> CompiledNetwork:
+    """
+    Compiles input data into an immutable CompiledNetwork: reads the input file, looks up DN in the thickness data,
+    calculates diameters and thermal resistances, pairs the return consumers and tabulates fluid properties.
+
+    :param data: Path to the input file or DataFrame with supply and return data (see data_input.py).
+    :param th_values: Pipe and insulation thickness data. Default: 'insulation_thickness.json' in the 'data' folder.
+    :param initial_values: BranchInitialConfig object. Default: BranchInitialConfig().
+    :param damage_mode: 'average' or 'element'. See the Branch class.
+    :param damage: Average thickness of the damaged insulation in [m]. Default: value from BranchInitialConfig.
+    :param thermal_coeff: ThermalCoeff class or object. Default: ThermalCoeff.
+    :param ambient_temp: AmbientTemp class or object. Default: AmbientTemp.
+    :param t_max_c: Highest temperature of the property table in [°C] (at least the highest inlet temperature + 20 K).
+    :param validate: If True, the input data is checked with validate_input_frame() first (InputValidationError with all problems).
+    :return network: CompiledNetwork object.
+
+    """
+    iv = initial_values or BranchInitialConfig()
+    th_all = th_values or read_thickness_data(thickness_data_location)
+    th_ins_damage_avg_m = damage if damage is not None else iv.th_avg_ins_damage_m
+    source = os.path.abspath(data) if isinstance(data, str) else None
+    df_input_data = read_input_file(data) if isinstance(data, str) else data
+    if validate:
+        validate_input_frame(df_input_data, th_all, raise_on_error = True)
+
+    df_supply_in, df_return_in = split_input_data(df_input_data)
+    arrays_supply = build_section_arrays(df_supply_in, "supply", th_all, damage_mode, th_ins_damage_avg_m, thermal_coeff, ambient_temp)
+    arrays_return = build_section_arrays(df_return_in, "return", th_all, damage_mode, th_ins_damage_avg_m, thermal_coeff, ambient_temp)
+    mdot_consumer_return_kg_per_s = pair_return_consumers(arrays_supply.mdot_takeoff_kg_per_s, arrays_return.mdot_takeoff_kg_per_s)
+    mdot_consumer_return_kg_per_s.flags.writeable = False
+
+    t_min_c = min(arrays_supply.t_amb_c.min(), arrays_return.t_amb_c.min()) - 1
+    table = build_property_table(iv.p_nominal_pa, iv.fluid, t_min_c, max(t_max_c, iv.t_in_supply_c + 20, iv.t_in_return_c + 20, iv.t_consumer_release_c + 20))
+    table.cp_ws_per_kgk.flags.writeable = False
+    table.den_kg_per_m3.flags.writeable = False
+
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": source,
+        "source_sha256": _file_sha256(source) if source else None,
+        "sections": {"supply": len(arrays_supply), "return": len(arrays_return)},
+        "initial_values": _as_dict(iv),
+        "thermal_coeff": _as_dict(thermal_coeff),
+        "ambient_temp": _as_dict(ambient_temp),
+        "damage_mode": damage_mode,
+        "th_ins_damage_avg_m": th_ins_damage_avg_m,
+        "property_table": {"t_min_c": float(table.t_min_c), "dt_c": float(table.dt_c)}
+    }
+    return CompiledNetwork(arrays_supply = _read_only(arrays_supply), arrays_return = _read_only(arrays_return),
+                           mdot_consumer_return_kg_per_s = mdot_consumer_return_kg_per_s, property_table = table, metadata = metadata)
+
+
+def load(path:str) -> CompiledNetwork:
+    """
+    Loads a compiled network file (see CompiledNetwork.load()).
+
+    """
+    return CompiledNetwork.load(path)
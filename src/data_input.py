@@ -1,24 +1,32 @@
-import tkinter as tk                                                           # GUI
-from tkinter import filedialog                                                 # simpledialog
-import pandas as pd
+import os
 
+from utils.readers import read_input_file, split_input_data, compact_input_frame
 
-# GUI for file search:
-window = tk.Tk()
-window.wm_attributes('-topmost', 1)
-window.withdraw()                                                              # this supresses the tk window
-file_type = (('CSV files', '*.csv'),)
-data_file = filedialog.askopenfilename(parent=window, initialdir="", title="SELECT A FILE", filetypes = file_type)
-window.destroy()          
+
+# Input file: set with the DHNPYPE_INPUT_FILE environment variable (runs without GUI, e.g. benchmarks) or selected in a file dialog
+data_file = os.environ.get("DHNPYPE_INPUT_FILE", "")
+
+if not data_file:
+    import tkinter as tk                                                       # GUI
+    from tkinter import filedialog                                             # simpledialog
+
+    # GUI for file search:
+    window = tk.Tk()
+    window.wm_attributes('-topmost', 1)
+    window.withdraw()                                                          # this supresses the tk window
+    file_type = (('Input files', '*.csv *.parquet *.feather *.arrow *.npz'), ('CSV files', '*.csv'), )
+    data_file = filedialog.askopenfilename(parent=window, initialdir="", title="SELECT A FILE", filetypes = file_type)
+    window.destroy()          
 
 
 # Reading data from an input file:
-df_input_data = pd.read_csv(data_file, sep=';')
+df_input_data = read_input_file(data_file)
+if os.environ.get("DHNPYPE_COMPACT", "") == "1":                               # compact mode: 'Direction' & 'Location' as categoricals, int16 DN
+    df_input_data = compact_input_frame(df_input_data, float32 = False)        # Branch calculates with the values of the rows ---> numeric columns stay float64
 
 
 # Split supply and return DataFrames
-df_supply_in = df_input_data[df_input_data['Direction'] == 'Supply'].reset_index(drop=True)
-df_return_in = df_input_data[df_input_data['Direction'] == 'Return'].reset_index(drop=True)
+df_supply_in, df_return_in = split_input_data(df_input_data)
 
 #length_df_supply_in = len(df_supply_in)
 #length_df_return_in = len(df_return_in)
@@ -1,4 +1,5 @@
 ### OPTION 2: USE DATACLASS TO ENSURE TYPE CHECKING
+import numpy as np
 import pandas as pd
 from dataclasses import dataclass
 
@@ -71,6 +72,14 @@ df_supply_out = pd.DataFrame({col: pd.Series(dtype=dt) for col, dt in pipe_colum
 df_return_out = pd.DataFrame({col: pd.Series(dtype=dt) for col, dt in pipe_columns_names_types.items()})
 
 
+def pipe_arrays_to_frame(out) -> pd.DataFrame:
+    """
+    Converts an output array of the array-based solvers (n sections x 13 columns) to a DataFrame with the columns of pipe_columns_names_types.
+    
+    """
+    return pd.DataFrame(out, columns = list(pipe_columns_names_types.keys())).astype(pipe_columns_names_types)
+
+
 @dataclass 
 class SystemRow:
     """
@@ -98,3 +107,65 @@ system_columns_names_types = {
     }
 
 df_system_out = pd.DataFrame({col: pd.Series(dtype=dt) for col, dt in system_columns_names_types.items()})
+
+
+def clear_output_frames(*frames:str) -> None:
+    """
+    Replaces the output DataFrames with empty ones (e.g. before the calculations are repeated - the Branch methods append rows to them).
+    
+    :param frames: Names of the DataFrames to be replaced ('df_supply_out', 'df_return_out', 'df_system_out'). Default: all of them.
+    
+    """
+    empty_frames = {"df_supply_out": pipe_columns_names_types, "df_return_out": pipe_columns_names_types, "df_system_out": system_columns_names_types}
+    unknown = set(frames) - set(empty_frames)
+    if unknown:
+        raise KeyError(f"Unknown output DataFrame(s) {sorted(unknown)}. Available options: {list(empty_frames)}.")
+    for frame in frames or empty_frames:
+        globals()[frame] = pd.DataFrame({col: pd.Series(dtype=dt) for col, dt in empty_frames[frame].items()})
+
+
+@dataclass
+class SolverDiagnostics:
+    """
+    Per-section diagnostics of the outlet temperature iteration (calculate_output_temperature() in functions.py or the array kernels) for one line.
+    
+    """
+    iterations: np.ndarray                                                     # number of iterations per section
+    residual: np.ndarray                                                       # relative change of the outlet temperature in the last iteration
+    clamped: np.ndarray                                                        # True if the outlet temperature was limited to the ambient temperature
+    tolerance: float
+    max_iterations: int
+    
+    @property
+    def converged(self) -> np.ndarray:
+        return (self.residual <= self.tolerance) | self.clamped
+    
+    def summary(self, n_worst:int = 5) -> dict:
+        """
+        Summary over the line.
+        
+        :param n_worst: Number of sections with the most iterations listed in the summary.
+        :return summary: Dictionary with the number of sections, iteration statistics, number of not converged and clamped sections,
+                         sections stopped by the max_iterations guard and the sections with the most iterations.
+        
+        """
+        n_sections = len(self.iterations)
+        worst = np.argsort(- self.iterations, kind = "stable")[:n_worst]                # most iterations first, ties in section order
+        return {
+            "sections": n_sections,
+            "iterations_total": int(self.iterations.sum()),
+            "iterations_mean": float(self.iterations.mean()) if n_sections else 0.0,
+            "iterations_max": int(self.iterations.max()) if n_sections else 0,
+            "residual_max": float(self.residual.max()) if n_sections else 0.0,
+            "not_converged": int((~self.converged).sum()),
+            "max_iterations_reached": int(((self.iterations >= self.max_iterations) & (self.residual > self.tolerance)).sum()),     # stopped by the guard (not converged)
+            "clamped": int(self.clamped.sum()),
+            "most_iterations": {int(i): int(self.iterations[i]) for i in worst}
+        }
+    
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Diagnostics as a DataFrame (one row per section, same order as the output DataFrames).
+        
+        """
+        return pd.DataFrame({"Iterations": self.iterations, "Residual [-]": self.residual, "Ambient clamp": self.clamped, "Converged": self.converged})
@@ -0,0 +1,258 @@
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from compiled_network import _as_dict
+from kernels import build_property_table, select_backend, solve_branch
+from model_param import ThermalCoeff, InsulationAgeing
+from model_server import WhatIfModel
+from section_arrays import SectionArrays, location_codes, calculate_insulation_state, pair_return_consumers
+from utils.functions import calculate_insulation_external_diameter, calculate_r_total
+from utils.progress import ProgressReporter
+
+
+#==============================================================================
+_DAMAGE_MODE_AVERAGE = "average"
+_DAMAGE_MODE_ELEMENT = "element"
+_PERCENTILES = (5, 50, 95)
+
+
+#==========================| AGEING LAW |======================================
+def _per_location(ageing, prefix:str, suffix:str) -> np.ndarray:
+    """
+    Values of an InsulationAgeing field for each location code (see location_codes in section_arrays.py).
+
+    """
+    values = np.zeros(max(location_codes.values()) + 1)
+    for location, code in location_codes.items():
+        values[code] = getattr(ageing, f"{prefix}_{location}_{suffix}")
+    return values
+
+
+class _LineDegradation:
+    """
+    State of the insulation of one line in all samples: damaged sections (samples x sections) and the state of insulation in the
+    meaning of the 'Insulation' column of the input data. The geometry (diameters, lengths, locations) is taken once from the SectionArrays.
+
+    """
+
+    def __init__(self, arrays:SectionArrays, n_samples:int, ageing, damage_mode:str, th_ins_damage_avg_m:float, thermal_coeff):
+        if damage_mode not in (_DAMAGE_MODE_AVERAGE, _DAMAGE_MODE_ELEMENT):
+            raise ValueError("Invalid damage mode. Use 'average' or 'element'.")
+        self.arrays = arrays
+        self.ageing = ageing
+        self.damage_mode = damage_mode
+        self.th_ins_damage_avg_m = th_ins_damage_avg_m
+        self.thermal_coeff = thermal_coeff
+
+        insulation = np.asarray(arrays.insulation, dtype = np.float64)
+        damaged = insulation == 0 if damage_mode == _DAMAGE_MODE_AVERAGE else insulation < 1
+        self.damaged = np.repeat(damaged[np.newaxis, :], n_samples, axis = 0)
+        self.insulation = np.repeat(insulation[np.newaxis, :], n_samples, axis = 0) if damage_mode == _DAMAGE_MODE_ELEMENT else None
+
+        # Ageing law and damage probabilities per section:
+        code = arrays.location_code
+        self.k_growth = 1 + _per_location(ageing, "k_growth", "per_year")[code]
+        self.th_retention = 1 - _per_location(ageing, "th_loss", "per_year")[code]
+        rate_per_m = _per_location(ageing, "damage_rate", "per_km_year")[code] / 1000
+        self.p_damage = -np.expm1(-rate_per_m * arrays.l_m)                    # Poisson events ---> P(at least one event in a year)
+
+    def damage_step(self, rng:np.random.Generator):
+        """
+        New damage events of one year in all samples (one uniform number per section):
+            P(new damage) = 1 - (1 - p_event) * (1 - p_spread)^(damaged neighbours).
+
+        """
+        damaged = self.damaged
+        neighbours = np.zeros(damaged.shape, dtype = np.int8)
+        neighbours[:, 1:] += damaged[:, :-1]
+        neighbours[:, :-1] += damaged[:, 1:]
+        p_intact = (1 - self.p_damage) * (1 - self.ageing.damage_spread_probability) ** neighbours
+        new = ~damaged & (rng.random(damaged.shape, dtype = np.float32) >= p_intact)
+        damaged |= new
+        if self.insulation is not None:
+            self.insulation[new] *= self.ageing.damage_residual
+        return new
+
+    def r_total(self, age_years:float, batch_size:int = 64) -> np.ndarray:
+        """
+        Thermal resistances of all sections in all samples (samples x sections) after a number of years of ageing.
+        Calculated in batches of samples as array operations: k_ins(t) = k_ins * (1 + k_growth)^t, th_ins(t) = th_ins * (1 - th_loss)^t.
+
+        """
+        a, tc = self.arrays, self.thermal_coeff
+        k_factor = self.k_growth ** age_years
+        th_factor = self.th_retention ** age_years
+        r_tot_w_per_k = np.empty(self.damaged.shape)
+        for start in range(0, len(self.damaged), batch_size):
+            rows = slice(start, start + batch_size)
+            insulation = np.where(self.damaged[rows], 0.0, 1.0) if self.insulation is None else self.insulation[rows]
+            th_ins_m, k_ins_w_per_mk = calculate_insulation_state(insulation, a.th_ins_catalog_m, self.damage_mode, self.th_ins_damage_avg_m, tc)
+            d_ins_ext_m = calculate_insulation_external_diameter(a.d_ext_m, th_ins_m * th_factor)
+            r_tot_w_per_k[rows] = calculate_r_total(a.d_int_m, a.l_m, tc.h_water_w_per_m2k, a.d_ext_m, tc.k_pipe_w_per_mk, d_ins_ext_m,
+                                                    k_ins_w_per_mk * k_factor, a.h_loc_w_per_m2k)
+        return r_tot_w_per_k
+
+    def damaged_share(self) -> np.ndarray:
+        """
+        Damaged share of the length of the line in each sample.
+
+        """
+        return self.damaged @ self.arrays.l_m / max(self.arrays.l_m.sum(), 1e-12)
+
+
+#==========================| SIMULATION |======================================
+def iter_degradation(arrays_supply:SectionArrays, arrays_return:SectionArrays, initial_values, years:int = 30, n_samples:int = 100,
+                     ageing = InsulationAgeing, damage_mode:str = _DAMAGE_MODE_AVERAGE, th_ins_damage_avg_m:float = None,
+                     thermal_coeff = ThermalCoeff, seed:int = None, workers:int = 1, tolerance:float = 0.001, backend:str = "auto",
+                     checkpoint = None, progress = None, cancel = None):
+    """
+    Monte Carlo simulation of the ageing of the insulation over several years. Every sample starts from the current state of insulation
+    (year 0); each year the conductivity and thickness of the insulation age with the law of their location, new damage events occur
+    at random (also spreading from damaged neighbours), the thermal resistances of all samples are recalculated as array operations
+    and the branch is solved for each sample with the same geometry, consumer pairing and property table.
+    Results are yielded year by year, so long runs can be monitored or written to disk while they are running.
+
+    :param arrays_supply: SectionArrays object of the supply line (see section_arrays.py or CompiledNetwork).
+    :param arrays_return: SectionArrays object of the return line.
+    :param initial_values: BranchInitialConfig object.
+    :param years: Number of simulated years.
+    :param n_samples: Number of samples.
+    :param ageing: InsulationAgeing class or object. Default: InsulationAgeing.
+    :param damage_mode: 'average' or 'element' (same as used for the section arrays). See the Branch class.
+    :param th_ins_damage_avg_m: Average thickness of the damaged insulation in [m]. Default: value from the initial values.
+    :param thermal_coeff: ThermalCoeff class or object (same as used for the section arrays). Default: ThermalCoeff.
+    :param seed: Seed of the random number generator (same seed ---> same results).
+    :param workers: Number of threads solving the samples (the Numba kernel releases the GIL).
+    :param tolerance, backend: See solve_branch().
+    :param checkpoint: Checkpoint object (see checkpoint.py). Records and the state of the samples are saved after each year; a resumed run
+        yields the saved years again and continues with the next year (results are the same as without interruption).
+    :param progress: Function called with ProgressEvent objects (years done, rate, ETA), e.g. print_progress in utils/progress.py.
+    :param cancel: CancellationToken object (utils/progress.py), checked before each year ---> CalculationCancelledError.
+    :return record: Dictionary per year with 'year', 'kpi' (KPI name ---> array of the samples, see WhatIfModel.calculate_kpis()),
+        'damaged share supply [-]', 'damaged share return [-]' (arrays of the samples) and 'new damage' (number of new damage events).
+
+    """
+    iv = initial_values
+    th_ins_damage_avg_m = th_ins_damage_avg_m if th_ins_damage_avg_m is not None else iv.th_avg_ins_damage_m
+    backend = select_backend(backend)
+    rng = np.random.default_rng(seed)
+    lines = [_LineDegradation(arrays, n_samples, ageing, damage_mode, th_ins_damage_avg_m, thermal_coeff) for arrays in (arrays_supply, arrays_return)]
+
+    # Cached for all years and samples:
+    mdot_consumer_return_kg_per_s = pair_return_consumers(arrays_supply.mdot_takeoff_kg_per_s, arrays_return.mdot_takeoff_kg_per_s)
+    t_min_c = min(arrays_supply.t_amb_c.min(), arrays_return.t_amb_c.min()) - 1
+    property_table = build_property_table(iv.p_nominal_pa, iv.fluid, t_min_c, max(iv.t_in_supply_c, iv.t_in_return_c, iv.t_consumer_release_c) + 1)
+
+    def solve_sample(r_tot_supply, r_tot_return) -> dict:
+        out_supply, out_return = solve_branch(replace(arrays_supply, r_tot_w_per_k = r_tot_supply), replace(arrays_return, r_tot_w_per_k = r_tot_return),
+                                              iv, property_table, tolerance, backend, mdot_consumer_return_kg_per_s = mdot_consumer_return_kg_per_s)
+        return WhatIfModel.calculate_kpis(out_supply, out_return)
+
+    first_year = 0
+    if checkpoint is not None:
+        if seed is None:
+            raise ValueError("A seed is required to resume a simulation from a checkpoint.")
+        checkpoint.bind({"function": "iter_degradation", "n_samples": n_samples, "seed": seed, "ageing": _as_dict(ageing),
+                         "damage_mode": damage_mode, "th_ins_damage_avg_m": th_ins_damage_avg_m, "thermal_coeff": _as_dict(thermal_coeff),
+                         "initial_values": _as_dict(iv), "tolerance": tolerance,
+                         "network": checkpoint.fingerprint(*(getattr(arrays, name) for arrays in (arrays_supply, arrays_return)
+                                                             for name in ("r_tot_w_per_k", "insulation", "l_m", "t_amb_c", "mdot_takeoff_kg_per_s")))})
+        state = checkpoint.load_state()
+        if state is not None:                                                  # resumed run ---> saved years and the state after the last one
+            for year in range(min(int(state["year"]), years) + 1):
+                yield _record_from_arrays(year, checkpoint.load(year))
+            first_year = int(state["year"]) + 1
+            rng.bit_generator.state = json.loads(str(state["rng"]))
+            for line, prefix in zip(lines, ("supply", "return")):
+                line.damaged[:] = state[f"{prefix}.damaged"]
+                if line.insulation is not None:
+                    line.insulation[:] = state[f"{prefix}.insulation"]
+
+    reporter = ProgressReporter(years + 1, "degradation", progress, cancel)
+    with ThreadPoolExecutor(max_workers = max(int(workers), 1)) as executor:
+        for year in range(first_year, years + 1):
+            reporter.update(year)
+            new_damage = sum(int(line.damage_step(rng).sum()) for line in lines) if year > 0 else 0
+            r_supply, r_return = (line.r_total(year) for line in lines)
+            if year == 0:                                                      # all samples in the current state
+                kpis = [solve_sample(r_supply[0], r_return[0])] * n_samples
+            else:
+                kpis = list(executor.map(solve_sample, r_supply, r_return))
+            record = {
+                "year": year,
+                "kpi": {name: np.array([kpi[name] for kpi in kpis]) for name in kpis[0]},
+                "damaged share supply [-]": lines[0].damaged_share(),
+                "damaged share return [-]": lines[1].damaged_share(),
+                "new damage": new_damage
+            }
+            if checkpoint is not None:
+                state = {"year": year, "rng": json.dumps(rng.bit_generator.state)}
+                for line, prefix in zip(lines, ("supply", "return")):
+                    state[f"{prefix}.damaged"] = line.damaged
+                    if line.insulation is not None:
+                        state[f"{prefix}.insulation"] = line.insulation
+                checkpoint.save_state(**state)
+                checkpoint.save(year, **_record_to_arrays(record))
+            yield record
+    reporter.finish()
+    if checkpoint is not None:
+        checkpoint.flush()
+
+
+def _record_to_arrays(record:dict) -> dict:
+    arrays = {f"kpi.{name}": values for name, values in record["kpi"].items()}
+    arrays.update({name: record[name] for name in ("damaged share supply [-]", "damaged share return [-]", "new damage")})
+    return arrays
+
+
+def _record_from_arrays(year:int, arrays:dict) -> dict:
+    record = {"year": year, "kpi": {name[len("kpi."):]: values for name, values in arrays.items() if name.startswith("kpi.")}}
+    record.update({name: arrays[name] for name in ("damaged share supply [-]", "damaged share return [-]")})
+    record["new damage"] = int(arrays["new damage"])
+    return record
+
+
+def summarize_year(record:dict) -> dict:
+    """
+    Summary statistics (mean and percentiles over the samples) of a record of iter_degradation().
+
+    :param record: Dictionary yielded by iter_degradation().
+    :return summary: Flat dictionary, e.g. {'year': 1, 'Qdot loss total [W] mean': ..., 'Qdot loss total [W] p5': ..., ...}.
+
+    """
+    values = dict(record["kpi"])
+    values["Damaged share supply [-]"] = record["damaged share supply [-]"]
+    values["Damaged share return [-]"] = record["damaged share return [-]"]
+    summary = {"year": record["year"], "New damage events": record["new damage"]}
+    for name, samples in values.items():
+        summary[f"{name} mean"] = float(samples.mean())
+        for percentile, value in zip(_PERCENTILES, np.percentile(samples, _PERCENTILES)):
+            summary[f"{name} p{percentile}"] = float(value)
+    return summary
+
+
+def simulate_degradation(arrays_supply:SectionArrays, arrays_return:SectionArrays, initial_values, years:int = 30, n_samples:int = 100,
+                         callback = None, **kwargs) -> tuple:
+    """
+    Runs iter_degradation() to the end.
+
+    :param arrays_supply, arrays_return, initial_values, years, n_samples: See iter_degradation().
+    :param callback: Function called with the summary of each year (see summarize_year()), e.g. print or a writer of a log file.
+    :param kwargs: Further arguments of iter_degradation() (ageing, damage_mode, seed, workers, ...).
+    :returns:
+        df_summary: DataFrame with one row per year (mean and percentiles of the KPIs).
+        samples: Dictionary KPI name ---> array (years + 1 x samples).
+
+    """
+    rows, samples = [], {}
+    for record in iter_degradation(arrays_supply, arrays_return, initial_values, years, n_samples, **kwargs):
+        summary = summarize_year(record)
+        rows.append(summary)
+        for name, values in record["kpi"].items():
+            samples.setdefault(name, []).append(values)
+        if callback is not None:
+            callback(summary)
+    return pd.DataFrame(rows).set_index("year"), {name: np.vstack(values) for name, values in samples.items()}
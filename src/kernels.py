@@ -0,0 +1,521 @@
+import math
+import numpy as np
+from dataclasses import dataclass
+
+from data_output import pipe_columns_names_types, SolverDiagnostics
+from utils.constants import TZERO
+from utils.functions import calculate_fluid_density, calculate_fluid_specific_heat
+
+try:                                                                           # optional dependency ---> compiled backend
+    import numba
+except ImportError:
+    numba = None
+
+
+#==============================================================================
+# Column positions in the output arrays (same order as pipe_columns_names_types in data_output.py):
+pipe_columns = list(pipe_columns_names_types.keys())
+COL_LAT, COL_LON, COL_L_TOT, COL_T, COL_MDOT, COL_QDOT_LOSS, COL_QDOTNORM_LOSS, COL_QDOT_LOSS_TOT, COL_V, \
+    COL_MDOT_CONSUMER, COL_QDOT_CONSUMER_ABS, COL_QDOT_CONSUMER_ACT, COL_QDOT_TOT = range(len(pipe_columns))
+
+BACKENDS = ("auto", "python", "numba")
+
+
+#==========================| FLUID PROPERTY TABLE |============================
+@dataclass
+class PropertyTable:
+    """
+    Fluid properties tabulated on a uniform temperature grid. Replaces CoolProp calls inside the kernels (linear interpolation).
+
+    :param t_min_c: Temperature of the first grid point in [°C].
+    :param dt_c: Grid step in [K].
+    :param cp_ws_per_kgk: Specific heat at the grid points in [Ws/kgK].
+    :param den_kg_per_m3: Density at the grid points in [kg/m3].
+
+    """
+    t_min_c: float
+    dt_c: float
+    cp_ws_per_kgk: np.ndarray
+    den_kg_per_m3: np.ndarray
+
+    def cp(self, t_c):
+        """
+        Interpolated specific heat in [Ws/kgK] at temperature t_c in [°C].
+
+        """
+        return np.interp(t_c, self.t_grid_c(), self.cp_ws_per_kgk)
+
+    def den(self, t_c):
+        """
+        Interpolated density in [kg/m3] at temperature t_c in [°C].
+
+        """
+        return np.interp(t_c, self.t_grid_c(), self.den_kg_per_m3)
+
+    def t_grid_c(self) -> np.ndarray:
+        return self.t_min_c + self.dt_c * np.arange(len(self.cp_ws_per_kgk))
+
+
+def build_property_table(p_pa:float, fluid:str, t_min_c:float, t_max_c:float, dt_c:float = 0.05) -> PropertyTable:
+    """
+    Tabulates specific heat and density of the fluid with CoolProp.
+
+    :param p_pa: Average pressure in the pipeline in [Pa].
+    :param fluid: Fluid type (CoolProp name).
+    :param t_min_c: Lowest temperature in the table in [°C] ---> should not be higher than the lowest ambient temperature.
+    :param t_max_c: Highest temperature in the table in [°C] ---> should not be lower than the highest inlet temperature.
+    :param dt_c: Grid step in [K]. Default: 0.05 K (relative interpolation error of cp below 1e-7 for water).
+    :return table: PropertyTable object.
+
+    """
+    n_points = int(math.ceil((t_max_c - t_min_c) / dt_c)) + 1
+    t_grid_k = t_min_c + dt_c * np.arange(n_points) - TZERO
+    cp = np.asarray(calculate_fluid_specific_heat(p_pa, t_grid_k, fluid), dtype = np.float64)      # CoolProp accepts arrays ---> one call for the whole table
+    den = np.asarray(calculate_fluid_density(p_pa, t_grid_k, fluid), dtype = np.float64)
+    return PropertyTable(t_min_c = t_min_c, dt_c = dt_c, cp_ws_per_kgk = cp, den_kg_per_m3 = den)
+
+
+#==========================| LINE KERNEL |=====================================
+def _solve_line(t_in_c, mdot_kg_per_s, l_tot_m, qdot_tot_w, qdot_loss_tot_w, is_return, t_consumer_release_c,
+                r_tot_w_per_k, t_amb_c, l_m, d_int_m, mdot_takeoff_kg_per_s, mdot_step_kg_per_s, tolerance,
+                t_min_c, dt_c, cp_table, den_table, out, max_iterations, iterations, residuals, clamped):
+    """
+    Section-by-section recurrence of one line written for arrays (reference implementation; compiled by Numba when available).
+    Reproduces PART 2 - PART 5 of Branch.calculate_supply() / Branch.calculate_return(), except that fluid properties are interpolated from a table.
+
+    :param t_in_c: Temperature at the start of the line in [°C].
+    :param mdot_kg_per_s: Mass flow at the start of the line in [kg/s].
+    :param l_tot_m: Position of the start of the line in [m].
+    :param qdot_tot_w: Total heat flow at the start of the line in [W].
+    :param qdot_loss_tot_w: Cumulative heat flow loss at the start of the line in [W].
+    :param is_return: False for the supply line, True for the return line (consumer mixing, direction of position and heat flow).
+    :param t_consumer_release_c: Temperature of the fluid returning from the consumers in [°C].
+    :param r_tot_w_per_k, t_amb_c, l_m, d_int_m, mdot_takeoff_kg_per_s: Section arrays (see SectionArrays).
+    :param mdot_step_kg_per_s: Mass flow added to the line after each node in [kg/s] (supply: take-off, return: flow from the consumer).
+    :param tolerance: Convergence tolerance of the outlet temperature iteration.
+    :param t_min_c, dt_c, cp_table, den_table: Property table (see PropertyTable).
+    :param out: Output array (n sections x 13 columns) ---> filled in place.
+    :param max_iterations: Maximum number of iterations of the outlet temperature calculation per section.
+    :param iterations, residuals, clamped: Diagnostics arrays (n sections) ---> filled in place (see SolverDiagnostics in data_output.py).
+
+    """
+    n_table = cp_table.shape[0]
+
+    for i in range(l_m.shape[0]):
+        # (i) Properties at the inlet temperature:
+        x = (t_in_c - t_min_c) / dt_c
+        k = int(math.floor(x))
+        if k < 0:
+            k = 0
+        elif k > n_table - 2:
+            k = n_table - 2
+        frac = x - k
+        if frac < 0.0:
+            frac = 0.0
+        elif frac > 1.0:
+            frac = 1.0
+        cp = cp_table[k] + frac * (cp_table[k + 1] - cp_table[k])
+        den = den_table[k] + frac * (den_table[k + 1] - den_table[k])
+
+        # (ii) Outlet temperature & heat flow loss (see calculate_output_temperature() in functions.py):
+        t_amb = t_amb_c[i]
+        r_tot = r_tot_w_per_k[i]
+        qdot_loss = (t_in_c - t_amb) / r_tot
+        t_out_ref = t_in_c
+        t_out = t_in_c - (qdot_loss / (mdot_kg_per_s * cp))
+        n_iterations = 0
+        is_clamped = False
+        residual = abs((t_out_ref - t_out) / t_out_ref)
+        while (residual > tolerance) and (n_iterations < max_iterations):
+            n_iterations += 1
+            if (t_out - t_amb) * (t_in_c - t_amb) <= 0.0:                      # outlet reached the ambient temperature (cooling or heat gain)
+                t_out = t_amb
+                is_clamped = True
+                break
+            if (t_in_c <= 0) or (t_out <= 0):
+                raise ValueError("Temperature values at the inlet and the outlet nodes cannot be zero or negative.")
+            log_diff = math.log(t_in_c) - math.log(t_out)
+            if log_diff == 0.0:
+                t_avg = (t_in_c - t_out) / 2
+            else:
+                t_avg = (t_in_c - t_out) / log_diff
+            qdot_loss = (t_avg - t_amb) / r_tot
+            t_out_ref = t_out
+            t_out = t_in_c - (qdot_loss / (mdot_kg_per_s * cp))
+            residual = abs((t_out_ref - t_out) / t_out_ref)
+        iterations[i] = n_iterations
+        residuals[i] = residual
+        clamped[i] = is_clamped
+
+        # (iii) Other calculations:
+        mdot_step = mdot_step_kg_per_s[i]
+        takeoff = abs(mdot_takeoff_kg_per_s[i])
+        qdot_cons_abs = takeoff * cp * (t_out - TZERO)
+        qdot_cons_act = takeoff * cp * (t_out - t_consumer_release_c)
+        qdot_loss_tot_w += qdot_loss
+        if is_return:
+            l_tot_m -= l_m[i]
+            qdot_tot_w = qdot_tot_w - qdot_loss + qdot_cons_abs
+        else:
+            l_tot_m += l_m[i]
+            qdot_tot_w = qdot_tot_w - qdot_loss - qdot_cons_abs
+
+        out[i, COL_L_TOT] = l_tot_m
+        out[i, COL_T] = t_out
+        out[i, COL_MDOT] = mdot_kg_per_s
+        out[i, COL_QDOT_LOSS] = qdot_loss
+        out[i, COL_QDOTNORM_LOSS] = qdot_loss / l_m[i]
+        out[i, COL_QDOT_LOSS_TOT] = qdot_loss_tot_w
+        out[i, COL_V] = (4 * mdot_kg_per_s) / (math.pi * den * (d_int_m[i] * d_int_m[i]))
+        out[i, COL_MDOT_CONSUMER] = mdot_step
+        out[i, COL_QDOT_CONSUMER_ABS] = qdot_cons_abs
+        out[i, COL_QDOT_CONSUMER_ACT] = qdot_cons_act
+        out[i, COL_QDOT_TOT] = qdot_tot_w
+
+        # (iv) Values for the next node:
+        if is_return:                                                          # fluid from the consumer mixes with the fluid in the return line
+            t_in_c = ((t_out * mdot_kg_per_s) + (t_consumer_release_c * mdot_step)) / (mdot_kg_per_s + mdot_step)
+        else:
+            t_in_c = t_out
+        mdot_kg_per_s += mdot_step
+
+    return out
+
+
+_solve_line_numba = numba.njit(cache = True, nogil = True)(_solve_line) if numba is not None else None
+
+
+def select_backend(backend:str = "auto") -> str:
+    """
+    Returns the backend used for the kernels.
+
+    :param backend: 'auto' (Numba if installed, otherwise Python), 'python' (reference) or 'numba'.
+    :return backend: 'python' or 'numba'.
+
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Available options: {BACKENDS}.")
+    if backend == "numba" and numba is None:
+        raise ImportError("Backend 'numba' requires the numba package. Install it with 'pip install numba' or use backend='python'.")
+    if backend == "auto":
+        return "numba" if numba is not None else "python"
+    return backend
+
+
+def solve_line(arrays, t_in_c:float, mdot_kg_per_s:float, l_tot_m:float, qdot_tot_w:float, property_table:PropertyTable,
+               t_consumer_release_c:float, mdot_step_kg_per_s:np.ndarray = None, tolerance:float = 0.001, backend:str = "auto",
+               qdot_loss_tot_w:float = 0.0, max_iterations:int = 100, return_diagnostics:bool = False) -> np.ndarray:
+    """
+    Solves one line (supply or return) for all sections in one call.
+
+    :param arrays: SectionArrays object of the line.
+    :param t_in_c: Temperature at the start of the line in [°C].
+    :param mdot_kg_per_s: Mass flow at the start of the line in [kg/s].
+    :param l_tot_m: Position of the start of the line in [m] (supply: 0, return: branch length).
+    :param qdot_tot_w: Total heat flow at the start of the line in [W].
+    :param property_table: PropertyTable object.
+    :param t_consumer_release_c: Temperature of the fluid returning from the consumers in [°C].
+    :param mdot_step_kg_per_s: Mass flow added after each node in [kg/s]. Default: take-offs of the line (supply). For the return line use pair_return_consumers().
+    :param tolerance: Convergence tolerance of the outlet temperature iteration.
+    :param backend: 'auto', 'python' or 'numba'. See select_backend().
+    :param qdot_loss_tot_w: Cumulative heat flow loss at the start of the line in [W]. Default: 0 (start of the line).
+    :param max_iterations: Maximum number of iterations of the outlet temperature calculation per section.
+    :param return_diagnostics: If True, a SolverDiagnostics object (data_output.py) is returned as well.
+    :returns:
+        out: Array (n sections x 13 columns) in the order of pipe_columns_names_types
+        diagnostics: SolverDiagnostics object (only if return_diagnostics is True)
+
+    """
+    kernel = _solve_line_numba if select_backend(backend) == "numba" else _solve_line
+    if mdot_step_kg_per_s is None:
+        mdot_step_kg_per_s = arrays.mdot_takeoff_kg_per_s
+
+    n_sections = len(arrays)
+    out = np.empty((n_sections, len(pipe_columns)))
+    out[:, COL_LAT] = arrays.lat
+    out[:, COL_LON] = arrays.lon
+    iterations, residuals, clamped = np.empty(n_sections, dtype = np.int64), np.empty(n_sections), np.empty(n_sections, dtype = np.bool_)
+    kernel(float(t_in_c), float(mdot_kg_per_s), float(l_tot_m), float(qdot_tot_w), float(qdot_loss_tot_w), arrays.direction == "return", float(t_consumer_release_c),
+           arrays.r_tot_w_per_k, arrays.t_amb_c, arrays.l_m, arrays.d_int_m, arrays.mdot_takeoff_kg_per_s,
+           np.ascontiguousarray(mdot_step_kg_per_s, dtype = np.float64), float(tolerance),
+           float(property_table.t_min_c), float(property_table.dt_c), property_table.cp_ws_per_kgk, property_table.den_kg_per_m3, out,
+           int(max_iterations), iterations, residuals, clamped)
+    if return_diagnostics:
+        return out, SolverDiagnostics(iterations, residuals, clamped, tolerance, max_iterations)
+    return out
+
+
+def line_state_after(out:np.ndarray, is_return:bool, t_consumer_release_c:float) -> dict:
+    """
+    Returns the state carried from the last section of a solved part of a line to the next section.
+    Used to solve a line in several parts (e.g. chunks of a large input file).
+
+    :param out: Output array of the solved part (see solve_line()).
+    :param is_return: False for the supply line, True for the return line.
+    :param t_consumer_release_c: Temperature of the fluid returning from the consumers in [°C].
+    :return state: Dictionary with the arguments t_in_c, mdot_kg_per_s, l_tot_m, qdot_tot_w and qdot_loss_tot_w of solve_line().
+
+    """
+    last = out[-1]
+    t_out_c, mdot_kg_per_s, mdot_step_kg_per_s = last[COL_T], last[COL_MDOT], last[COL_MDOT_CONSUMER]
+    if is_return:
+        t_in_c = ((t_out_c * mdot_kg_per_s) + (t_consumer_release_c * mdot_step_kg_per_s)) / (mdot_kg_per_s + mdot_step_kg_per_s)
+    else:
+        t_in_c = t_out_c
+    return {
+        "t_in_c": float(t_in_c),
+        "mdot_kg_per_s": float(mdot_kg_per_s + mdot_step_kg_per_s),
+        "l_tot_m": float(last[COL_L_TOT]),
+        "qdot_tot_w": float(last[COL_QDOT_TOT]),
+        "qdot_loss_tot_w": float(last[COL_QDOT_LOSS_TOT])
+    }
+
+
+#==========================| BRANCH |==========================================
+def solve_branch(arrays_supply, arrays_return, initial_values, property_table:PropertyTable = None,
+                 tolerance:float = 0.001, backend:str = "auto", max_iterations:int = 100, return_diagnostics:bool = False,
+                 mdot_consumer_return_kg_per_s:np.ndarray = None) -> tuple:
+    """
+    Solves the supply and then the return line of a branch with the array kernel.
+    Initial values are calculated in the same way as in Branch.calculate_supply() and Branch.calculate_return().
+
+    :param arrays_supply: SectionArrays object of the supply line.
+    :param arrays_return: SectionArrays object of the return line.
+    :param initial_values: BranchInitialConfig object.
+    :param property_table: PropertyTable object. Default: built for the temperature range of the branch.
+    :param tolerance: Convergence tolerance of the outlet temperature iteration.
+    :param backend: 'auto', 'python' or 'numba'. See select_backend().
+    :param max_iterations: Maximum number of iterations of the outlet temperature calculation per section.
+    :param return_diagnostics: If True, SolverDiagnostics objects of both lines are returned as well.
+    :param mdot_consumer_return_kg_per_s: Consumer flows into the return nodes in [kg/s]. Default: pair_return_consumers() of the take-offs.
+    :returns:
+        out_supply: Array (n supply sections x 13 columns)
+        out_return: Array (n return sections x 13 columns)
+        diagnostics_supply, diagnostics_return: SolverDiagnostics objects (only if return_diagnostics is True)
+
+    """
+    from section_arrays import pair_return_consumers
+
+    iv = initial_values
+    if property_table is None:
+        t_min_c = min(arrays_supply.t_amb_c.min(), arrays_return.t_amb_c.min()) - 1
+        t_max_c = max(iv.t_in_supply_c, iv.t_in_return_c, iv.t_consumer_release_c) + 1
+        property_table = build_property_table(iv.p_nominal_pa, iv.fluid, t_min_c, t_max_c)
+
+    # Supply:
+    den_in_kg_per_m3 = calculate_fluid_density(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid)
+    mdot_in_s_kg_per_s = iv.vdot_m3_per_h * den_in_kg_per_m3 / 3600
+    qdot_in_tot_s_w = mdot_in_s_kg_per_s * (iv.t_in_supply_c - TZERO) * calculate_fluid_specific_heat(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid)
+    out_supply, diagnostics_supply = solve_line(arrays_supply, iv.t_in_supply_c, mdot_in_s_kg_per_s, 0.0, qdot_in_tot_s_w, property_table,
+                                                iv.t_consumer_release_c, tolerance = tolerance, backend = backend,
+                                                max_iterations = max_iterations, return_diagnostics = True)
+
+    # Return: starts with the mass flow of the last supply node and the position at the end of the branch
+    mdot_in_r_kg_per_s = out_supply[-1, COL_MDOT]
+    qdot_in_tot_r_w = mdot_in_r_kg_per_s * (iv.t_in_return_c - TZERO) * calculate_fluid_specific_heat(iv.p_nominal_pa, iv.t_in_return_c - TZERO, iv.fluid)
+    if mdot_consumer_return_kg_per_s is None:
+        mdot_consumer_return_kg_per_s = pair_return_consumers(arrays_supply.mdot_takeoff_kg_per_s, arrays_return.mdot_takeoff_kg_per_s)
+    out_return, diagnostics_return = solve_line(arrays_return, iv.t_in_return_c, mdot_in_r_kg_per_s, arrays_supply.l_m.sum(), qdot_in_tot_r_w, property_table,
+                                                iv.t_consumer_release_c, mdot_step_kg_per_s = mdot_consumer_return_kg_per_s, tolerance = tolerance, backend = backend,
+                                                max_iterations = max_iterations, return_diagnostics = True)
+
+    if return_diagnostics:
+        return out_supply, out_return, diagnostics_supply, diagnostics_return
+    return out_supply, out_return
+
+
+def calculate_branch_kernel(network, backend:str = "auto", coupled:bool = False) -> tuple:
+    """
+    Runs the supply and return calculations of a Branch object with the array kernel instead of the section-by-section methods.
+    The results are written to the DataFrames in data_output.py, so the plotting functions work as usual.
+
+    :param network: Branch object (thickness data, initial values, damage settings, tolerance and max_iterations are read from it; diagnostics are stored in network.diagnostics).
+    :param backend: 'auto', 'python' or 'numba'. See select_backend().
+    :param coupled: If True, supply and return twin pipe sections exchange heat (see solve_branch_twin_pipe() in twin_pipe.py).
+                    The coupling information is stored in network.diagnostics['twin_pipe'].
+    :returns:
+        df_supply_out: DataFrame with the supply results
+        df_return_out: DataFrame with the return results
+
+    """
+    import data_input
+    import data_output
+    from section_arrays import build_section_arrays
+
+    arrays_supply = build_section_arrays(data_input.df_supply_in, "supply", network.th_all, network.ins_damage_mode, network.th_ins_damage_avg_m)
+    arrays_return = build_section_arrays(data_input.df_return_in, "return", network.th_all, network.ins_damage_mode, network.th_ins_damage_avg_m)
+    if coupled:
+        from twin_pipe import solve_branch_twin_pipe
+        out_supply, out_return, info = solve_branch_twin_pipe(arrays_supply, arrays_return, network.iv, tolerance = network.tolerance, backend = backend,
+                                                              max_iterations = network.max_iterations)
+        network.diagnostics = {"supply": info.pop("diagnostics_supply"), "return": info.pop("diagnostics_return"), "twin_pipe": info}
+    else:
+        out_supply, out_return, diagnostics_supply, diagnostics_return = solve_branch(arrays_supply, arrays_return, network.iv, tolerance = network.tolerance, backend = backend,
+                                                                                      max_iterations = network.max_iterations, return_diagnostics = True)
+        network.diagnostics = {"supply": diagnostics_supply, "return": diagnostics_return}
+
+    data_output.df_supply_out = data_output.pipe_arrays_to_frame(out_supply)
+    data_output.df_return_out = data_output.pipe_arrays_to_frame(out_return)
+    return data_output.df_supply_out, data_output.df_return_out
+
+
+#==========================| BATCHED KERNEL |==================================
+def _solve_line_batch(t_in_c:np.ndarray, mdot_kg_per_s:np.ndarray, l_tot_m:float, qdot_tot_w:np.ndarray, is_return:bool,
+                      t_consumer_release_c:np.ndarray, r_tot_w_per_k:np.ndarray, t_amb_c:np.ndarray, arrays, mdot_step_kg_per_s:np.ndarray,
+                      tolerance:float, property_table:PropertyTable, out:np.ndarray, max_iterations:int) -> np.ndarray:
+    """
+    Recurrence of _solve_line() for many scenarios in lockstep: the loop runs over the sections, every step is an array operation
+    over the scenarios. Each scenario iterates its outlet temperature until its own residual is below the tolerance (same
+    iteration counts as _solve_line()). The state carried from section to section is kept in float64, results are written to out
+    in its dtype.
+
+    :param t_in_c, mdot_kg_per_s, qdot_tot_w, t_consumer_release_c: Values of the scenarios at the start of the line (n scenarios).
+    :param r_tot_w_per_k, t_amb_c: Section values (n sections) or values per scenario and section (n scenarios x n sections).
+    :param arrays: SectionArrays object of the line (lengths, diameters, take-offs).
+    :param out: Output array (n scenarios x n sections x 13 columns) ---> filled in place.
+    :return mdot_last_kg_per_s: Mass flow in the last section of each scenario in [kg/s].
+
+    """
+    n_table = len(property_table.cp_ws_per_kgk)
+    cp_table, den_table = property_table.cp_ws_per_kgk, property_table.den_kg_per_m3
+    t_in_c, mdot_kg_per_s, qdot_tot_w = t_in_c.copy(), mdot_kg_per_s.copy(), qdot_tot_w.copy()
+    qdot_loss_tot_w = np.zeros(len(t_in_c))
+    r_rows, t_amb_rows = np.ndim(r_tot_w_per_k) == 2, np.ndim(t_amb_c) == 2
+    row = np.empty((len(t_in_c), len(pipe_columns)))                           # one section of all scenarios (float64)
+    row[:, COL_LAT], row[:, COL_LON] = 0.0, 0.0
+
+    for i in range(len(arrays)):
+        # (i) Properties at the inlet temperature:
+        x = (t_in_c - property_table.t_min_c) / property_table.dt_c
+        k = np.clip(np.floor(x), 0, n_table - 2).astype(np.int64)
+        frac = np.clip(x - k, 0.0, 1.0)
+        cp = cp_table[k] + frac * (cp_table[k + 1] - cp_table[k])
+        den = den_table[k] + frac * (den_table[k + 1] - den_table[k])
+
+        # (ii) Outlet temperature & heat flow loss (scenarios leave the iteration one by one):
+        t_amb = t_amb_c[:, i] if t_amb_rows else t_amb_c[i]
+        r_tot = r_tot_w_per_k[:, i] if r_rows else r_tot_w_per_k[i]
+        mdot_cp = mdot_kg_per_s * cp
+        qdot_loss = (t_in_c - t_amb) / r_tot
+        t_out = t_in_c - qdot_loss / mdot_cp
+        residual = np.abs((t_in_c - t_out) / t_in_c)
+        active = residual > tolerance
+        n_iterations = 0
+        while n_iterations < max_iterations and active.any():
+            n_iterations += 1
+            clamped = active & ((t_out - t_amb) * (t_in_c - t_amb) <= 0.0)     # cooling or heat gain (see _solve_line())
+            if clamped.any():
+                t_out = np.where(clamped, t_amb, t_out)
+                active &= ~clamped
+            if np.any(active & ((t_in_c <= 0) | (t_out <= 0))):
+                raise ValueError("Temperature values at the inlet and the outlet nodes cannot be zero or negative.")
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                log_diff = np.log(t_in_c) - np.log(t_out)
+                t_avg = np.where(log_diff == 0.0, (t_in_c - t_out) / 2, (t_in_c - t_out) / log_diff)
+            qdot_loss_new = (t_avg - t_amb) / r_tot
+            t_out_new = t_in_c - qdot_loss_new / mdot_cp
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                residual_new = np.abs((t_out - t_out_new) / t_out)
+            qdot_loss = np.where(active, qdot_loss_new, qdot_loss)
+            t_out = np.where(active, t_out_new, t_out)
+            residual = np.where(active, residual_new, residual)
+            active &= residual > tolerance
+
+        # (iii) Other calculations:
+        mdot_step = mdot_step_kg_per_s[i]
+        takeoff = abs(arrays.mdot_takeoff_kg_per_s[i])
+        qdot_cons_abs = takeoff * cp * (t_out - TZERO)
+        qdot_cons_act = takeoff * cp * (t_out - t_consumer_release_c)
+        qdot_loss_tot_w += qdot_loss
+        l_tot_m = l_tot_m - arrays.l_m[i] if is_return else l_tot_m + arrays.l_m[i]
+        qdot_tot_w = qdot_tot_w - qdot_loss + qdot_cons_abs if is_return else qdot_tot_w - qdot_loss - qdot_cons_abs
+
+        row[:, COL_L_TOT] = l_tot_m
+        row[:, COL_T] = t_out
+        row[:, COL_MDOT] = mdot_kg_per_s
+        row[:, COL_QDOT_LOSS] = qdot_loss
+        row[:, COL_QDOTNORM_LOSS] = qdot_loss / arrays.l_m[i]
+        row[:, COL_QDOT_LOSS_TOT] = qdot_loss_tot_w
+        row[:, COL_V] = (4 * mdot_kg_per_s) / (math.pi * den * (arrays.d_int_m[i] * arrays.d_int_m[i]))
+        row[:, COL_MDOT_CONSUMER] = mdot_step
+        row[:, COL_QDOT_CONSUMER_ABS] = qdot_cons_abs
+        row[:, COL_QDOT_CONSUMER_ACT] = qdot_cons_act
+        row[:, COL_QDOT_TOT] = qdot_tot_w
+        out[:, i] = row                                                        # rounded once to the dtype of out
+
+        # (iv) Values for the next node:
+        mdot_last_kg_per_s = mdot_kg_per_s
+        if is_return:
+            t_in_c = ((t_out * mdot_kg_per_s) + (t_consumer_release_c * mdot_step)) / (mdot_kg_per_s + mdot_step)
+        else:
+            t_in_c = t_out
+        mdot_kg_per_s = mdot_kg_per_s + mdot_step
+
+    out[:, :, COL_LAT] = arrays.lat
+    out[:, :, COL_LON] = arrays.lon
+    return mdot_last_kg_per_s
+
+
+def solve_branch_batch(arrays_supply, arrays_return, initial_values, property_table:PropertyTable = None, t_amb_supply_c:np.ndarray = None,
+                       t_amb_return_c:np.ndarray = None, r_tot_supply_w_per_k:np.ndarray = None, r_tot_return_w_per_k:np.ndarray = None,
+                       tolerance:float = 0.001, max_iterations:int = 100, mdot_consumer_return_kg_per_s:np.ndarray = None,
+                       dtype = np.float64) -> tuple:
+    """
+    Solves many scenarios of a branch at once (batched array kernel, no compilation needed). Scenarios differ in the initial
+    values and optionally in the ambient temperatures and thermal resistances of the sections.
+
+    Compact mode (dtype = np.float32): results are stored in float32, which halves the memory of the result arrays. The recurrence
+    itself (temperatures, flows, cumulative heat flows) runs in float64, so every stored value is rounded only once (relative error
+    below 6e-8, coordinates about 0.2 m). Carrying the state in float32 instead would add about 5e-4 K to the temperatures and up to
+    500 W to the total heat flow over 10,000 sections. See the accuracy table in README.md.
+
+    :param arrays_supply, arrays_return: SectionArrays objects of the lines.
+    :param initial_values: BranchInitialConfig object. t_in_supply_c, t_in_return_c, t_consumer_release_c and vdot_m3_per_h can be
+        arrays (one value per scenario); the number of scenarios is given by their broadcast shape and the per-scenario arrays below.
+    :param property_table: PropertyTable object. Default: built for the temperature range of the scenarios.
+    :param t_amb_supply_c, t_amb_return_c: Ambient temperatures per scenario and section in [°C] (n scenarios x n sections). Default: values of the SectionArrays.
+    :param r_tot_supply_w_per_k, r_tot_return_w_per_k: Thermal resistances per scenario and section (n scenarios x n sections). Default: values of the SectionArrays.
+    :param tolerance, max_iterations, mdot_consumer_return_kg_per_s: See solve_branch().
+    :param dtype: dtype of the results: np.float64 or np.float32 (compact mode).
+    :returns:
+        out_supply: Array (n scenarios x n supply sections x 13 columns)
+        out_return: Array (n scenarios x n return sections x 13 columns)
+
+    """
+    from section_arrays import pair_return_consumers
+
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float64, np.float32):
+        raise ValueError(f"Results can be stored as float64 or float32, not {dtype}.")
+    iv = initial_values
+    per_scenario = [np.asarray(value, dtype = np.float64) for value in (iv.t_in_supply_c, iv.t_in_return_c, iv.t_consumer_release_c, iv.vdot_m3_per_h)]
+    rows = [np.shape(value)[0] for value in (t_amb_supply_c, t_amb_return_c, r_tot_supply_w_per_k, r_tot_return_w_per_k) if value is not None]
+    n_scenarios = max(rows + [np.broadcast(*per_scenario).size])
+    t_in_supply_c, t_in_return_c, t_consumer_release_c, vdot_m3_per_h = (np.broadcast_to(value, (n_scenarios,)) for value in per_scenario)
+    t_amb_supply_c = arrays_supply.t_amb_c if t_amb_supply_c is None else np.asarray(t_amb_supply_c, dtype = np.float64)
+    t_amb_return_c = arrays_return.t_amb_c if t_amb_return_c is None else np.asarray(t_amb_return_c, dtype = np.float64)
+    if property_table is None:
+        t_min_c = min(t_amb_supply_c.min(), t_amb_return_c.min()) - 1
+        t_max_c = max(t_in_supply_c.max(), t_in_return_c.max(), t_consumer_release_c.max()) + 1
+        property_table = build_property_table(iv.p_nominal_pa, iv.fluid, t_min_c, t_max_c)
+
+    # Supply:
+    den_in_kg_per_m3 = np.asarray(calculate_fluid_density(iv.p_nominal_pa, t_in_supply_c - TZERO, iv.fluid), dtype = np.float64)
+    mdot_in_s_kg_per_s = vdot_m3_per_h * den_in_kg_per_m3 / 3600
+    cp_in_s = np.asarray(calculate_fluid_specific_heat(iv.p_nominal_pa, t_in_supply_c - TZERO, iv.fluid), dtype = np.float64)
+    qdot_in_tot_s_w = mdot_in_s_kg_per_s * (t_in_supply_c - TZERO) * cp_in_s
+    out_supply = np.empty((n_scenarios, len(arrays_supply), len(pipe_columns)), dtype = dtype)
+    mdot_in_r_kg_per_s = _solve_line_batch(t_in_supply_c, mdot_in_s_kg_per_s, 0.0, qdot_in_tot_s_w, False, t_consumer_release_c,
+                      arrays_supply.r_tot_w_per_k if r_tot_supply_w_per_k is None else np.asarray(r_tot_supply_w_per_k, dtype = np.float64),
+                      t_amb_supply_c, arrays_supply, arrays_supply.mdot_takeoff_kg_per_s, tolerance, property_table, out_supply, max_iterations)
+
+    # Return: starts with the mass flow of the last supply node (float64, not the rounded output) and the position at the end of the branch
+    cp_in_r = np.asarray(calculate_fluid_specific_heat(iv.p_nominal_pa, t_in_return_c - TZERO, iv.fluid), dtype = np.float64)
+    qdot_in_tot_r_w = mdot_in_r_kg_per_s * (t_in_return_c - TZERO) * cp_in_r
+    if mdot_consumer_return_kg_per_s is None:
+        mdot_consumer_return_kg_per_s = pair_return_consumers(arrays_supply.mdot_takeoff_kg_per_s, arrays_return.mdot_takeoff_kg_per_s)
+    out_return = np.empty((n_scenarios, len(arrays_return), len(pipe_columns)), dtype = dtype)
+    _solve_line_batch(t_in_return_c, mdot_in_r_kg_per_s, float(arrays_supply.l_m.sum()), qdot_in_tot_r_w, True, t_consumer_release_c,
+                      arrays_return.r_tot_w_per_k if r_tot_return_w_per_k is None else np.asarray(r_tot_return_w_per_k, dtype = np.float64),
+                      t_amb_return_c, arrays_return, mdot_consumer_return_kg_per_s, tolerance, property_table, out_return, max_iterations)
+    return out_supply, out_return
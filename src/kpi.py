@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from kernels import pipe_columns, COL_QDOT_LOSS, COL_QDOT_CONSUMER_ACT
+from section_arrays import SectionArrays, location_codes
+
+
+#==============================================================================
+GROUPINGS = ("direction", "location", "dn", "insulation")
+INSULATION_STATES = ("damaged", "partly damaged", "intact")                    # codes 0, 1, 2 (value of the 'Insulation' column: 0, 0 ... 1, >= 1)
+
+
+#==========================| RESULTS |=========================================
+@dataclass
+class GroupedKpis:
+    """
+    KPIs of one run or of many runs (sweep cubes, time series). Arrays have the leading shape of the aggregated outputs
+    (e.g. () for one run, (scenarios,) for a sweep, (steps,) for a time series), grouped values have one more axis (groups).
+
+    :param labels: Labels of the groups for each grouping (see GROUPINGS), e.g. {'location': ['channel', 'surface', 'soil'], ...}.
+    :param length_m: Pipe length of each group in [m] (same for all runs).
+    :param loss_w: Heat flow loss of each group in [W].
+    :param loss_w_per_m: Heat flow loss per metre of pipe of each group in [W/m] (NaN for groups without length).
+    :param loss_total_w: Heat flow loss of both lines in [W].
+    :param consumer_heat_w: Heat flow delivered to the consumers (take-off temperature - consumer release temperature) in [W].
+    :param loss_share: Share of the supplied heat that is lost: loss / (loss + delivered heat) [-] (as 'Loss share [-]' of WhatIfModel.calculate_kpis()).
+
+    """
+    labels: dict
+    length_m: dict
+    loss_w: dict
+    loss_w_per_m: dict
+    loss_total_w: np.ndarray
+    consumer_heat_w: np.ndarray
+    loss_share: np.ndarray
+
+    def to_frame(self, grouping:str, run = ()) -> pd.DataFrame:
+        """
+        Breakdown of one run as a DataFrame (only for display; the aggregation does not use DataFrames).
+
+        :param grouping: One of GROUPINGS.
+        :param run: Index of the run in the leading axes (e.g. 3 for the 4th scenario of a sweep). Default: () for a single run.
+
+        """
+        if grouping not in self.labels:
+            raise KeyError(f"Unknown grouping '{grouping}'. Available groupings: {list(self.labels)}.")
+        loss_w = self.loss_w[grouping][run]
+        total_w = self.loss_total_w[run]
+        return pd.DataFrame({
+            "L [m]": self.length_m[grouping],
+            "Qdot loss [W]": loss_w,
+            "qdot loss [W/m]": self.loss_w_per_m[grouping][run],
+            "Loss share of group [-]": loss_w / total_w if total_w else np.nan
+        }, index = pd.Index(self.labels[grouping], name = grouping))
+
+
+#==========================| AGGREGATION |=====================================
+class KpiAggregator:
+    """
+    Grouped KPIs of solved branches (loss by line, location, DN and insulation state, delivered heat, loss share).
+
+    Group codes of the sections are calculated once from the section arrays. All groupings are then reduced in a single bincount
+    over the sections (index = run x groups + group code), so the outputs of one run (sections x 13), a sweep cube
+    (scenarios x sections x 13, e.g. ParallelResult.supply) or a time-series store (steps x sections x 13, e.g. a memory-mapped
+    array) are aggregated in the same way. Large inputs are processed in chunks of runs, so stores are never loaded completely.
+
+    """
+
+    def __init__(self, arrays_supply:SectionArrays, arrays_return:SectionArrays):
+        """
+        :param arrays_supply, arrays_return: SectionArrays objects of the lines (same sections as the aggregated outputs).
+
+        """
+        self.n_supply, self.n_return = len(arrays_supply), len(arrays_return)
+        location_code = np.concatenate([arrays_supply.location_code, arrays_return.location_code]).astype(np.int64)
+        d_nom_mm = np.concatenate([arrays_supply.d_nom_mm, arrays_return.d_nom_mm])
+        insulation = np.concatenate([arrays_supply.insulation, arrays_return.insulation])
+        dn_values, dn_code = np.unique(d_nom_mm, return_inverse = True)
+
+        codes = {
+            "direction": np.repeat(np.array([0, 1]), [self.n_supply, self.n_return]),
+            "location": location_code,
+            "dn": dn_code.ravel(),
+            "insulation": np.where(insulation <= 0, 0, np.where(insulation < 1, 1, 2))
+        }
+        self.labels = {
+            "direction": ["supply", "return"],
+            "location": sorted(location_codes, key = location_codes.get),
+            "dn": [int(dn) for dn in dn_values],
+            "insulation": list(INSULATION_STATES)
+        }
+
+        # Code of each section in the combined group space (groupings one after the other) ---> one bincount for all groupings:
+        self._offsets, offset = {}, 0
+        for grouping in GROUPINGS:
+            self._offsets[grouping] = offset
+            offset += len(self.labels[grouping])
+        self.n_groups = offset
+        self._group_index = np.stack([codes[grouping] + self._offsets[grouping] for grouping in GROUPINGS])     # groupings x sections
+
+        l_m = np.concatenate([arrays_supply.l_m, arrays_return.l_m])
+        length_m = np.bincount(self._group_index.ravel(), weights = np.tile(l_m, len(GROUPINGS)), minlength = self.n_groups)
+        self.length_m = self._split(length_m)
+
+    @classmethod
+    def from_network(cls, network) -> "KpiAggregator":
+        """
+        :param network: CompiledNetwork object.
+
+        """
+        return cls(network.arrays_supply, network.arrays_return)
+
+    def _split(self, values:np.ndarray) -> dict:
+        """
+        Splits the last axis (combined group space) into the groupings.
+
+        """
+        return {grouping: values[..., self._offsets[grouping]:self._offsets[grouping] + len(self.labels[grouping])] for grouping in GROUPINGS}
+
+    def _as_runs(self, out, n_sections:int, name:str):
+        if isinstance(out, pd.DataFrame):                                      # e.g. df_supply_out of the Branch class
+            out = out.to_numpy(dtype = np.float64)
+        shape = np.shape(out)
+        if len(shape) < 2 or shape[-2:] != (n_sections, len(pipe_columns)):
+            raise ValueError(f"Output of the {name} line must have the shape (..., {n_sections}, {len(pipe_columns)}), not {shape}.")
+        return out, shape[:-2]
+
+    def aggregate(self, out_supply, out_return, chunk_size:int = 256) -> GroupedKpis:
+        """
+        :param out_supply, out_return: Outputs of the lines: arrays (sections x 13) of one run or (... x sections x 13) of many runs,
+            in float64 or float32 (memory-mapped arrays are read chunk by chunk). DataFrames of the Branch class are accepted as well.
+        :param chunk_size: Number of runs reduced at once (bounds the temporary memory).
+        :return kpis: GroupedKpis object.
+
+        """
+        out_supply, runs_shape = self._as_runs(out_supply, self.n_supply, "supply")
+        out_return, runs_shape_return = self._as_runs(out_return, self.n_return, "return")
+        if runs_shape != runs_shape_return:
+            raise ValueError(f"Supply and return outputs have different numbers of runs: {runs_shape} and {runs_shape_return}.")
+        n_runs = int(np.prod(runs_shape))
+        # Views (also of memory-mapped arrays):
+        out_supply = np.reshape(out_supply, (n_runs, self.n_supply, len(pipe_columns)))
+        out_return = np.reshape(out_return, (n_runs, self.n_return, len(pipe_columns)))
+
+        loss_w = np.empty((n_runs, self.n_groups))
+        consumer_heat_w = np.empty(n_runs)
+        n_groupings = len(GROUPINGS)
+        for start in range(0, n_runs, chunk_size):
+            stop = min(start + chunk_size, n_runs)
+            n = stop - start
+            loss = np.concatenate([out_supply[start:stop, :, COL_QDOT_LOSS], out_return[start:stop, :, COL_QDOT_LOSS]], axis = 1).astype(np.float64)
+            index = (np.arange(n)[:, None, None] * self.n_groups + self._group_index[None]).ravel()     # runs x groupings x sections
+            weights = np.broadcast_to(loss[:, None, :], (n, n_groupings, loss.shape[1])).ravel()
+            loss_w[start:stop] = np.bincount(index, weights = weights, minlength = n * self.n_groups).reshape(n, self.n_groups)
+            consumer_heat_w[start:stop] = out_supply[start:stop, :, COL_QDOT_CONSUMER_ACT].sum(axis = 1, dtype = np.float64)
+
+        loss_w = loss_w.reshape(runs_shape + (self.n_groups,))
+        consumer_heat_w = consumer_heat_w.reshape(runs_shape)
+        loss_groups = self._split(loss_w)
+        loss_total_w = loss_groups["direction"].sum(axis = -1)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            loss_w_per_m = {grouping: np.where(self.length_m[grouping] > 0, loss_groups[grouping] / self.length_m[grouping], np.nan)
+                            for grouping in GROUPINGS}
+            loss_share = loss_total_w / (loss_total_w + consumer_heat_w)
+        return GroupedKpis(
+            labels = self.labels,
+            length_m = self.length_m,
+            loss_w = loss_groups,
+            loss_w_per_m = loss_w_per_m,
+            loss_total_w = loss_total_w,
+            consumer_heat_w = consumer_heat_w,
+            loss_share = loss_share
+        )
@@ -0,0 +1,402 @@
+import os
+import abc
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from model_server import WhatIfModel, _QUERY_KEYS_CONFIG, _QUERY_KEYS_AMBIENT
+
+
+#==============================================================================
+MEASUREMENT_KEYS = _QUERY_KEYS_CONFIG + _QUERY_KEYS_AMBIENT                    # measured values that change the solution (see WhatIfModel)
+
+
+#==========================| MEASUREMENT SOURCES |=============================
+class MeasurementSource(abc.ABC):
+    """
+    Base class of measurement sources. A source is an asynchronous iterator of measurements ---> dictionaries with
+    any of the MEASUREMENT_KEYS (or names mapped to them, see LiveFeed) and optionally 'timestamp' (UNIX time of the measurement in [s]).
+
+    """
+
+    def __aiter__(self):
+        return self.measurements()
+
+    @abc.abstractmethod
+    def measurements(self):
+        """
+        Asynchronous generator of the measurements (implemented by the sources as 'async def' with 'yield').
+
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+class QueueSource(MeasurementSource):
+    """
+    In-process source (e.g. a stand-in for a SCADA client running in the same program or a test driver).
+    Measurements are put with put() from the event loop or with put_threadsafe() from other threads. None ends the feed.
+
+    """
+
+    def __init__(self, maxsize:int = 0):
+        self.queue = asyncio.Queue(maxsize)
+        self._loop = None
+
+    def put(self, measurement) -> None:
+        self.queue.put_nowait(measurement)
+
+    def put_threadsafe(self, measurement) -> None:
+        if self._loop is None:
+            raise RuntimeError("The source is not running yet.")
+        self._loop.call_soon_threadsafe(self.queue.put_nowait, measurement)
+
+    async def measurements(self):
+        self._loop = asyncio.get_running_loop()
+        while True:
+            measurement = await self.queue.get()
+            if measurement is None:
+                return
+            yield measurement
+
+
+class FileTailSource(MeasurementSource):
+    """
+    Follows a file with one JSON measurement per line (e.g. written by a data logger), like 'tail -f'.
+
+    """
+
+    def __init__(self, path:str, poll_interval_s:float = 0.2, from_start:bool = False):
+        """
+        :param path: Path to the file (may not exist yet).
+        :param poll_interval_s: Time between checks for new lines in [s].
+        :param from_start: If True, existing lines are read as well. Otherwise only lines appended after the start.
+
+        """
+        self.path = path
+        self.poll_interval_s = poll_interval_s
+        self.from_start = from_start
+        self._closed = False
+
+    async def measurements(self):
+        while not os.path.exists(self.path):
+            if self._closed:
+                return
+            await asyncio.sleep(self.poll_interval_s)
+        with open(self.path, "r") as feed_file:
+            if not self.from_start:
+                feed_file.seek(0, os.SEEK_END)
+            partial = ""
+            while not self._closed:
+                line = feed_file.readline()
+                if not line:
+                    await asyncio.sleep(self.poll_interval_s)
+                    continue
+                partial += line
+                if not partial.endswith("\n"):                                 # line is still being written
+                    continue
+                text, partial = partial.strip(), ""
+                if text:
+                    yield text
+
+    async def close(self) -> None:
+        self._closed = True
+
+
+class SocketSource(MeasurementSource):
+    """
+    TCP server receiving JSON measurements, one per line, from any number of clients (e.g. a SCADA gateway).
+
+    """
+
+    def __init__(self, host:str = "127.0.0.1", port:int = 8766, maxsize:int = 10_000):
+        """
+        :param host: Host address. Default: localhost only.
+        :param port: Port number.
+        :param maxsize: Size of the receive queue. When it is full, reading from the clients waits (TCP backpressure).
+
+        """
+        self.host = host
+        self.port = port
+        self._queue = asyncio.Queue(maxsize)
+        self._server = None
+
+    async def _handle_client(self, reader, writer) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    await self._queue.put(line.decode())
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def measurements(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        try:
+            while True:
+                measurement = await self._queue.get()
+                if measurement is None:
+                    return
+                yield measurement
+        finally:
+            self._server.close()
+
+    async def close(self) -> None:
+        self._queue.put_nowait(None)
+
+
+#==========================| LIVE FEED |=======================================
+class LiveFeed:
+    """
+    Re-solves a branch (WhatIfModel: geometry and fluid properties are cached) whenever new measurements arrive and publishes loss KPIs.
+
+    Ingestion and solving run as separate tasks. Measurements received while a solve is running are coalesced: the latest value
+    of each quantity is kept and the next solve uses all of them at once. At most one solve is pending, so the time from a measurement
+    to its KPIs is bounded by about two solve times, independent of the rate of the feed.
+    Measured values persist: a measurement with only 't_in_supply_c' keeps the last received flow and ambient temperatures.
+
+    Published records contain the KPIs of WhatIfModel.calculate_kpis() and:
+        - 'state': measured values used in the solve,
+        - 'measurements': number of measurements coalesced into the solve,
+        - 'latency_ms': time from receiving the oldest coalesced measurement to publishing,
+        - 'solve_ms': solve time,
+        - 'age_ms': time from the 'timestamp' of the newest measurement to publishing (if timestamps are sent),
+        - 'latency_budget_exceeded': True if latency_ms is above the latency budget.
+
+    """
+
+    def __init__(self, model:WhatIfModel, source:MeasurementSource, publishers:list = None, field_map:dict = None,
+                 latency_budget_ms:float = 1000.0, stats_window:int = 1000):
+        """
+        :param model: WhatIfModel object of the branch.
+        :param source: MeasurementSource object.
+        :param publishers: List of callables (functions or coroutine functions) receiving each published record.
+        :param field_map: Names of the measured values in the feed mapped to MEASUREMENT_KEYS, e.g. {"TT101": "t_in_supply_c"}.
+        :param latency_budget_ms: Allowed latency from measurement to KPIs in [ms] (exceeded latencies are counted and flagged).
+        :param stats_window: Number of recent latencies used in stats().
+
+        """
+        self.model = model
+        self.source = source
+        self.publishers = list(publishers or [])
+        self.field_map = dict(field_map or {})
+        self.latency_budget_ms = latency_budget_ms
+
+        self.state = {}                                                        # last measured values
+        self.latest = None                                                     # last published record
+        self._pending = {}                                                     # measured values not solved yet (coalesced)
+        self._pending_count = 0
+        self._pending_since = None                                             # receive time of the oldest pending measurement
+        self._pending_timestamp = None                                         # newest 'timestamp' of the pending measurements
+        self._new_data = asyncio.Event()
+        self._source_done = False
+
+        self._latencies_ms = deque(maxlen = stats_window)
+        self._solve_times_ms = deque(maxlen = stats_window)
+        self.counters = {"received": 0, "rejected": 0, "solves": 0, "coalesced": 0, "failed_solves": 0, "over_budget": 0}
+        self.last_error = None
+
+
+    #______________________ Ingestion _________________________________________
+
+    def _parse(self, measurement) -> tuple:
+        """
+        Returns measured values (with MEASUREMENT_KEYS) and the timestamp of a measurement.
+
+        """
+        if isinstance(measurement, (str, bytes)):
+            measurement = json.loads(measurement)
+        if not isinstance(measurement, dict):
+            raise ValueError("Measurement must be a JSON object.")
+        values, timestamp = {}, None
+        for name, value in measurement.items():
+            if name == "timestamp":
+                timestamp = float(value)
+                continue
+            key = self.field_map.get(name, name)
+            if key not in MEASUREMENT_KEYS:
+                raise ValueError(f"Unknown measured value '{name}'. Available values: {list(MEASUREMENT_KEYS)}.")
+            value = float(value)
+            if not np.isfinite(value):
+                raise ValueError(f"Measured value '{name}' is not finite.")
+            values[key] = value
+        return values, timestamp
+
+    def ingest(self, measurement) -> bool:
+        """
+        Adds a measurement to the pending values (also usable without a source, e.g. from a callback).
+
+        :param measurement: Dictionary or JSON string.
+        :return accepted: False if the measurement is invalid (counted as rejected).
+
+        """
+        self.counters["received"] += 1
+        try:
+            values, timestamp = self._parse(measurement)
+        except (ValueError, TypeError) as error:
+            self.counters["rejected"] += 1
+            self.last_error = f"Rejected measurement: {error}"
+            return False
+        if self._pending_since is None:
+            self._pending_since = time.perf_counter()
+        self._pending.update(values)
+        self._pending_count += 1
+        if timestamp is not None:
+            self._pending_timestamp = max(timestamp, self._pending_timestamp or timestamp)
+        self._new_data.set()
+        return True
+
+    async def _ingest_loop(self) -> None:
+        try:
+            async for measurement in self.source:
+                self.ingest(measurement)
+        finally:
+            self._source_done = True
+            self._new_data.set()
+
+
+    #______________________ Solving ___________________________________________
+
+    async def _publish(self, record:dict) -> None:
+        for publisher in self.publishers:
+            result = publisher(record)
+            if asyncio.iscoroutine(result):
+                await result
+
+    async def _solve_loop(self, executor) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending_count:
+                if self._source_done:
+                    return
+                await self._new_data.wait()
+                self._new_data.clear()
+                continue
+
+            # Take the coalesced measurements (new ones are collected while solving):
+            self.state.update(self._pending)
+            n_measurements, since, timestamp = self._pending_count, self._pending_since, self._pending_timestamp
+            self._pending, self._pending_count, self._pending_since, self._pending_timestamp = {}, 0, None, None
+            self.counters["coalesced"] += n_measurements - 1
+
+            query = dict(self.state)
+            solve_start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(executor, self.model.solve, query)
+            except (ValueError, KeyError, ArithmeticError) as error:
+                self.counters["failed_solves"] += 1
+                self.last_error = f"Solve failed: {error}"
+                continue
+            now = time.perf_counter()
+
+            record = dict(result["kpi"])
+            record["state"] = query
+            record["measurements"] = n_measurements
+            record["solve_ms"] = (now - solve_start) * 1000
+            record["latency_ms"] = (now - since) * 1000
+            record["age_ms"] = (time.time() - timestamp) * 1000 if timestamp is not None else None
+            record["latency_budget_exceeded"] = record["latency_ms"] > self.latency_budget_ms
+
+            self.counters["solves"] += 1
+            self.counters["over_budget"] += record["latency_budget_exceeded"]
+            self._latencies_ms.append(record["latency_ms"])
+            self._solve_times_ms.append(record["solve_ms"])
+            self.latest = record
+            await self._publish(record)
+
+    async def run(self) -> None:
+        """
+        Runs the feed until the source ends (or the task is cancelled). Pending measurements are solved before returning.
+        An error of the source (e.g. a lost connection) ends the feed as well and is raised after the pending measurements are solved.
+
+        """
+        executor = ThreadPoolExecutor(max_workers = 1)                         # one solve at a time
+        ingest_task = asyncio.create_task(self._ingest_loop())
+        try:
+            await self._solve_loop(executor)
+            await ingest_task                                                  # finished with the source ---> raises its error
+        finally:
+            ingest_task.cancel()
+            await self.source.close()
+            executor.shutdown(wait = False)
+
+
+    #______________________ Observability _____________________________________
+
+    def stats(self) -> dict:
+        """
+        Returns counters and latency statistics of recent solves (in [ms]).
+
+        """
+        stats = dict(self.counters, pending = self._pending_count, latency_budget_ms = self.latency_budget_ms, last_error = self.last_error)
+        for name, values in (("latency", self._latencies_ms), ("solve", self._solve_times_ms)):
+            if values:
+                values_array = np.asarray(values)
+                stats[f"{name}_ms"] = {"p50": float(np.percentile(values_array, 50)), "p95": float(np.percentile(values_array, 95)),
+                                       "max": float(values_array.max())}
+        return stats
+
+
+#==========================| PUBLISHERS |======================================
+class JsonLinesPublisher:
+    """
+    Appends published records to a file (one JSON object per line) or writes them to stdout.
+
+    """
+
+    def __init__(self, path:str = None):
+        self.output = open(path, "a") if path else sys.stdout
+
+    def __call__(self, record:dict) -> None:
+        self.output.write(json.dumps(record) + "\n")
+        self.output.flush()
+
+
+#==========================| COMMAND LINE |====================================
+def _make_source(spec:str) -> MeasurementSource:
+    """
+    Creates a source from 'tail:<path>' or 'socket:<host>:<port>'.
+
+    """
+    kind, _, argument = spec.partition(":")
+    if kind == "tail":
+        return FileTailSource(argument)
+    if kind == "socket":
+        host, _, port = argument.rpartition(":")
+        return SocketSource(host or "127.0.0.1", int(port))
+    raise ValueError("Source must be 'tail:<path>' or 'socket:<host>:<port>'.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "DHNpype live loss estimation from a measurement feed")
+    parser.add_argument("data_file", help = "Path to the input file")
+    parser.add_argument("--source", required = True, help = "'tail:<path>' (JSON lines file) or 'socket:<host>:<port>' (JSON lines over TCP)")
+    parser.add_argument("--output", default = None, help = "KPI output file (JSON lines). Default: stdout")
+    parser.add_argument("--field-map", default = None, help = "JSON object mapping feed names to measured values, e.g. '{\"TT101\": \"t_in_supply_c\"}'")
+    parser.add_argument("--latency-budget-ms", type = float, default = 1000.0)
+    parser.add_argument("--backend", choices = ("auto", "python", "numba"), default = "auto")
+    args = parser.parse_args()
+
+    model = WhatIfModel(args.data_file, backend = args.backend, results_cache_size = 16)
+    feed = LiveFeed(model, _make_source(args.source), [JsonLinesPublisher(args.output)],
+                    json.loads(args.field_map) if args.field_map else None, args.latency_budget_ms)
+    try:
+        asyncio.run(feed.run())
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(feed.stats()), file = sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import branch
 import data_input
 import data_output
+from utils.progress import print_progress
 
 
 def plot_config() -> None:
@@ -70,7 +71,7 @@ def main():
         
     """
     # RUN THE CALCULATIONS
-    network = branch.Branch()
+    network = branch.Branch(progress = print_progress)                         # progress of the calculations in the terminal
     network.calculate_supply()
     network.calculate_return()
     network.calculate_system_heat_flow()
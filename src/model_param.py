@@ -27,6 +27,45 @@ class ThermalCoeff:
     k_ins_damaged_w_per_mk: float = 0.03                                       
 
 
+@dataclass 
+class TwinPipeCoeff:
+    """
+    Contains data of pre-insulated twin pipes (supply and return pipe in a common casing) used by the coupled supply/return solver in twin_pipe.py.
+    
+    :param r_mutual_mk_per_w (float): Thermal resistance between the supply and the return pipe per unit length in [mK/W] (from the manufacturer's data).
+    :param location (str): Location of the twin pipe sections. Only sections of the supply and return lines at this location are coupled.
+        
+    """
+    r_mutual_mk_per_w: float = 4.0                                             
+    location: str = "soil"                                                     
+
+
+@dataclass 
+class InsulationAgeing:
+    """
+    Contains the ageing law of the pipe insulation and the rates of new damage used by the multi-year degradation simulation in degradation.py.
+    Default values are indicative and should be calibrated with inspection data of the network.
+    
+    :param k_growth_<location>_per_year (float): Relative increase of the insulation conductivity per year (compounded), e.g. moisture uptake.
+    :param th_loss_<location>_per_year (float): Relative decrease of the insulation thickness per year (compounded).
+    :param damage_rate_<location>_per_km_year (float): Expected number of new damage events per km of pipe and year.
+    :param damage_spread_probability (float): Probability per year that damage spreads to a neighbouring section.
+    :param damage_residual (float): Residual share of the insulation thickness after a damage event (used with the 'element' damage mode).
+        
+    """
+    k_growth_channel_per_year: float = 0.010                                   
+    k_growth_surface_per_year: float = 0.015                                   
+    k_growth_soil_per_year: float = 0.020                                      
+    th_loss_channel_per_year: float = 0.002                                    
+    th_loss_surface_per_year: float = 0.005                                    
+    th_loss_soil_per_year: float = 0.003                                       
+    damage_rate_channel_per_km_year: float = 0.05                              
+    damage_rate_surface_per_km_year: float = 0.15                              
+    damage_rate_soil_per_km_year: float = 0.3                                  
+    damage_spread_probability: float = 0.05                                    
+    damage_residual: float = 0.5                                               
+
+
 class PipeSectionLocation(Enum):
     """
     Contains the names of locations where sections of the pipelines are installed. 
@@ -0,0 +1,396 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import replace
+
+import numpy as np
+
+from config_data import BranchInitialConfig, AmbientTemp
+from kernels import (build_property_table, solve_branch, COL_T, COL_MDOT, COL_QDOT_LOSS, COL_QDOTNORM_LOSS, COL_QDOT_LOSS_TOT, COL_V,
+                     COL_QDOT_CONSUMER_ACT, pipe_columns, )
+from section_arrays import build_section_arrays, update_insulation
+from utils.exceptions import CalculationCancelledError
+from utils.progress import CancellationToken
+from utils.readers import read_input_file, split_input_data, read_thickness_data
+
+
+#==============================================================================
+thickness_data_location = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "insulation_thickness.json")
+
+_QUERY_KEYS_CONFIG = ("t_in_supply_c", "t_in_return_c", "t_consumer_release_c", "vdot_m3_per_h")         # BranchInitialConfig values that can be changed in a query
+_QUERY_KEYS_AMBIENT = ("t_channel_c", "t_surface_c", "t_soil_c")                                         # AmbientTemp values (same order as location_codes)
+_QUERY_KEYS = _QUERY_KEYS_CONFIG + _QUERY_KEYS_AMBIENT + ("insulation", "arrays")
+_ARRAY_COLUMNS = (COL_T, COL_MDOT, COL_QDOT_LOSS, COL_QDOTNORM_LOSS, COL_QDOT_LOSS_TOT, COL_V)                # per-section values returned when 'arrays' is requested
+
+
+#==========================| WHAT-IF MODEL |===================================
+class WhatIfModel:
+    """
+    Keeps a branch loaded in memory (section arrays, fluid property table, recent results) and answers what-if queries.
+
+    A query is a dictionary with any of the following keys:
+        - 't_in_supply_c', 't_in_return_c', 't_consumer_release_c', 'vdot_m3_per_h': replace the values in BranchInitialConfig,
+        - 't_channel_c', 't_surface_c', 't_soil_c': replace the values in AmbientTemp (e.g. measured air temperature),
+        - 'insulation': list of changes, e.g. [{"direction": "supply", "section": 12, "value": 0}] (value has the meaning of the 'Insulation' input column),
+        - 'arrays': if True, per-section values are returned together with KPIs.
+
+    Attributes:
+        iv (BranchInitialConfig): Base configuration of the branch.
+        arrays_supply, arrays_return (SectionArrays): Geometry and thermal resistances of the lines.
+        property_table (PropertyTable): Tabulated fluid properties.
+
+    """
+
+    def __init__(self, data_file:str, th_values:dict = None, initial_values = None, damage_mode:str = "average", damage:float = None,
+                 tolerance:float = 0.001, backend:str = "auto", results_cache_size:int = 256):
+        """
+        Constructs attributes for the WhatIfModel class.
+
+        :param data_file: Path to the input file.
+        :param th_values: Pipe and insulation thickness data. Default: 'insulation_thickness.json' in the 'data' folder.
+        :param initial_values: BranchInitialConfig object. Default: BranchInitialConfig().
+        :param damage_mode: 'average' or 'element'. See the Branch class.
+        :param damage: Average thickness of the damaged insulation in [m]. Default: value from BranchInitialConfig.
+        :param tolerance: Convergence tolerance of the outlet temperature iteration.
+        :param backend: Kernel backend: 'auto', 'python' or 'numba'.
+        :param results_cache_size: Number of recent results kept in memory.
+
+        """
+        self.iv = initial_values or BranchInitialConfig()
+        self.th_all = th_values or read_thickness_data(thickness_data_location)
+        self.damage_mode = damage_mode
+        self.th_ins_damage_avg_m = damage if damage is not None else self.iv.th_avg_ins_damage_m
+        self.tolerance = tolerance
+        self.backend = backend
+
+        df_supply_in, df_return_in = split_input_data(read_input_file(data_file))
+        self.arrays_supply = build_section_arrays(df_supply_in, "supply", self.th_all, damage_mode, self.th_ins_damage_avg_m)
+        self.arrays_return = build_section_arrays(df_return_in, "return", self.th_all, damage_mode, self.th_ins_damage_avg_m)
+
+        self.t_amb_min_c = min(self.arrays_supply.t_amb_c.min(), self.arrays_return.t_amb_c.min())
+        self.property_table = None
+        self._table_lock = threading.Lock()                                    # queries of the thread workers may extend the table concurrently
+        self._property_table_for(max(self.iv.t_in_supply_c, self.iv.t_in_return_c, self.iv.t_consumer_release_c))
+
+        self._results = OrderedDict()                                          # recent results (LRU)
+        self._results_cache_size = results_cache_size
+        self._lock = threading.Lock()
+
+        self.solve({})                                                         # warm-up (compiles the kernel if Numba is used)
+
+
+    #______________________ Helper methods ____________________________________
+
+    def _property_table_for(self, t_max_c:float, t_min_c:float = np.inf):
+        """
+        Returns the property table and extends it if a query needs higher (or lower) temperatures.
+
+        """
+        with self._table_lock:
+            table = self.property_table
+            if table is None or t_max_c > table.t_min_c + table.dt_c * (len(table.cp_ws_per_kgk) - 1) or t_min_c < table.t_min_c:
+                if table is not None:                                          # widen the table ---> keep the range of earlier queries
+                    t_max_c = max(t_max_c, table.t_min_c + table.dt_c * (len(table.cp_ws_per_kgk) - 1) - 20)
+                    t_min_c = min(t_min_c, table.t_min_c + 1)
+                table = build_property_table(self.iv.p_nominal_pa, self.iv.fluid, min(t_min_c, self.t_amb_min_c) - 1, max(t_max_c + 20, 150))
+                self.property_table = table
+        return table
+
+
+    def _apply_insulation(self, changes:list) -> tuple:
+        """
+        Returns section arrays with the insulation changes of a query.
+
+        """
+        if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+            raise ValueError("Insulation changes must be a list of objects, e.g. [{\"direction\": \"supply\", \"section\": 12, \"value\": 0}].")
+        arrays = {"supply": self.arrays_supply, "return": self.arrays_return}
+        unknown = sorted({str(change.get("direction", "supply")) for change in changes if str(change.get("direction", "supply")).lower() not in arrays})
+        if unknown:                                                            # changes of unknown lines would be dropped silently
+            raise ValueError(f"Unknown direction(s) {unknown} in the insulation changes. Available options: {list(arrays)}.")
+        for direction in arrays:
+            selected = [change for change in changes if change.get("direction", "supply").lower() == direction]
+            if selected:
+                index = [int(change["section"]) for change in selected]
+                if min(index) < 0 or max(index) >= len(arrays[direction]):
+                    raise ValueError(f"Section index out of range for the {direction} line (0 - {len(arrays[direction]) - 1}).")
+                value = [float(change["value"]) for change in selected]
+                arrays[direction] = update_insulation(arrays[direction], index, value, self.damage_mode, self.th_ins_damage_avg_m)
+        return arrays["supply"], arrays["return"]
+
+
+    def _apply_ambient(self, query:dict, arrays_supply, arrays_return) -> tuple:
+        """
+        Returns section arrays with the ambient temperatures of a query.
+
+        """
+        if not any(name in query for name in _QUERY_KEYS_AMBIENT):
+            return arrays_supply, arrays_return
+        t_amb_table = np.array([float(query.get(name, getattr(AmbientTemp, name))) for name in _QUERY_KEYS_AMBIENT])
+        return (replace(arrays_supply, t_amb_c = t_amb_table[arrays_supply.location_code]),
+                replace(arrays_return, t_amb_c = t_amb_table[arrays_return.location_code]))
+
+
+    @staticmethod
+    def calculate_kpis(out_supply:np.ndarray, out_return:np.ndarray) -> dict:
+        """
+        Calculates key performance indicators of a solved branch.
+
+        :param out_supply: Output array of the supply line.
+        :param out_return: Output array of the return line.
+        :return kpis: Dictionary with KPIs.
+
+        """
+        qdot_loss_supply_w = float(out_supply[-1, COL_QDOT_LOSS_TOT])
+        qdot_loss_return_w = float(out_return[-1, COL_QDOT_LOSS_TOT])
+        qdot_consumer_w = float(out_supply[:, COL_QDOT_CONSUMER_ACT].sum(dtype = np.float64))
+        return {
+            "Qdot loss supply [W]": qdot_loss_supply_w,
+            "Qdot loss return [W]": qdot_loss_return_w,
+            "Qdot loss total [W]": qdot_loss_supply_w + qdot_loss_return_w,
+            "Qdot consumer actual [W]": qdot_consumer_w,
+            "Loss share [-]": (qdot_loss_supply_w + qdot_loss_return_w) / (qdot_loss_supply_w + qdot_loss_return_w + qdot_consumer_w),
+            "T end supply [°C]": float(out_supply[-1, COL_T]),
+            "T end return [°C]": float(out_return[-1, COL_T])
+        }
+
+
+    #______________________ Queries ___________________________________________
+
+    def solve(self, query:dict, cancel = None) -> dict:
+        """
+        Answers a what-if query.
+
+        :param query: Dictionary with changes (see the class description).
+        :param cancel: CancellationToken object (utils/progress.py), e.g. set by a dashboard when the query is superseded.
+            Checked before the branch is solved ---> CalculationCancelledError.
+        :return result: Dictionary with 'kpi', optionally 'supply' and 'return' per-section arrays, 'cached' and 'elapsed_ms'.
+
+        """
+        time_start = time.perf_counter()
+
+        unknown = set(query) - set(_QUERY_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown query key(s) {sorted(unknown)}. Available keys: {list(_QUERY_KEYS)}.")
+
+        key = json.dumps(query, sort_keys = True)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+        if result is not None:
+            return dict(result, cached = True, elapsed_ms = (time.perf_counter() - time_start) * 1000)
+
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        iv = replace(self.iv, **{name: float(query[name]) for name in _QUERY_KEYS_CONFIG if name in query})
+        arrays_supply, arrays_return = self._apply_ambient(query, *self._apply_insulation(query.get("insulation", [])))
+        table = self._property_table_for(max(iv.t_in_supply_c, iv.t_in_return_c, iv.t_consumer_release_c),
+                                         min(arrays_supply.t_amb_c.min(), arrays_return.t_amb_c.min()))
+
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        out_supply, out_return = solve_branch(arrays_supply, arrays_return, iv, table, self.tolerance, self.backend)
+
+        result = {"kpi": self.calculate_kpis(out_supply, out_return)}
+        if query.get("arrays", False):
+            result["supply"] = {pipe_columns[col]: out_supply[:, col].tolist() for col in _ARRAY_COLUMNS}
+            result["return"] = {pipe_columns[col]: out_return[:, col].tolist() for col in _ARRAY_COLUMNS}
+
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self._results_cache_size:
+                self._results.popitem(last = False)
+
+        return dict(result, cached = False, elapsed_ms = (time.perf_counter() - time_start) * 1000)
+
+
+#==========================| WORKER PROCESSES |================================
+_worker_model = None
+
+
+def _init_worker(model_kwargs:dict) -> None:
+    """
+    Loads the model once in each worker process.
+
+    """
+    global _worker_model
+    _worker_model = WhatIfModel(**model_kwargs)
+
+
+def _solve_in_worker(query:dict, cancel = None) -> dict:
+    return _worker_model.solve(query, cancel)
+
+
+#==========================| HTTP SERVER |=====================================
+def _http_response(status:str, payload:dict, keep_alive:bool) -> bytes:
+    body = json.dumps(payload).encode()
+    header = (f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return header.encode() + body
+
+
+class _ClientTokens:
+    """
+    Cancellation tokens of the running queries, one per client. A new query of a client cancels the previous one
+    (e.g. a dashboard slider moved again) - a superseded query waiting for a worker is not solved.
+
+    """
+
+    def __init__(self, new_token):
+        """
+        :param new_token: Function returning a new CancellationToken (shared tokens for worker processes).
+
+        """
+        self._new_token = new_token
+        self._tokens = {}
+
+    def start(self, client:str) -> CancellationToken:
+        previous = self._tokens.get(client)
+        if previous is not None:
+            previous.cancel("Superseded by a newer query of the client.")
+        token = self._tokens[client] = self._new_token()
+        return token
+
+    def finish(self, client:str, token:CancellationToken) -> None:
+        if self._tokens.get(client) is token:
+            del self._tokens[client]
+
+    def cancel(self, client:str) -> bool:
+        token = self._tokens.pop(client, None)
+        if token is None:
+            return False
+        token.cancel("Cancelled by the client.")
+        return True
+
+
+async def _handle_connection(reader, writer, solve, executor, tokens:_ClientTokens) -> None:
+    """
+    Handles one (keep-alive) HTTP connection. Routes:
+        - GET  /health  ---> {"status": "ok"}
+        - GET  /kpi     ---> KPIs of the base configuration
+        - POST /whatif  ---> result of the query in the JSON body (a newer query of the same client cancels it ---> 409 Conflict)
+        - POST /cancel  ---> cancels the running query of the client: {"cancelled": true/false}
+
+    Clients are identified by the 'X-Client-Id' header (e.g. one id per dashboard, which may use several connections),
+    otherwise by the connection.
+
+    """
+    loop = asyncio.get_running_loop()
+    peer = writer.get_extra_info("peername")
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+            client = headers.get("x-client-id", str(peer))
+
+            try:
+                if method == "GET" and path == "/health":
+                    status, payload = "200 OK", {"status": "ok"}
+                elif method == "GET" and path == "/kpi":
+                    status, payload = "200 OK", await loop.run_in_executor(executor, solve, {})
+                elif method == "POST" and path == "/whatif":
+                    query = json.loads(body or b"{}")
+                    if not isinstance(query, dict):
+                        raise ValueError("Query must be a JSON object.")
+                    token = tokens.start(client)
+                    try:
+                        status, payload = "200 OK", await loop.run_in_executor(executor, solve, query, token)
+                    finally:
+                        tokens.finish(client, token)
+                elif method == "POST" and path == "/cancel":
+                    status, payload = "200 OK", {"cancelled": tokens.cancel(client)}
+                else:
+                    status, payload = "404 Not Found", {"error": f"Unknown route {method} {path}."}
+            except CalculationCancelledError as error:                         # superseded or cancelled query
+                status, payload = "409 Conflict", {"error": str(error), "cancelled": True}
+            except (ValueError, KeyError, TypeError) as error:                 # invalid query
+                status, payload = "400 Bad Request", {"error": str(error)}
+
+            writer.write(_http_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _serve(model_kwargs:dict, host:str, port:int, workers:int, worker_type:str) -> None:
+    manager = None
+    if worker_type == "thread":
+        model = WhatIfModel(**model_kwargs)
+        executor = ThreadPoolExecutor(max_workers = workers)
+        solve = model.solve
+        tokens = _ClientTokens(CancellationToken)
+    elif worker_type == "process":
+        executor = ProcessPoolExecutor(max_workers = workers, initializer = _init_worker, initargs = (model_kwargs,))
+        solve = _solve_in_worker
+        manager = multiprocessing.Manager()                                    # tokens shared with the worker processes
+        tokens = _ClientTokens(lambda: CancellationToken.shared(manager))
+    else:
+        raise ValueError("Worker type must be either 'thread' or 'process'.")
+
+    server = await asyncio.start_server(lambda reader, writer: _handle_connection(reader, writer, solve, executor, tokens), host, port)
+    print(f"DHNpype what-if server listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait = False, cancel_futures = True)
+        if manager is not None:
+            manager.shutdown()
+
+
+def serve(data_file:str, host:str = "127.0.0.1", port:int = 8765, workers:int = 4, worker_type:str = "thread", **model_kwargs) -> None:
+    """
+    Runs the what-if server until it is interrupted.
+
+    :param data_file: Path to the input file.
+    :param host: Host address. Default: localhost only.
+    :param port: Port number.
+    :param workers: Number of worker threads or processes.
+    :param worker_type: 'thread' (one shared model; fast with the Numba backend, which releases the GIL) or 'process' (one model per process).
+    :param model_kwargs: Other arguments of the WhatIfModel class.
+
+    """
+    model_kwargs = dict(model_kwargs, data_file = data_file)
+    try:
+        asyncio.run(_serve(model_kwargs, host, port, workers, worker_type))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "DHNpype what-if model server")
+    parser.add_argument("data_file", help = "Path to the input file")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--workers", type = int, default = 4)
+    parser.add_argument("--worker-type", choices = ("thread", "process"), default = "thread")
+    parser.add_argument("--backend", choices = ("auto", "python", "numba"), default = "auto")
+    args = parser.parse_args()
+    serve(args.data_file, args.host, args.port, args.workers, args.worker_type, backend = args.backend)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+import os
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import replace
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from compiled_network import CompiledNetwork
+from data_output import pipe_arrays_to_frame
+from kernels import build_property_table, pipe_columns, solve_branch
+from model_server import WhatIfModel, _QUERY_KEYS_CONFIG, _QUERY_KEYS_AMBIENT
+from reducers import DEFAULT_COLUMNS, SectionReducer
+from utils.progress import ProgressReporter
+
+
+#==========================| SHARED ARRAYS |===================================
+def _attach(name:str) -> shared_memory.SharedMemory:
+    """
+    Attaches to an existing segment without registering it with the resource tracker of the process (the parent owns the segment).
+
+    """
+    try:
+        return shared_memory.SharedMemory(name = name, track = False)          # Python >= 3.13
+    except TypeError:
+        return shared_memory.SharedMemory(name = name)
+
+
+class SharedArray:
+    """
+    NumPy array in a multiprocessing.shared_memory segment. The process that creates it owns the segment and removes it with
+    close(); other processes attach with SharedArray.attach(spec) and write into the same memory (no copies, no pickling).
+
+    Attributes:
+        array (np.ndarray): View of the segment.
+        spec (tuple): (segment name, shape, dtype) ---> passed to other processes.
+
+    """
+
+    def __init__(self, shm:shared_memory.SharedMemory, shape:tuple, dtype, owner:bool):
+        self._shm = shm
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype = dtype, buffer = shm.buf)
+        self.spec = (shm.name, tuple(shape), np.dtype(dtype).str)
+
+    @classmethod
+    def create(cls, shape:tuple, dtype = np.float64, fill = np.nan) -> "SharedArray":
+        """
+        Allocates a new segment (owned by the calling process).
+
+        """
+        shm = shared_memory.SharedMemory(create = True, size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+        shared = cls(shm, shape, dtype, owner = True)
+        if fill is not None:
+            shared.array.fill(fill)
+        return shared
+
+    @classmethod
+    def attach(cls, spec:tuple) -> "SharedArray":
+        name, shape, dtype = spec
+        return cls(_attach(name), shape, dtype, owner = False)
+
+    def close(self) -> None:
+        """
+        Releases the view; the owner also removes the segment. Views of the array must not be used afterwards.
+
+        """
+        if self._shm is None:
+            return
+        self.array = None
+        self._shm.close()
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._shm = None
+
+
+#==========================| RESULTS |=========================================
+class ParallelResult:
+    """
+    Results of solve_scenarios(): output arrays of all scenarios in shared memory (scenarios x sections x 13 columns, see pipe_columns).
+    The arrays are views of the segments ---> use the object as a context manager or call close() when the results are no longer needed.
+
+    Attributes:
+        supply (np.ndarray): Output arrays of the supply line.
+        return_ (np.ndarray): Output arrays of the return line.
+        scenarios (list): Scenarios in the order of the arrays.
+
+    """
+
+    def __init__(self, shared_supply:SharedArray, shared_return:SharedArray, scenarios:list):
+        self._shared = (shared_supply, shared_return)
+        self.supply = shared_supply.array
+        self.return_ = shared_return.array
+        self.scenarios = scenarios
+
+    def __len__(self) -> int:
+        return len(self.scenarios)
+
+    def __enter__(self) -> "ParallelResult":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.supply, self.return_ = None, None
+        for shared in self._shared:
+            shared.close()
+
+    def frame(self, scenario:int, direction:str) -> pd.DataFrame:
+        """
+        Output of one scenario as a DataFrame with the columns of pipe_columns_names_types (copied from shared memory).
+
+        :param scenario: Index of the scenario.
+        :param direction: 'supply' or 'return'.
+
+        """
+        if direction not in ("supply", "return"):
+            raise ValueError("Direction must be 'supply' or 'return'.")
+        return pipe_arrays_to_frame(self.supply[scenario] if direction == "supply" else self.return_[scenario])
+
+    def kpis(self) -> pd.DataFrame:
+        """
+        KPIs of all scenarios (see WhatIfModel.calculate_kpis()).
+
+        """
+        return pd.DataFrame([WhatIfModel.calculate_kpis(self.supply[i], self.return_[i]) for i in range(len(self))])
+
+
+#==========================| WORKERS |=========================================
+_worker_network = None
+_worker_table = None                                                           # property table widened for the scenarios (None ---> table of the network)
+_worker_arrays = {}                                                            # attached segments (one attachment per worker)
+
+
+def _init_worker(network) -> None:
+    global _worker_network, _worker_table
+    _worker_table = None
+    _worker_network = CompiledNetwork.load(network) if isinstance(network, str) else network
+
+
+def _property_table(network:CompiledNetwork, t_min_c:float, t_max_c:float):
+    """
+    Property table of the worker covering a temperature range. The table of the compiled network is used until a scenario
+    leaves its range; then a wider table is built once and kept for the following scenarios.
+
+    """
+    global _worker_table
+    table = _worker_table or network.property_table
+    if t_min_c < table.t_min_c or t_max_c > table.t_grid_c()[-1]:
+        iv = network.initial_values
+        table = build_property_table(iv.p_nominal_pa, iv.fluid, min(t_min_c - 10, table.t_min_c), max(t_max_c + 20, table.t_grid_c()[-1]))
+        _worker_table = table
+    return table
+
+
+def _shared(spec:tuple) -> np.ndarray:
+    if spec[0] not in _worker_arrays:
+        _worker_arrays[spec[0]] = SharedArray.attach(spec)
+    return _worker_arrays[spec[0]].array
+
+
+def _apply_scenario(network:CompiledNetwork, scenario:dict) -> tuple:
+    """
+    Initial values and section arrays of a scenario (values of BranchInitialConfig and AmbientTemp, same keys as what-if queries).
+
+    """
+    unknown = set(scenario) - set(_QUERY_KEYS_CONFIG + _QUERY_KEYS_AMBIENT)
+    if unknown:
+        raise ValueError(f"Unknown scenario key(s) {sorted(unknown)}. Available keys: {list(_QUERY_KEYS_CONFIG + _QUERY_KEYS_AMBIENT)}.")
+    iv = replace(network.initial_values, **{name: float(scenario[name]) for name in _QUERY_KEYS_CONFIG if name in scenario})
+    arrays_supply, arrays_return = network.arrays_supply, network.arrays_return
+    if any(name in scenario for name in _QUERY_KEYS_AMBIENT):
+        ambient = network.metadata["ambient_temp"]
+        t_amb_table = np.array([float(scenario.get(name, ambient[name])) for name in _QUERY_KEYS_AMBIENT])
+        arrays_supply = replace(arrays_supply, t_amb_c = t_amb_table[arrays_supply.location_code])
+        arrays_return = replace(arrays_return, t_amb_c = t_amb_table[arrays_return.location_code])
+    return iv, arrays_supply, arrays_return
+
+
+def _solve_scenario(network:CompiledNetwork, scenario:dict, tolerance:float, backend:str) -> tuple:
+    iv, arrays_supply, arrays_return = _apply_scenario(network, scenario)
+    table = _property_table(network, min(arrays_supply.t_amb_c.min(), arrays_return.t_amb_c.min()),
+                            max(iv.t_in_supply_c, iv.t_in_return_c, iv.t_consumer_release_c))
+    return solve_branch(arrays_supply, arrays_return, iv, table, tolerance, backend,
+                        mdot_consumer_return_kg_per_s = network.mdot_consumer_return_kg_per_s)
+
+
+def _solve_batch(start:int, scenarios:list, spec_supply:tuple, spec_return:tuple, tolerance:float, backend:str) -> int:
+    """
+    Solves scenarios start, start + 1, ... and writes the outputs directly into the shared arrays. Only the count is sent back.
+
+    """
+    out_supply_all, out_return_all = _shared(spec_supply), _shared(spec_return)
+    for offset, scenario in enumerate(scenarios):
+        out_supply_all[start + offset], out_return_all[start + offset] = _solve_scenario(_worker_network, scenario, tolerance, backend)
+    return len(scenarios)
+
+
+def _reduce_batch(scenarios:list, columns:tuple, n_buckets:int, tolerance:float, backend:str, block_size:int = 32) -> tuple:
+    """
+    Solves scenarios and reduces the outputs in the worker. Only the reducers are sent back (size independent of the scenarios).
+
+    """
+    network = _worker_network
+    reducers = (SectionReducer(len(network.arrays_supply), columns, n_buckets), SectionReducer(len(network.arrays_return), columns, n_buckets))
+    for start in range(0, len(scenarios), block_size):                         # outputs are reduced in blocks (vectorised updates)
+        outputs = [_solve_scenario(network, scenario, tolerance, backend) for scenario in scenarios[start:start + block_size]]
+        for i, reducer in enumerate(reducers):
+            reducer.update(np.stack([output[i] for output in outputs]))
+    return reducers
+
+
+#==========================| PARALLEL SOLVER |=================================
+def _batches(scenarios, batch_size:int):
+    iterator = iter(scenarios)
+    batch = [dict(scenario) for scenario in islice(iterator, batch_size)]
+    while batch:
+        yield batch
+        batch = [dict(scenario) for scenario in islice(iterator, batch_size)]
+
+
+def solve_scenarios(network, scenarios:list, workers:int = None, batch_size:int = 16, tolerance:float = 0.001, backend:str = "auto",
+                    progress = None, cancel = None, dtype = np.float64) -> ParallelResult:
+    """
+    Solves scenarios of a branch in worker processes. Output arrays are allocated in shared memory by the calling process and the
+    workers write into them directly, so results are not pickled; the returned arrays are views of the segments (no copies).
+    Segments are removed if the calculation fails or is cancelled.
+
+    :param network: CompiledNetwork object or path to a compiled network file (workers memory-map the file instead of receiving a copy).
+    :param scenarios: List of dictionaries with values of BranchInitialConfig and AmbientTemp (keys as in what-if queries, e.g. {'t_in_supply_c': 120}).
+    :param workers: Number of worker processes. Default: number of CPUs.
+    :param batch_size: Number of scenarios solved per task.
+    :param tolerance, backend: See solve_branch().
+    :param progress: Function called with ProgressEvent objects (scenarios done, rate, ETA), e.g. print_progress in utils/progress.py.
+    :param cancel: CancellationToken object (utils/progress.py), checked whenever a batch is finished ---> CalculationCancelledError.
+    :param dtype: dtype of the shared result arrays. np.float32 (compact mode) halves their memory; the scenarios are solved in float64
+                  and each value is rounded once when it is written (see solve_branch_batch() in kernels.py and the accuracy table in README.md).
+    :return result: ParallelResult object (close it when the results are no longer needed).
+
+    """
+    model = CompiledNetwork.load(network) if isinstance(network, str) else network
+    scenarios = [dict(scenario) for scenario in scenarios]
+    n_columns = len(pipe_columns)
+    reporter = ProgressReporter(len(scenarios), "scenarios", progress, cancel)
+
+    if np.dtype(dtype) not in (np.float64, np.float32):
+        raise ValueError(f"Results can be stored as float64 or float32, not {np.dtype(dtype)}.")
+    shared_supply = SharedArray.create((len(scenarios), len(model.arrays_supply), n_columns), dtype)
+    shared_return = None
+    try:
+        shared_return = SharedArray.create((len(scenarios), len(model.arrays_return), n_columns), dtype)
+        with ProcessPoolExecutor(max_workers = workers or os.cpu_count(), initializer = _init_worker, initargs = (network,)) as executor:
+            pending = {executor.submit(_solve_batch, start, scenarios[start:start + batch_size], shared_supply.spec, shared_return.spec, tolerance, backend)
+                       for start in range(0, len(scenarios), batch_size)}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when = FIRST_COMPLETED)
+                    for future in done:
+                        reporter.advance(future.result())                      # raises errors of the workers
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        reporter.finish()
+    except BaseException:
+        shared_supply.close()
+        if shared_return is not None:
+            shared_return.close()
+        raise
+    return ParallelResult(shared_supply, shared_return, scenarios)
+
+
+def reduce_scenarios(network, scenarios, workers:int = None, batch_size:int = 256, columns = DEFAULT_COLUMNS, n_buckets:int = 128,
+                     tolerance:float = 0.001, backend:str = "auto", progress = None, cancel = None) -> tuple:
+    """
+    Solves scenarios of a branch in worker processes and keeps only statistics per section and output column (mean, std, min, max,
+    quantiles), not the outputs of the scenarios. Each task reduces its scenarios in the worker; the parent merges the reducers.
+    Memory is independent of the number of scenarios, so scenarios may also be a generator (consumed batch by batch).
+
+    :param network, workers, tolerance, backend, progress, cancel: See solve_scenarios().
+    :param scenarios: Iterable of dictionaries with values of BranchInitialConfig and AmbientTemp (see solve_scenarios()).
+    :param batch_size: Number of scenarios solved and reduced per task (larger batches ---> fewer reducers to send back and merge).
+    :param columns, n_buckets: See SectionReducer.
+    :return reducer_supply, reducer_return: SectionReducer objects of the supply and the return line.
+
+    """
+    model = CompiledNetwork.load(network) if isinstance(network, str) else network
+    total = len(scenarios) if hasattr(scenarios, "__len__") else None
+    reporter = ProgressReporter(total, "scenarios", progress, cancel)
+    reducer_supply = SectionReducer(len(model.arrays_supply), columns, n_buckets)
+    reducer_return = SectionReducer(len(model.arrays_return), columns, n_buckets)
+    workers = workers or os.cpu_count()
+
+    batches = _batches(scenarios, batch_size)
+    with ProcessPoolExecutor(max_workers = workers, initializer = _init_worker, initargs = (network,)) as executor:
+        pending = set()
+        try:
+            while True:
+                # At most two tasks per worker are submitted ---> scenarios of a generator are not all held in memory:
+                for batch in islice(batches, 2 * workers - len(pending)):
+                    future = executor.submit(_reduce_batch, batch, reducer_supply.columns, n_buckets, tolerance, backend)
+                    future.n_scenarios = len(batch)
+                    pending.add(future)
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when = FIRST_COMPLETED)
+                for future in done:
+                    supply, return_ = future.result()                          # raises errors of the workers
+                    reducer_supply.merge(supply)
+                    reducer_return.merge(return_)
+                    reporter.advance(future.n_scenarios)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+    reporter.finish()
+    return reducer_supply, reducer_return
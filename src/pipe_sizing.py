@@ -0,0 +1,261 @@
+import os
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from config_data import BranchInitialConfig, AmbientTemp
+from kernels import numba, select_backend, solve_branch, COL_T
+from model_param import ThermalCoeff
+from section_arrays import location_codes, encode_location, build_section_arrays, pair_return_consumers
+from utils.constants import TZERO
+from utils.functions import calculate_fluid_density, calculate_r_total
+from utils.readers import read_thickness_data, split_input_data
+
+
+#==============================================================================
+thickness_data_location = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "insulation_thickness.json")
+
+
+#==========================| DN TABLE |========================================
+@dataclass
+class DNTable:
+    """
+    Per-DN values of the pipe catalog used by the sizing search (computed once per line).
+
+    :param d_nom_mm: Available nominal diameters in [mm] (ascending).
+    :param d_ext_mm: Pipe external diameters in [mm].
+    :param d_int_m: Pipe internal diameters in [m].
+    :param r_unit_mk_per_w: Thermal resistance of 1 m of pipe with intact insulation in [mK/W] (DN x location, see location_codes).
+    :param v_per_mdot: Flow velocity per unit mass flow in [m/s per kg/s].
+
+    """
+    d_nom_mm: np.ndarray
+    d_ext_mm: np.ndarray
+    d_int_m: np.ndarray
+    r_unit_mk_per_w: np.ndarray
+    v_per_mdot: np.ndarray
+
+
+def build_dn_table(th_all:dict, direction:str, den_kg_per_m3:float, thermal_coeff = ThermalCoeff) -> DNTable:
+    """
+    Tabulates unit thermal resistance (per location) and velocity coefficient for all DN in the thickness data.
+
+    :param th_all: Pipe and insulation thickness data (needs the 'd_pipe_ext' table).
+    :param direction: 'supply' or 'return' ---> selects the insulation thickness data.
+    :param den_kg_per_m3: Fluid density used for the velocity in [kg/m3].
+    :param thermal_coeff: ThermalCoeff class or object. Default: ThermalCoeff.
+    :return dn_table: DNTable object.
+
+    """
+    if "d_pipe_ext" not in th_all:
+        raise KeyError("Pipe sizing requires external pipe diameters ('d_pipe_ext') in the thickness data.")
+    d_nom_mm = np.array(sorted(int(dn) for dn in th_all["th_pipe"]))
+    d_ext_mm = np.array([th_all["d_pipe_ext"][str(dn)] for dn in d_nom_mm], dtype = np.float64)
+    d_int_m = (d_ext_mm - 2 * np.array([th_all["th_pipe"][str(dn)] for dn in d_nom_mm])) / 1000
+
+    h_table = {"channel": thermal_coeff.h_channel_w_per_m2k, "surface": thermal_coeff.h_surface_w_per_m2k, "soil": thermal_coeff.h_soil_w_per_m2k}
+    r_unit_mk_per_w = np.empty((len(d_nom_mm), len(location_codes)))
+    for location, code in location_codes.items():
+        th_ins_m = np.array([th_all[f"th_insulation_{location}_{direction}"][str(dn)] for dn in d_nom_mm]) / 1000
+        r_unit_mk_per_w[:, code] = calculate_r_total(d_int_m, 1.0, thermal_coeff.h_water_w_per_m2k, d_ext_mm / 1000, thermal_coeff.k_pipe_w_per_mk,
+                                                     d_ext_mm / 1000 + 2 * th_ins_m, thermal_coeff.k_ins_w_per_mk, h_table[location])
+
+    return DNTable(d_nom_mm = d_nom_mm, d_ext_mm = d_ext_mm, d_int_m = d_int_m, r_unit_mk_per_w = r_unit_mk_per_w,
+                   v_per_mdot = 4 / (np.pi * den_kg_per_m3 * d_int_m ** 2))
+
+
+#==========================| DYNAMIC PROGRAMMING |=============================
+def _size_line(cost, change_penalty, choice):
+    """
+    Dynamic programming along the line: minimum total cost with non-increasing DN in the order of the sections (telescoping line).
+    Reference implementation; compiled by Numba when available.
+
+    :param cost: Cost of each DN in each section (n sections x n DN, DN ascending); infeasible DN have infinite cost.
+    :param change_penalty: Cost added for each change of DN between neighbouring sections.
+    :param choice: Output array (n sections) ---> index of the selected DN, filled in place.
+    :return total: Minimum total cost (infinite if no feasible assignment exists).
+
+    """
+    n, n_dn = cost.shape
+    best = cost[0].copy()
+    new = np.empty(n_dn)
+    back = np.empty((n, n_dn), dtype = np.int8)                                # DN index of the previous section on the best path
+
+    for i in range(1, n):
+        run_min = np.inf                                                       # min of best[k'] over k' > k (larger DN upstream)
+        run_arg = -1
+        for k in range(n_dn - 1, -1, -1):
+            if run_min + change_penalty < best[k]:
+                new[k] = cost[i, k] + run_min + change_penalty
+                back[i, k] = run_arg
+            else:
+                new[k] = cost[i, k] + best[k]
+                back[i, k] = k
+            if best[k] < run_min:
+                run_min = best[k]
+                run_arg = k
+        for k in range(n_dn):
+            best[k] = new[k]
+
+    k_best = 0
+    for k in range(1, n_dn):
+        if best[k] < best[k_best]:
+            k_best = k
+    total = best[k_best]
+    for i in range(n - 1, -1, -1):
+        choice[i] = k_best
+        if i > 0:
+            k_best = back[i, k_best]
+    return total
+
+
+_size_line_numba = numba.njit(cache = True, nogil = True)(_size_line) if numba is not None else None
+
+
+def size_line(l_m:np.ndarray, location_code:np.ndarray, mdot_kg_per_s:np.ndarray, t_fluid_c, t_amb_c:np.ndarray, dn_table:DNTable,
+              v_max_m_per_s:float = 2.0, v_min_m_per_s:float = 0.0, pump_weight:float = 3.0, friction_factor:float = 0.02,
+              change_penalty_w:float = 0.0, reverse:bool = False, backend:str = "auto") -> pd.DataFrame:
+    """
+    Selects DN for every section of one line. Minimises heat flow loss + pump_weight * pumping power under velocity limits,
+    with DN not increasing in the flow direction (reverse=True: not decreasing, e.g. the return line).
+
+    The cost of all sections x DN candidates is evaluated at once from the DN table:
+        Q̇_loss = L * (T_fluid - T_amb) / R'(DN, location),
+        P_pump = f * L * v² * ṁ / (2 * d_int),  v = ṁ * 4 / (π * ρ * d_int²).
+
+    :param l_m: Section lengths in [m].
+    :param location_code: Location codes of the sections (see location_codes).
+    :param mdot_kg_per_s: Mass flow in each section in [kg/s].
+    :param t_fluid_c: Fluid temperature in each section in [°C] (array or design value).
+    :param t_amb_c: Ambient temperature of each section in [°C].
+    :param dn_table: DNTable object of the line.
+    :param v_max_m_per_s: Highest allowed flow velocity in [m/s].
+    :param v_min_m_per_s: Lowest allowed flow velocity in [m/s] (sections with flow only).
+    :param pump_weight: Weight of the pumping power relative to the heat flow loss (e.g. ratio of electricity and heat prices).
+    :param friction_factor: Darcy friction factor.
+    :param change_penalty_w: Cost of a DN change between neighbouring sections in [W] (fewer reducers).
+    :param reverse: If True, DN must not decrease in the order of the sections.
+    :param backend: 'auto', 'python' or 'numba'. See select_backend() in kernels.py.
+    :return df_sizing: DataFrame with the selected DN, velocity, heat flow loss and pumping power of each section.
+
+    """
+    mdot_kg_per_s = np.abs(np.asarray(mdot_kg_per_s, dtype = np.float64))
+    t_fluid_c = np.broadcast_to(np.asarray(t_fluid_c, dtype = np.float64), mdot_kg_per_s.shape)
+
+    # (i) Cost of all candidates (n sections x n DN):
+    v_m_per_s = mdot_kg_per_s[:, None] * dn_table.v_per_mdot[None, :]
+    qdot_loss_w = (l_m * (t_fluid_c - t_amb_c))[:, None] / dn_table.r_unit_mk_per_w[:, location_code].T
+    p_pump_w = friction_factor * l_m[:, None] * v_m_per_s ** 2 * mdot_kg_per_s[:, None] / (2 * dn_table.d_int_m[None, :])
+    feasible = (v_m_per_s <= v_max_m_per_s) & ((v_m_per_s >= v_min_m_per_s) | (mdot_kg_per_s[:, None] == 0))
+    cost = np.where(feasible, qdot_loss_w + pump_weight * p_pump_w, np.inf)
+
+    no_candidate = ~feasible.any(axis = 1)
+    if no_candidate.any():
+        raise ValueError(f"No DN satisfies the velocity limits in sections {np.flatnonzero(no_candidate).tolist()[:20]} "
+                         f"(v_min = {v_min_m_per_s} m/s, v_max = {v_max_m_per_s} m/s).")
+
+    # (ii) Search:
+    kernel = _size_line_numba if select_backend(backend) == "numba" else _size_line
+    order = slice(None, None, -1) if reverse else slice(None)
+    choice = np.empty(len(l_m), dtype = np.int64)
+    total = kernel(np.ascontiguousarray(cost[order]), float(change_penalty_w), choice)
+    if not np.isfinite(total):
+        raise ValueError("No feasible DN profile: the velocity limits cannot be met with a telescoping line. Increase v_max or allow smaller DN.")
+    choice = choice[order]
+
+    rows = np.arange(len(l_m))
+    return pd.DataFrame({
+        "DN [mm]": dn_table.d_nom_mm[choice],
+        "Dext [mm]": dn_table.d_ext_mm[choice],
+        "L [m]": l_m,
+        "mdot [kg/s]": mdot_kg_per_s,
+        "v [m/s]": v_m_per_s[rows, choice],
+        "Qdot loss [W]": qdot_loss_w[rows, choice],
+        "P pump [W]": p_pump_w[rows, choice]
+    })
+
+
+#==========================| BRANCH |==========================================
+def apply_dn_profile(df_input_data:pd.DataFrame, dn_supply_mm:np.ndarray, dn_return_mm:np.ndarray, th_all:dict) -> pd.DataFrame:
+    """
+    Returns a copy of the input data with new DN (and external diameters from the 'd_pipe_ext' table) of the supply and return sections.
+
+    """
+    df_new = df_input_data.copy()
+    supply, ret = (df_new["Direction"] == "Supply").to_numpy(), (df_new["Direction"] == "Return").to_numpy()
+    for mask, dn_mm in ((supply, dn_supply_mm), (ret, dn_return_mm)):
+        dn_mm = np.asarray(dn_mm, dtype = np.int64)
+        df_new.loc[mask, "DN [mm]"] = dn_mm
+        df_new.loc[mask, "Dext [mm]"] = np.array([th_all["d_pipe_ext"][str(dn)] for dn in dn_mm], dtype = df_new["Dext [mm]"].dtype)
+    return df_new
+
+
+def size_branch(df_input_data:pd.DataFrame, th_values:dict = None, initial_values = None, v_max_m_per_s:float = 2.0, v_min_m_per_s:float = 0.0,
+                pump_weight:float = 3.0, friction_factor:float = 0.02, change_penalty_w:float = 0.0, n_passes:int = 2,
+                ambient_temp = AmbientTemp, backend:str = "auto") -> dict:
+    """
+    Selects DN of all sections of a branch (supply line: DN not increasing along the flow, return line: DN not decreasing along the flow).
+
+    The first pass uses the inlet temperatures of the lines as fluid temperatures; every next pass solves the branch with the
+    selected profile (array kernel) and repeats the search with the mean section temperatures.
+    The DN of the input data are not used (only lengths, locations, take-offs and coordinates).
+
+    :param df_input_data: DataFrame with supply and return data (see data_input.py).
+    :param th_values: Pipe and insulation thickness data. Default: 'insulation_thickness.json' in the 'data' folder.
+    :param initial_values: BranchInitialConfig object. Default: BranchInitialConfig().
+    :param v_max_m_per_s, v_min_m_per_s, pump_weight, friction_factor, change_penalty_w: See size_line().
+    :param n_passes: Number of sizing passes (see above).
+    :param ambient_temp: AmbientTemp class or object. Default: AmbientTemp.
+    :param backend: 'auto', 'python' or 'numba'. See select_backend() in kernels.py.
+    :return result: Dictionary with:
+        - 'supply', 'return': DataFrames of size_line(),
+        - 'input_data': copy of the input data with the selected DN,
+        - 'summary': total heat flow loss, pumping power, maximum velocity and number of DN changes of both lines.
+
+    """
+    iv = initial_values or BranchInitialConfig()
+    th_all = th_values or read_thickness_data(thickness_data_location)
+    df_supply_in, df_return_in = split_input_data(df_input_data)
+
+    t_amb_table = np.array([ambient_temp.t_channel_c, ambient_temp.t_surface_c, ambient_temp.t_soil_c])
+    lines = {}
+    for direction, df_line_in, t_design_c in (("supply", df_supply_in, iv.t_in_supply_c), ("return", df_return_in, iv.t_in_return_c)):
+        location_code = encode_location(df_line_in["Location"])
+        lines[direction] = {
+            "l_m": df_line_in["L [m]"].to_numpy(dtype = np.float64),
+            "location_code": location_code,
+            "t_amb_c": t_amb_table[location_code],
+            "t_fluid_c": t_design_c,
+            "dn_table": build_dn_table(th_all, direction, calculate_fluid_density(iv.p_nominal_pa, t_design_c - TZERO, iv.fluid))
+        }
+
+    # Mass flows do not depend on DN:
+    takeoff_supply_kg_per_s = df_supply_in["mdot take-off [kg/s]"].to_numpy(dtype = np.float64)
+    mdot_in_kg_per_s = iv.vdot_m3_per_h * calculate_fluid_density(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid) / 3600
+    lines["supply"]["mdot_kg_per_s"] = mdot_in_kg_per_s + np.concatenate([[0.0], np.cumsum(takeoff_supply_kg_per_s)[:-1]])
+    consumer_return_kg_per_s = pair_return_consumers(takeoff_supply_kg_per_s, df_return_in["mdot take-off [kg/s]"].to_numpy(dtype = np.float64))
+    lines["return"]["mdot_kg_per_s"] = lines["supply"]["mdot_kg_per_s"][-1] + np.concatenate([[0.0], np.cumsum(consumer_return_kg_per_s)[:-1]])
+
+    for n_pass in range(n_passes):
+        sizing = {direction: size_line(line["l_m"], line["location_code"], line["mdot_kg_per_s"], line["t_fluid_c"], line["t_amb_c"], line["dn_table"],
+                                       v_max_m_per_s, v_min_m_per_s, pump_weight, friction_factor, change_penalty_w, reverse = direction == "return", backend = backend)
+                  for direction, line in lines.items()}
+        df_sized = apply_dn_profile(df_input_data, sizing["supply"]["DN [mm]"], sizing["return"]["DN [mm]"], th_all)
+        if n_pass == n_passes - 1:
+            break
+        # Mean section temperatures of the sized branch for the next pass:
+        df_supply_sized, df_return_sized = split_input_data(df_sized)
+        out_supply, out_return = solve_branch(build_section_arrays(df_supply_sized, "supply", th_all), build_section_arrays(df_return_sized, "return", th_all),
+                                              iv, backend = backend)
+        for direction, out, t_in_c in (("supply", out_supply, iv.t_in_supply_c), ("return", out_return, iv.t_in_return_c)):
+            lines[direction]["t_fluid_c"] = (np.concatenate([[t_in_c], out[:-1, COL_T]]) + out[:, COL_T]) / 2
+
+    summary = {}
+    for direction, df_sizing in sizing.items():
+        summary[direction] = {
+            "Qdot loss [W]": float(df_sizing["Qdot loss [W]"].sum()),
+            "P pump [W]": float(df_sizing["P pump [W]"].sum()),
+            "v max [m/s]": float(df_sizing["v [m/s]"].max()),
+            "DN changes": int((np.diff(df_sizing["DN [mm]"].to_numpy()) != 0).sum())
+        }
+    return {"supply": sizing["supply"], "return": sizing["return"], "input_data": df_sized, "summary": summary}
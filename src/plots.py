@@ -1,5 +1,6 @@
+import matplotlib
 import matplotlib.pyplot as plt
-from matplotlib import cm, colors
+from matplotlib import colors
 
 import plotly.graph_objects as go                                              
 import plotly.io as pio
@@ -14,10 +15,46 @@ else:
 import numpy as np
 import data_output
 import data_input
+from spatial_index import SpatialIndex
+
+
+_spatial_indexes = {}                                                          # {id(DataFrame): (DataFrame, SpatialIndex)} ---> built once per DataFrame
+
+
+def _viewport_mask(df, viewport) -> np.ndarray:
+    """
+    Returns a mask of the rows to plot in a viewport (lon_min, lat_min, lon_max, lat_max). Without a viewport all rows are plotted.
+
+    """
+    if viewport is None:
+        return np.ones(len(df), dtype = bool)
+    entry = _spatial_indexes.get(id(df))
+    if entry is None or entry[0] is not df:
+        if len(_spatial_indexes) >= 8:
+            _spatial_indexes.pop(next(iter(_spatial_indexes)))
+        entry = (df, SpatialIndex.from_frame(df))
+        _spatial_indexes[id(df)] = entry
+    return entry[1].viewport_mask(*viewport)
+
+
+def _clip_line(lons:np.ndarray, lats:np.ndarray, mask:np.ndarray) -> tuple:
+    """
+    Keeps the nodes of a line selected by the mask; gaps between the kept parts are broken with NaN (not connected by plotly).
+
+    """
+    index = np.flatnonzero(mask)
+    gaps = np.flatnonzero(np.diff(index) > 1) + 1
+    return np.insert(lons[index].astype(float), gaps, np.nan), np.insert(lats[index].astype(float), gaps, np.nan)
+
+
+def _map_centre(lons:np.ndarray, lats:np.ndarray, viewport) -> tuple:
+    if viewport is not None:
+        return (viewport[1] + viewport[3]) / 2, (viewport[0] + viewport[2]) / 2
+    return np.mean(lats), np.mean(lons)
 
 
 ### (1) INTERACTIVE PLOTTING - Plotly
-def plot_branch(direction:str) -> None:
+def plot_branch(direction:str, show:bool = True, viewport = None):
     """
     Reads data from the input DataFrames and plots the configuration of the analysed branch on top of a map. 
     
@@ -25,6 +62,9 @@ def plot_branch(direction:str) -> None:
             - 'supply': Plots only the supply line.
             - 'return': Plots only the return line.
             - 'all': Plots both lines on the same map.
+    :param show: If True, the figure is shown. Default: True.
+    :param viewport: Map area (lon_min, lat_min, lon_max, lat_max). Only sections in the area are plotted (see SpatialIndex). Default: all sections.
+    :return fig: Plotly figure.
         
     """    
     if data_input.df_supply_in.empty:
@@ -35,11 +75,10 @@ def plot_branch(direction:str) -> None:
         raise ValueError("Dataframe must have at least 2 rows to plot line segments.")
         return
     
-    lons_supply = data_input.df_supply_in["Longitude"].values
-    lats_supply = data_input.df_supply_in["Latitude"].values
-    
-    lons_return = data_input.df_return_in["Longitude"].values
-    lats_return = data_input.df_return_in["Latitude"].values
+    lons_supply, lats_supply = _clip_line(data_input.df_supply_in["Longitude"].values, data_input.df_supply_in["Latitude"].values,
+                                          _viewport_mask(data_input.df_supply_in, viewport))
+    lons_return, lats_return = _clip_line(data_input.df_return_in["Longitude"].values, data_input.df_return_in["Latitude"].values,
+                                          _viewport_mask(data_input.df_return_in, viewport))
 
     # Trace for lines - supply
     line_trace_supply = go.Scattermapbox(
@@ -79,8 +118,7 @@ def plot_branch(direction:str) -> None:
     )
     
     # Centering the map
-    centre_lat = np.mean(lats_supply)
-    centre_lon = np.mean(lons_supply)
+    centre_lat, centre_lon = _map_centre(data_input.df_supply_in["Longitude"].values, data_input.df_supply_in["Latitude"].values, viewport)
     
     # Selects the direction of the flow
     if direction.lower() == "supply":
@@ -104,16 +142,21 @@ def plot_branch(direction:str) -> None:
         margin = dict(l = 0, r = 0, t = 25, b = 0),
         title = map_title
     )
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
 
-def plot_insulation(direction:str) -> None: 
+def plot_insulation(direction:str, show:bool = True, viewport = None): 
     """
     Reads data from the input DataFrames and plots insulation thickness of the analysed branch on top of a map. 
     
     :param direction: Chooses the direction of the pipeline to plot. Options:
             - 'supply': Plots only the supply line.
             - 'return': Plots only the return line.
+    :param show: If True, the figure is shown. Default: True.
+    :param viewport: Map area (lon_min, lat_min, lon_max, lat_max). Only sections in the area are plotted (see SpatialIndex). Default: all sections.
+    :return fig: Plotly figure.
         
     """
     if data_input.df_supply_in.empty:
@@ -121,10 +164,10 @@ def plot_insulation(direction:str) -> None:
         return
     
     if direction.lower() == "supply":
-        df = data_input.df_supply_in.copy()
+        df = data_input.df_supply_in
         title_ins = "Original insulation thickness - supply"
     elif direction.lower() == "return":
-        df = data_input.df_return_in.copy()
+        df = data_input.df_return_in
         title_ins = "Original insulation thickness - return"
     else:
         raise ValueError("Direction must be either 'supply' or 'return'.")
@@ -133,18 +176,19 @@ def plot_insulation(direction:str) -> None:
     lons = df["Longitude"].values
     lats = df["Latitude"].values
     thickness = df["Insulation"].astype(float).values   
+    mask = _viewport_mask(df, viewport)
 
     # Check values are in valid range - Must be in [0, 1]
     if not np.all((0 <= thickness) & (thickness <= 1)):
         raise ValueError("Insulation thickness values must be between 0 and 1.")
         
     # Get color from Turbo colormap
-    cmap = cm.get_cmap('turbo')
-    #cmap = cm.get_cmap('hot')
+    cmap = matplotlib.colormaps['turbo']
+    #cmap = matplotlib.colormaps['hot']
     hex_colors = [colors.to_hex(cmap(t)) for t in thickness]
     # Create line segments with manually assigned colors
     line_traces = []
-    for i in range(len(df) - 1):
+    for i in np.flatnonzero(mask[:-1] & mask[1:]):
         segment = go.Scattermapbox(
             lon = [lons[i], lons[i + 1]],
             lat = [lats[i], lats[i + 1]],
@@ -159,8 +203,8 @@ def plot_insulation(direction:str) -> None:
         line_traces.append(segment)
     # Add black node markers
     node_trace = go.Scattermapbox(
-        lon = lons,
-        lat = lats,
+        lon = lons[mask],
+        lat = lats[mask],
         mode = 'markers',
         marker = dict(size = 8, color = 'black'),
         name= 'Nodes',
@@ -168,8 +212,7 @@ def plot_insulation(direction:str) -> None:
         hoverinfo = 'skip'
     )
     # Calculate map center (before using it in the colorbar trace)
-    centre_lat = np.mean(lats)
-    centre_lon = np.mean(lons)
+    centre_lat, centre_lon = _map_centre(lons, lats, viewport)
     
     # Dummy trace for colorbar
     colorbar_trace = go.Scattermapbox(
@@ -205,10 +248,12 @@ def plot_insulation(direction:str) -> None:
         margin = dict(l = 0, r = 0, t = 25, b = 0),
         title = title_ins
     )
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
 
-def plot_output_heatmap(direction:str, value_column:str) -> None:
+def plot_output_heatmap(direction:str, value_column:str, show:bool = True, viewport = None):
     """
     Reads data from the output DataFrames and plots line segments on a map using longitude, latitude, and a value column for colouring.
     
@@ -216,6 +261,9 @@ def plot_output_heatmap(direction:str, value_column:str) -> None:
             - 'supply': Plots only the supply line.
             - 'return': Plots only the return line.
     :param value_column: Column in the DataFrame to use for coloring the segments.
+    :param show: If True, the figure is shown. Default: True.
+    :param viewport: Map area (lon_min, lat_min, lon_max, lat_max). Only sections in the area are plotted (see SpatialIndex). Default: all sections.
+    :return fig: Plotly figure.
         
     """
     if direction.lower() == "supply":
@@ -239,6 +287,7 @@ def plot_output_heatmap(direction:str, value_column:str) -> None:
     lons = data_df["Longitude"].values
     lats = data_df["Latitude"].values
     values = data_df[value_column].astype(float).values
+    mask = _viewport_mask(data_df, viewport)
 
     # Use values at the *end* of each segment for colouring
     #values_for_segments = values[1:]
@@ -249,13 +298,13 @@ def plot_output_heatmap(direction:str, value_column:str) -> None:
     norm_values = (values_for_segments - vmin) / (vmax - vmin + 1e-12)
 
     # Get colours (colour scale)
-    cmap = cm.get_cmap("turbo")
-    #cmap = cm.get_cmap("hot")
+    cmap = matplotlib.colormaps["turbo"]
+    #cmap = matplotlib.colormaps["hot"]
     hex_colors = [colors.to_hex(cmap(v)) for v in norm_values]
 
     # Create line segments between consecutive points
     line_traces = []
-    for i in range(len(data_df) - 1):
+    for i in np.flatnonzero(mask[:-1] & mask[1:]):
         trace = go.Scattermapbox(
             lon = [lons[i], lons[i + 1]],
             lat = [lats[i], lats[i + 1]],
@@ -271,8 +320,8 @@ def plot_output_heatmap(direction:str, value_column:str) -> None:
 
     # Optional node markers
     node_trace = go.Scattermapbox(
-        lon = lons,
-        lat = lats,
+        lon = lons[mask],
+        lat = lats[mask],
         mode = 'markers',
         marker = dict(size = 7, color = 'black'),
         #name = 'Node',
@@ -302,8 +351,7 @@ def plot_output_heatmap(direction:str, value_column:str) -> None:
     )
 
     # Centre of the map
-    centre_lat = np.mean(lats)
-    centre_lon = np.mean(lons)
+    centre_lat, centre_lon = _map_centre(lons, lats, viewport)
 
     # Build the figure
     fig = go.Figure(data = line_traces + [node_trace, colorbar_trace])
@@ -316,7 +364,9 @@ def plot_output_heatmap(direction:str, value_column:str) -> None:
         margin = dict(l = 0, r = 0, t = 25, b = 0),
         title = title_graph
     )
-    fig.show()
+    if show:
+        fig.show()
+    return fig
 
 
 #>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>  
@@ -515,8 +565,8 @@ def plot_heat_flow_loss_nodes(direction:str) -> None:
          df_out["Longitude"],
          df_out["Latitude"],
          c = colorQ,
-         cmap = plt.cm.get_cmap("turbo")
-         #cmap=plt.cm.get_cmap("hot")
+         cmap = matplotlib.colormaps["turbo"]
+         #cmap=matplotlib.colormaps["hot"]
     )
     # Add vertical colourbar
     cbar = plt.colorbar(
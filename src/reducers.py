@@ -0,0 +1,288 @@
+import numpy as np
+import pandas as pd
+
+from kernels import pipe_columns, COL_T, COL_MDOT, COL_QDOT_LOSS, COL_QDOTNORM_LOSS, COL_V, COL_QDOT_CONSUMER_ACT
+
+
+#==============================================================================
+DEFAULT_COLUMNS = (COL_T, COL_MDOT, COL_QDOT_LOSS, COL_QDOTNORM_LOSS, COL_V, COL_QDOT_CONSUMER_ACT)
+_MIN_EXPONENT = -1000                                                          # bucket width of empty cells (2^-1000)
+
+
+#==========================| MOMENTS |=========================================
+class RunningMoments:
+    """
+    Count, mean, sum of squared deviations, minimum and maximum of many cells (e.g. sections x columns), updated with batches of
+    samples. Batches and accumulators are combined with the parallel form of Welford's algorithm (Chan et al.), so the result does
+    not depend on how the samples are split between batches or processes (up to rounding). Non-finite values are ignored.
+
+    """
+
+    def __init__(self, shape):
+        self.count = np.zeros(shape, dtype = np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def _combine(self, count, mean, m2, minimum, maximum) -> None:
+        count_total = self.count + count
+        share = np.divide(count, count_total, out = np.zeros(count_total.shape), where = count_total > 0)
+        delta = mean - self.mean
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * share
+        self.mean = self.mean + delta * share
+        self.count = count_total
+        self.min = np.minimum(self.min, minimum)
+        self.max = np.maximum(self.max, maximum)
+
+    def update(self, values:np.ndarray) -> None:
+        """
+        :param values: Samples x cells (shape of the accumulator).
+
+        """
+        finite = np.isfinite(values)
+        if finite.all():
+            count = np.full(values.shape[1:], len(values))
+            mean = values.mean(axis = 0)
+            m2 = ((values - mean) ** 2).sum(axis = 0)
+            minimum, maximum = values.min(axis = 0), values.max(axis = 0)
+        else:
+            count = finite.sum(axis = 0)
+            mean = np.divide(np.where(finite, values, 0.0).sum(axis = 0), count, out = np.zeros(count.shape), where = count > 0)
+            m2 = (np.where(finite, values - mean, 0.0) ** 2).sum(axis = 0)
+            minimum = np.where(finite, values, np.inf).min(axis = 0)
+            maximum = np.where(finite, values, -np.inf).max(axis = 0)
+        self._combine(count, mean, m2, minimum, maximum)
+
+    def merge(self, other:"RunningMoments") -> None:
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def variance(self, ddof:int = 1) -> np.ndarray:
+        return np.divide(self.m2, self.count - ddof, out = np.full(self.m2.shape, np.nan), where = self.count > ddof)
+
+
+#==========================| QUANTILE SKETCH |=================================
+class QuantileSketch:
+    """
+    Mergeable quantile sketch for many cells at once: a histogram of n_buckets counts per cell on an aligned grid with a bucket
+    width of a power of two. When the values of a cell no longer fit into the buckets, the width of the cell is doubled (adjacent
+    buckets are added) until they fit, so memory does not depend on the number of samples. Because the grids of all widths are
+    aligned, sketches of different processes are merged exactly by bringing them to the same width and adding the counts.
+
+    Quantiles are interpolated within the bucket; the error is below one bucket width, i.e. about 2 x (max - min) / n_buckets of
+    the cell (e.g. < 0.5 K for temperatures spreading 30 K with 128 buckets).
+
+    """
+
+    def __init__(self, n_cells:int, n_buckets:int = 128):
+        """
+        :param n_cells: Number of cells (e.g. sections x columns).
+        :param n_buckets: Buckets per cell (>= 8).
+
+        """
+        if n_buckets < 8:
+            raise ValueError("Quantile sketch needs at least 8 buckets.")
+        self.n_cells = n_cells
+        self.n_buckets = n_buckets
+        self.counts = np.zeros((n_cells, n_buckets), dtype = np.uint32)        # up to 4.29e9 samples per cell
+        self.exponent = np.full(n_cells, _MIN_EXPONENT, dtype = np.int64)      # bucket width = 2^exponent
+        self.offset = np.zeros(n_cells, dtype = np.int64)                      # grid index of the first bucket
+        self.min = np.full(n_cells, np.inf)
+        self.max = np.full(n_cells, -np.inf)
+
+    def _rescale(self, minimum:np.ndarray, maximum:np.ndarray, exponent:np.ndarray = None) -> None:
+        """
+        Widens the range of the cells to [minimum, maximum] (and at least 2^exponent wide buckets), coarsens and moves the counts.
+
+        """
+        minimum, maximum = np.minimum(self.min, minimum), np.maximum(self.max, maximum)
+        filled = minimum <= maximum
+        minimum_0, maximum_0 = np.where(filled, minimum, 0.0), np.where(filled, maximum, 0.0)
+
+        # Smallest width with all values in n_buckets - 1 buckets, not so small that grid indices overflow:
+        with np.errstate(divide = "ignore"):
+            required = np.ceil(np.log2((maximum_0 - minimum_0) / (self.n_buckets - 2)))
+            required = np.maximum(required, np.ceil(np.log2(np.maximum(np.abs(minimum_0), np.abs(maximum_0)))) - 60)
+        new_exponent = np.maximum(self.exponent, np.maximum(required, _MIN_EXPONENT).astype(np.int64))
+        if exponent is not None:
+            new_exponent = np.maximum(new_exponent, exponent)
+        new_offset = np.where(filled, np.floor(np.ldexp(minimum_0, -new_exponent)), 0).astype(np.int64)
+
+        moved = np.flatnonzero((new_exponent != self.exponent) | (new_offset != self.offset))
+        if len(moved):
+            self.counts[moved] = self._shifted(moved, self.counts[moved], self.exponent[moved], self.offset[moved],
+                                               new_exponent[moved], new_offset[moved])
+        self.exponent, self.offset, self.min, self.max = new_exponent, new_offset, minimum, maximum
+
+    def _shifted(self, cells:np.ndarray, counts:np.ndarray, exponent:np.ndarray, offset:np.ndarray, new_exponent:np.ndarray,
+                 new_offset:np.ndarray) -> np.ndarray:
+        """
+        Counts of cells re-indexed from the grid (exponent, offset) to the grid (new_exponent, new_offset).
+
+        """
+        index = offset[:, None] + np.arange(self.n_buckets)
+        index = np.right_shift(index, np.minimum(new_exponent - exponent, 63)[:, None]) - new_offset[:, None]
+        index = np.clip(index, 0, self.n_buckets - 1) + np.arange(len(cells))[:, None] * self.n_buckets
+        shifted = np.bincount(index.ravel(), weights = counts.ravel(), minlength = len(cells) * self.n_buckets)
+        return shifted.reshape(len(cells), self.n_buckets).astype(np.uint32)
+
+    def update(self, values:np.ndarray) -> None:
+        """
+        :param values: Samples x cells. Non-finite values are ignored.
+
+        """
+        values = np.asarray(values, dtype = np.float64).reshape(-1, self.n_cells)
+        finite = np.isfinite(values)
+        all_finite = finite.all()
+        if all_finite:
+            self._rescale(values.min(axis = 0), values.max(axis = 0))
+        else:
+            self._rescale(np.where(finite, values, np.inf).min(axis = 0), np.where(finite, values, -np.inf).max(axis = 0))
+            values = np.where(finite, values, 0.0)
+        # Scaling by a power of two is exact ---> grid indices do not depend on the batches:
+        index = np.floor(values * np.ldexp(1.0, -self.exponent)).astype(np.int64)
+        index -= self.offset
+        np.clip(index, 0, self.n_buckets - 1, out = index)
+        index += np.arange(self.n_cells) * self.n_buckets
+        self.counts += np.bincount(index.ravel() if all_finite else index[finite], minlength = self.counts.size
+                                   ).reshape(self.counts.shape).astype(np.uint32)
+
+    def merge(self, other:"QuantileSketch") -> None:
+        if (other.n_cells, other.n_buckets) != (self.n_cells, self.n_buckets):
+            raise ValueError("Only sketches with the same number of cells and buckets can be merged.")
+        self._rescale(other.min, other.max, other.exponent)
+        filled = np.flatnonzero(other.min <= other.max)
+        self.counts[filled] += self._shifted(filled, other.counts[filled], other.exponent[filled], other.offset[filled],
+                                             self.exponent[filled], self.offset[filled])
+
+    def quantile(self, q:float) -> np.ndarray:
+        """
+        :param q: Quantile (0 ... 1).
+        :return values: Estimate of each cell (NaN for cells without values).
+
+        """
+        cumulative = np.cumsum(self.counts, axis = 1, dtype = np.int64)
+        total = cumulative[:, -1]
+        rank = q * np.maximum(total - 1, 0) + 0.5
+        bucket = np.minimum((cumulative < rank[:, None]).sum(axis = 1), self.n_buckets - 1)
+        cells = np.arange(self.n_cells)
+        count = self.counts[cells, bucket].astype(np.float64)
+        below = cumulative[cells, bucket] - count
+        fraction = np.divide(rank - below, count, out = np.full(self.n_cells, 0.5), where = count > 0)
+        values = np.ldexp(self.offset + bucket + fraction, self.exponent)
+        return np.where(total > 0, np.clip(values, self.min, self.max), np.nan)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.counts, self.exponent, self.offset, self.min, self.max))
+
+
+#==========================| SECTION REDUCER |=================================
+class SectionReducer:
+    """
+    Streaming statistics of the output arrays of one line (supply or return) over many samples (scenarios, Monte Carlo samples, ...):
+    mean, standard deviation, minimum, maximum and quantiles per section and output column (columns of PipeRow, see pipe_columns).
+    Samples are consumed in batches and discarded, so memory grows with the number of sections only. Reducers of worker processes
+    are combined with merge() (reducers are picklable).
+
+    Means and standard deviations are exact (up to rounding); quantiles have the accuracy of the sketch (see QuantileSketch).
+
+    """
+
+    def __init__(self, n_sections:int, columns = DEFAULT_COLUMNS, n_buckets:int = 128):
+        """
+        :param n_sections: Number of sections of the line.
+        :param columns: Output columns (positions or names of pipe_columns). Default: T, mdot, Qdot loss, qdot loss, v and Qdot consumer actual.
+        :param n_buckets: Buckets of the quantile sketches per section and column (see QuantileSketch).
+
+        """
+        self.n_sections = n_sections
+        self.columns = tuple(pipe_columns.index(column) if isinstance(column, str) else int(column) for column in columns)
+        self.moments = RunningMoments((n_sections, len(self.columns)))
+        self.sketch = QuantileSketch(n_sections * len(self.columns), n_buckets)
+
+    def update(self, outputs:np.ndarray) -> None:
+        """
+        Adds samples.
+
+        :param outputs: Output arrays of solve_branch() (sections x 13) or a batch of them (samples x sections x 13),
+            e.g. ParallelResult.supply.
+
+        """
+        outputs = np.asarray(outputs)
+        if outputs.ndim == 2:
+            outputs = outputs[None]
+        if outputs.shape[1] != self.n_sections:
+            raise ValueError(f"Output arrays have {outputs.shape[1]} sections, the reducer {self.n_sections}.")
+        values = outputs[:, :, self.columns]
+        self.moments.update(values)
+        self.sketch.update(values.reshape(len(values), -1))
+
+    def merge(self, other:"SectionReducer") -> "SectionReducer":
+        """
+        Adds the samples of another reducer (same sections, columns and sketch settings).
+
+        """
+        if (other.n_sections, other.columns) != (self.n_sections, self.columns):
+            raise ValueError("Only reducers with the same sections and columns can be merged.")
+        self.sketch.merge(other.sketch)
+        self.moments.merge(other.moments)
+        return self
+
+
+    #______________________ Statistics ________________________________________
+
+    def _select(self, array:np.ndarray, column):
+        if column is None:
+            return array
+        column = pipe_columns.index(column) if isinstance(column, str) else int(column)
+        if column not in self.columns:
+            raise KeyError(f"Column {pipe_columns[column]} is not reduced. Reduced columns: {[pipe_columns[c] for c in self.columns]}.")
+        return array[:, self.columns.index(column)]
+
+    @property
+    def count(self) -> np.ndarray:
+        return self.moments.count
+
+    def mean(self, column = None) -> np.ndarray:
+        """
+        :param column: Position or name of a column. Default: all reduced columns (sections x columns).
+
+        """
+        return self._select(np.where(self.moments.count > 0, self.moments.mean, np.nan), column)
+
+    def std(self, column = None, ddof:int = 1) -> np.ndarray:
+        return self._select(np.sqrt(self.moments.variance(ddof)), column)
+
+    def min(self, column = None) -> np.ndarray:
+        return self._select(np.where(self.moments.count > 0, self.moments.min, np.nan), column)
+
+    def max(self, column = None) -> np.ndarray:
+        return self._select(np.where(self.moments.count > 0, self.moments.max, np.nan), column)
+
+    def quantile(self, q:float, column = None) -> np.ndarray:
+        """
+        :param q: Quantile (0 ... 1), e.g. 0.95.
+
+        """
+        values = self.sketch.quantile(q).reshape(self.n_sections, len(self.columns))
+        values = np.clip(values, self.moments.min, self.moments.max)
+        return self._select(values, column)
+
+    def to_frame(self, quantiles:tuple = (0.05, 0.5, 0.95)) -> pd.DataFrame:
+        """
+        Statistics as a DataFrame (one row per section), columns e.g. 'T [°C] mean', 'T [°C] std', 'T [°C] p95'.
+
+        """
+        statistics = {"mean": self.mean(), "std": self.std(), "min": self.min(), "max": self.max()}
+        statistics.update({f"p{100 * q:g}": self.quantile(q) for q in quantiles})
+        data = {}
+        for i, column in enumerate(self.columns):
+            for name, values in statistics.items():
+                data[f"{pipe_columns[column]} {name}"] = values[:, i]
+        return pd.DataFrame(data)
+
+    @property
+    def nbytes(self) -> int:
+        moments = self.moments
+        return self.sketch.nbytes + sum(a.nbytes for a in (moments.count, moments.mean, moments.m2, moments.min, moments.max))
@@ -0,0 +1,276 @@
+import os
+import json
+import zipfile
+import hashlib
+from dataclasses import asdict, fields
+
+import numpy as np
+import pandas as pd
+
+import data_output
+from data_output import pipe_columns_names_types, system_columns_names_types, SolverDiagnostics
+from config_data import AmbientTemp
+from model_param import ThermalCoeff
+from utils.constants import SOLVER_VERSION
+
+
+#==============================================================================
+# Default location of the cache (one file per cached run):
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".dhnpype_cache")
+
+
+#==========================| RESULT CACHE |====================================
+class ResultCache:
+    """
+    Content-addressed on-disk cache for the results of a branch calculation.
+    Each entry is stored in a single binary NPZ file named after the hash of all inputs of the calculation.
+
+    Attributes:
+        cache_dir (str): Folder with the cached results.
+        max_size_bytes (int): Maximum size of the cache folder. The least recently used entries are removed when the size is exceeded.
+        enabled (bool): If False, the cache is bypassed - nothing is read from or written to the disk.
+
+    """
+
+    _FILE_EXTENSION = ".npz"
+    _DIAGNOSTICS_LINES = ("supply", "return")
+
+    def __init__(self, cache_dir: str = None, max_size_bytes: int = 256 * 1024**2, enabled: bool = True):
+        """
+        Constructs attributes for the ResultCache class.
+
+        :param cache_dir: Folder with the cached results. Default: '.dhnpype_cache' in the user's home folder.
+        :param max_size_bytes: Maximum size of the cache in [bytes]. Default: 256 MB.
+        :param enabled: Switches the cache on or off. Default: True.
+
+        """
+        self.cache_dir = cache_dir or default_cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.enabled = enabled
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok = True)
+
+
+    #______________________ Helper methods ____________________________________
+
+    def _entry_path(self, key:str) -> str:
+        """
+        Returns the path of the cache file for a given key.
+
+        """
+        return os.path.join(self.cache_dir, key + self.__class__._FILE_EXTENSION)
+
+
+    def _list_entries(self) -> list:
+        """
+        Returns (path, size, last access time) of all cache files.
+
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(self.__class__._FILE_EXTENSION):
+                path = os.path.join(self.cache_dir, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:                                      # removed by another process in the meantime
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+
+    def size_bytes(self) -> int:
+        """
+        Returns the total size of the cache in [bytes].
+
+        """
+        if not self.enabled:
+            return 0
+        return sum(size for _, size, _ in self._list_entries())
+
+
+    def _evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache is smaller than max_size_bytes.
+
+        """
+        entries = sorted(self._list_entries(), key = lambda entry: entry[2])   # oldest access first
+        size_total = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if size_total <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size_total -= size
+
+
+    #______________________ Reading & writing _________________________________
+
+    def get(self, key:str):
+        """
+        Reads cached results.
+
+        :param key: Hash of the inputs (see calculate_input_hash()).
+        :return frames: Dictionary with 'supply', 'return' and 'system' DataFrames and 'diagnostics' (SolverDiagnostics of the lines, see put())
+                        or None if the key is not in the cache.
+
+        """
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            with np.load(path, allow_pickle = False) as npz:
+                frames = {
+                    "supply": pd.DataFrame(npz["supply"], columns = list(pipe_columns_names_types.keys())),
+                    "return": pd.DataFrame(npz["return"], columns = list(pipe_columns_names_types.keys())),
+                    "system": pd.DataFrame(npz["system"], columns = list(system_columns_names_types.keys())),
+                    "diagnostics": {
+                        line: SolverDiagnostics(npz[f"{line}_iterations"], npz[f"{line}_residual"], npz[f"{line}_clamped"],
+                                                float(npz[f"{line}_tolerance"]), int(npz[f"{line}_max_iterations"]))
+                        for line in self.__class__._DIAGNOSTICS_LINES if f"{line}_iterations" in npz.files
+                    }
+                }
+        except FileNotFoundError:                                              # missing entry ---> miss
+            return None
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):  # damaged entry (e.g. truncated file) ---> miss, entry removed
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        os.utime(path)                                                         # marks the entry as recently used (LRU)
+        return frames
+
+
+    def put(self, key:str, frames:dict) -> None:
+        """
+        Writes results to the cache and evicts the least recently used entries if the cache is too large.
+
+        :param key: Hash of the inputs (see calculate_input_hash()).
+        :param frames: Dictionary with 'supply', 'return' and 'system' DataFrames and optionally 'diagnostics'
+                       (dictionary with SolverDiagnostics objects of the lines, e.g. Branch.diagnostics).
+
+        """
+        if not self.enabled:
+            return
+
+        diagnostics = {}
+        for line, line_diagnostics in frames.get("diagnostics", {}).items():
+            diagnostics.update({
+                f"{line}_iterations": line_diagnostics.iterations,
+                f"{line}_residual": line_diagnostics.residual,
+                f"{line}_clamped": line_diagnostics.clamped,
+                f"{line}_tolerance": np.float64(line_diagnostics.tolerance),
+                f"{line}_max_iterations": np.int64(line_diagnostics.max_iterations)
+            })
+
+        path = self._entry_path(key)
+        path_tmp = f"{path}.{os.getpid()}.tmp"
+        with open(path_tmp, "wb") as cache_file:
+            np.savez(cache_file, **{                                           # 'return' is a Python keyword ---> arrays are passed as a dict
+                "supply": frames["supply"][list(pipe_columns_names_types.keys())].to_numpy(dtype = np.float64),
+                "return": frames["return"][list(pipe_columns_names_types.keys())].to_numpy(dtype = np.float64),
+                "system": frames["system"][list(system_columns_names_types.keys())].to_numpy(dtype = np.float64),
+                **diagnostics
+            })
+        os.replace(path_tmp, path)                                             # atomic ---> readers never see a partially written file
+
+        self._evict()
+
+
+    def clear(self) -> None:
+        """
+        Removes all entries from the cache.
+
+        """
+        if not self.enabled:
+            return
+        for path, _, _ in self._list_entries():
+            os.remove(path)
+
+
+#==========================| INPUT HASH |======================================
+def calculate_input_hash(network, df_input_data:pd.DataFrame) -> str:
+    """
+    Calculates the hash of all inputs that affect the results of a branch calculation:
+        - input data (network/branch topology),
+        - pipe & insulation thickness data,
+        - BranchInitialConfig, ThermalCoeff and AmbientTemp values,
+        - damage settings, solver tolerance and maximum number of iterations of the Branch object,
+        - solver version.
+
+    :param network: Branch object.
+    :param df_input_data: DataFrame with the input data (supply and return).
+    :return key: SHA-256 hash in hexadecimal form.
+
+    """
+    sha = hashlib.sha256()
+
+    # (i) Input data - content of the DataFrame (independent of the file it was read from):
+    sha.update(json.dumps(list(map(str, df_input_data.columns))).encode())
+    sha.update(pd.util.hash_pandas_object(df_input_data, index = False).to_numpy().tobytes())
+
+    # (ii) Parameters:
+    parameters = {
+        "solver_version": SOLVER_VERSION,
+        "thickness_data": network.th_all,
+        "initial_values": asdict(network.iv),
+        "thermal_coeff": {f.name: getattr(ThermalCoeff, f.name) for f in fields(ThermalCoeff)},       # class attributes ---> values used in the calculations
+        "ambient_temp": {f.name: getattr(AmbientTemp, f.name) for f in fields(AmbientTemp)},
+        "damage_mode": network.ins_damage_mode,
+        "damage_avg": network.th_ins_damage_avg_m,
+        "damage_element": network.th_ins_damage_elem_percent,
+        "tolerance": network.tolerance,
+        "max_iterations": network.max_iterations
+    }
+    sha.update(json.dumps(parameters, sort_keys = True, default = str).encode())
+
+    return sha.hexdigest()
+
+
+#==========================| CACHED RUN |======================================
+def run_branch_cached(network, cache:ResultCache = None, use_cache:bool = True) -> dict:
+    """
+    Runs the supply, return and system calculations of a branch or reads their results from the cache.
+    On a cache hit the DataFrames in data_output.py are replaced with the cached results, so the plotting functions work as usual,
+    and the solver diagnostics of the cached run are restored in network.diagnostics.
+
+    :param network: Branch object.
+    :param cache: ResultCache object. Default: ResultCache with default settings.
+    :param use_cache: If False, the cache is bypassed and the calculations are always run (results are not stored).
+    :return frames: Dictionary with 'supply', 'return' and 'system' DataFrames.
+
+    """
+    import data_input
+
+    if not use_cache:
+        cache = ResultCache(enabled = False)
+    cache = cache or ResultCache()
+
+    key = calculate_input_hash(network, data_input.df_input_data) if cache.enabled else None
+    frames = cache.get(key) if cache.enabled else None
+
+    if frames is not None:
+        data_output.df_supply_out = frames["supply"]
+        data_output.df_return_out = frames["return"]
+        data_output.df_system_out = frames["system"]
+        network.diagnostics = frames.pop("diagnostics")
+        return frames
+
+    data_output.clear_output_frames()                                          # the Branch methods append rows ---> no rows of an earlier (e.g. cached) run
+    network.calculate_supply()
+    network.calculate_return()
+    network.calculate_system_heat_flow()
+
+    frames = {
+        "supply": data_output.df_supply_out,
+        "return": data_output.df_return_out,
+        "system": data_output.df_system_out
+    }
+    cache.put(key, {**frames, "diagnostics": network.diagnostics})
+    return frames
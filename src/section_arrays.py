@@ -0,0 +1,256 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, replace
+
+from config_data import AmbientTemp
+from model_param import ThermalCoeff, PipeSectionLocation
+from utils.functions import (calculate_pipe_internal_diameter, calculate_insulation_external_diameter, calculate_r_total, )
+
+
+#==============================================================================
+# Integer codes of the pipe section locations (order of the PipeSectionLocation class):
+location_codes = {location.value: code for code, location in enumerate(PipeSectionLocation)}   # {'channel': 0, 'surface': 1, 'soil': 2}
+
+_DAMAGE_MODE_AVERAGE = "average"
+_DAMAGE_MODE_ELEMENT = "element"
+
+
+#==========================| SECTION ARRAYS |==================================
+@dataclass
+class SectionArrays:
+    """
+    Geometry, coefficients and thermal resistance of all sections of one line (supply or return) stored as NumPy arrays.
+    Computed once for the whole line with vectorized operations and used by the array-based solvers.
+
+    :param direction: 'supply' or 'return'.
+    :param lat: Latitude of the sections.
+    :param lon: Longitude of the sections.
+    :param l_m: Section lengths in [m].
+    :param d_nom_mm: Nominal diameters (DN) in [mm].
+    :param d_ext_m: Pipe external diameters in [m].
+    :param d_int_m: Pipe internal diameters in [m].
+    :param th_ins_catalog_m: Intact insulation thickness from the thickness data in [m].
+    :param d_ins_ext_m: Insulation external diameters in [m].
+    :param k_ins_w_per_mk: Insulation conductivity in [W/mK].
+    :param h_loc_w_per_m2k: Heat transfer coefficient insulation to ambient in [W/m²K].
+    :param t_amb_c: Ambient temperature in [°C].
+    :param r_tot_w_per_k: Total thermal resistance in [K/W].
+    :param mdot_takeoff_kg_per_s: Consumer take-off at each node in [kg/s].
+    :param location_code: Integer code of the location (see location_codes).
+    :param insulation: State of insulation read from the input data.
+
+    """
+    direction: str
+    lat: np.ndarray
+    lon: np.ndarray
+    l_m: np.ndarray
+    d_nom_mm: np.ndarray
+    d_ext_m: np.ndarray
+    d_int_m: np.ndarray
+    th_ins_catalog_m: np.ndarray
+    d_ins_ext_m: np.ndarray
+    k_ins_w_per_mk: np.ndarray
+    h_loc_w_per_m2k: np.ndarray
+    t_amb_c: np.ndarray
+    r_tot_w_per_k: np.ndarray
+    mdot_takeoff_kg_per_s: np.ndarray
+    location_code: np.ndarray
+    insulation: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.l_m)
+
+
+#______________________ Helper functions ______________________________________
+
+def encode_location(location) -> np.ndarray:
+    """
+    Converts location names to integer codes.
+
+    :param location: Location names of the sections ('channel', 'surface', 'soil').
+    :return codes: Integer codes of the locations (see location_codes).
+
+    """
+    location = pd.Series(location, copy = False).astype(str)
+    codes = location.map(location_codes)
+    if codes.isna().any():
+        unknown = sorted(set(location[codes.isna()]))
+        raise ValueError(f"Unknown location(s) {unknown}. Must be one of: 'soil', 'channel', or 'surface'.")
+    return codes.to_numpy(dtype = np.int8)
+
+
+def lookup_by_dn(d_nom_mm:np.ndarray, table:dict, table_name:str) -> np.ndarray:
+    """
+    Reads values for each section from a table with DN as keys (e.g. 'th_pipe' from the JSON file).
+
+    :param d_nom_mm: Nominal diameters of the sections in [mm].
+    :param table: Dictionary {DN (str): value}.
+    :param table_name: Name of the table (used in the error message).
+    :return values: Values for each section.
+
+    """
+    dn_keys = np.array(sorted(table.keys(), key = int))
+    dn_values = np.array([table[dn] for dn in dn_keys], dtype = np.float64)
+    dn_int = dn_keys.astype(np.int64)
+
+    d_nom_mm = np.asarray(d_nom_mm).astype(np.int64)
+    idx = np.searchsorted(dn_int, d_nom_mm)
+    idx_clipped = np.minimum(idx, len(dn_int) - 1)
+    missing = dn_int[idx_clipped] != d_nom_mm
+    if missing.any():
+        raise KeyError(f"Nominal pipe size(s) {sorted(set(d_nom_mm[missing].tolist()))} not found in '{table_name}' data. Available sizes: {list(dn_keys)}")
+    return dn_values[idx_clipped]
+
+
+def calculate_insulation_state(insulation:np.ndarray, th_ins_catalog_m:np.ndarray, damage_mode:str = _DAMAGE_MODE_AVERAGE,
+                               th_ins_damage_avg_m:float = 0.017, thermal_coeff = ThermalCoeff) -> tuple:
+    """
+    Calculates insulation thickness and conductivity of the sections depending on the damage mode (see the Branch class).
+
+    :param insulation: State of insulation read from the input data.
+    :param th_ins_catalog_m: Intact insulation thickness in [m].
+    :param damage_mode: 'average' or 'element'.
+    :param th_ins_damage_avg_m: Average thickness of the damaged insulation in [m] (for the 'average' damage mode).
+    :param thermal_coeff: ThermalCoeff class or object. Default: ThermalCoeff.
+    :returns:
+        th_ins_m: Insulation thickness in [m]
+        k_ins_w_per_mk: Insulation conductivity in [W/mK]
+
+    """
+    if damage_mode == _DAMAGE_MODE_AVERAGE:                                    # 0 in the input file ---> average damaged thickness & conductivity of the damaged insulation
+        damaged = insulation == 0
+        th_ins_m = np.where(damaged, th_ins_damage_avg_m, th_ins_catalog_m)
+        k_ins_w_per_mk = np.where(damaged, thermal_coeff.k_ins_damaged_w_per_mk, thermal_coeff.k_ins_w_per_mk)
+    elif damage_mode == _DAMAGE_MODE_ELEMENT:                                  # residual thickness of each element in [%] of the intact thickness
+        th_ins_m = th_ins_catalog_m * insulation
+        k_ins_w_per_mk = np.full(np.shape(insulation), thermal_coeff.k_ins_w_per_mk)
+    else:
+        raise ValueError("Invalid damage mode. Use 'average' or 'element'.")
+    return th_ins_m, k_ins_w_per_mk
+
+
+#==========================| BUILDING ARRAYS |=================================
+def build_section_arrays(df_line_in:pd.DataFrame, direction:str, th_all:dict, damage_mode:str = _DAMAGE_MODE_AVERAGE,
+                         th_ins_damage_avg_m:float = 0.017, thermal_coeff = ThermalCoeff, ambient_temp = AmbientTemp) -> SectionArrays:
+    """
+    Calculates geometry, coefficients and thermal resistances of all sections of one line in a single vectorized pass.
+    Gives the same values as PART 1 of Branch.calculate_supply() and Branch.calculate_return().
+
+    :param df_line_in: Input data of one line (e.g. data_input.df_supply_in).
+    :param direction: 'supply' or 'return' ---> selects the insulation thickness data.
+    :param th_all: Pipe and insulation thickness data (content of 'thickness_data' in the JSON file).
+    :param damage_mode: 'average' or 'element'. See the Branch class.
+    :param th_ins_damage_avg_m: Average thickness of the damaged insulation in [m] (for the 'average' damage mode).
+    :param thermal_coeff: ThermalCoeff class or object. Default: ThermalCoeff.
+    :param ambient_temp: AmbientTemp class or object. Default: AmbientTemp.
+    :return arrays: SectionArrays object.
+
+    """
+    direction = direction.lower()
+    if direction not in ("supply", "return"):
+        raise ValueError(f"Input ({direction}) not valid. Available options are 'supply' or 'return'.")
+
+    location_code = encode_location(df_line_in["Location"])
+    d_nom_mm = df_line_in["DN [mm]"].to_numpy().astype(np.int64)
+    d_ext_m = df_line_in["Dext [mm]"].to_numpy(dtype = np.float64) / 1000
+    l_m = df_line_in["L [m]"].to_numpy(dtype = np.float64)
+    insulation = df_line_in["Insulation"].to_numpy(dtype = np.float64)
+
+    # (i) Pipe:
+    th_pipe_m = lookup_by_dn(d_nom_mm, th_all["th_pipe"], "th_pipe") / 1000
+    d_int_m = calculate_pipe_internal_diameter(d_ext_m, th_pipe_m)
+
+    # (ii) Insulation: thickness from the table of the location of each section
+    th_ins_catalog_m = np.zeros(len(l_m))
+    for location, code in location_codes.items():
+        mask = location_code == code
+        if mask.any():
+            table_name = f"th_insulation_{location}_{direction}"
+            th_ins_catalog_m[mask] = lookup_by_dn(d_nom_mm[mask], th_all[table_name], table_name) / 1000
+
+    th_ins_m, k_ins_w_per_mk = calculate_insulation_state(insulation, th_ins_catalog_m, damage_mode, th_ins_damage_avg_m, thermal_coeff)
+    d_ins_ext_m = calculate_insulation_external_diameter(d_ext_m, th_ins_m)
+
+    # (iii) Location dependent values:
+    h_table = np.array([thermal_coeff.h_channel_w_per_m2k, thermal_coeff.h_surface_w_per_m2k, thermal_coeff.h_soil_w_per_m2k])
+    t_amb_table = np.array([ambient_temp.t_channel_c, ambient_temp.t_surface_c, ambient_temp.t_soil_c])
+    h_loc_w_per_m2k = h_table[location_code]
+    t_amb_c = t_amb_table[location_code]
+
+    # (iv) Thermal resistance (the functions in functions.py work on arrays):
+    r_tot_w_per_k = calculate_r_total(d_int_m, l_m, thermal_coeff.h_water_w_per_m2k, d_ext_m, thermal_coeff.k_pipe_w_per_mk,
+                                      d_ins_ext_m, k_ins_w_per_mk, h_loc_w_per_m2k)
+
+    return SectionArrays(
+        direction             = direction,
+        lat                   = df_line_in["Latitude"].to_numpy(dtype = np.float64),
+        lon                   = df_line_in["Longitude"].to_numpy(dtype = np.float64),
+        l_m                   = l_m,
+        d_nom_mm              = d_nom_mm,
+        d_ext_m               = d_ext_m,
+        d_int_m               = d_int_m,
+        th_ins_catalog_m      = th_ins_catalog_m,
+        d_ins_ext_m           = d_ins_ext_m,
+        k_ins_w_per_mk        = k_ins_w_per_mk,
+        h_loc_w_per_m2k       = h_loc_w_per_m2k,
+        t_amb_c               = t_amb_c,
+        r_tot_w_per_k         = r_tot_w_per_k,
+        mdot_takeoff_kg_per_s = df_line_in["mdot take-off [kg/s]"].to_numpy(dtype = np.float64),
+        location_code         = location_code,
+        insulation            = insulation
+    )
+
+
+def pair_return_consumers(mdot_takeoff_supply_kg_per_s:np.ndarray, mdot_takeoff_return_kg_per_s:np.ndarray) -> np.ndarray:
+    """
+    Connects the consumers of the return line with the take-offs on the supply line (the lines may not have the same number of elements).
+    The n-th return node with a take-off receives the flow of the n-th supply take-off counted from the end of the supply line.
+    Vectorized version of the connection in Branch.calculate_return().
+
+    :param mdot_takeoff_supply_kg_per_s: Take-offs on the supply line in [kg/s] (negative values).
+    :param mdot_takeoff_return_kg_per_s: Take-offs on the return line in [kg/s] (only non-zero values are used).
+    :return mdot_consumer_return_kg_per_s: Mass flow from the consumer into each return node in [kg/s].
+
+    """
+    mdot_takeoff_supply_kg_per_s = np.asarray(mdot_takeoff_supply_kg_per_s, dtype = np.float64)
+    idx_return = np.flatnonzero(np.asarray(mdot_takeoff_return_kg_per_s) != 0)
+    idx_supply = np.flatnonzero(mdot_takeoff_supply_kg_per_s != 0)[::-1]       # from the end of the supply line
+
+    if len(idx_return) > len(idx_supply):
+        raise ValueError(f"The return line has more consumers ({len(idx_return)}) than the supply line ({len(idx_supply)}).")
+
+    mdot_consumer_return_kg_per_s = np.zeros(len(mdot_takeoff_return_kg_per_s))
+    mdot_consumer_return_kg_per_s[idx_return] = - mdot_takeoff_supply_kg_per_s[idx_supply[:len(idx_return)]]
+    return mdot_consumer_return_kg_per_s
+
+
+def update_insulation(arrays:SectionArrays, index, insulation, damage_mode:str = _DAMAGE_MODE_AVERAGE, th_ins_damage_avg_m:float = 0.017,
+                      thermal_coeff = ThermalCoeff) -> SectionArrays:
+    """
+    Returns a copy of the section arrays with a new state of insulation for selected sections.
+    Only the insulation dependent values (insulation diameter, conductivity, thermal resistance) are recalculated.
+
+    :param arrays: SectionArrays object.
+    :param index: Index (or indices) of the sections.
+    :param insulation: New state of insulation (same meaning as the 'Insulation' column of the input data).
+    :param damage_mode: 'average' or 'element'.
+    :param th_ins_damage_avg_m: Average thickness of the damaged insulation in [m] (for the 'average' damage mode).
+    :param thermal_coeff: ThermalCoeff class or object. Default: ThermalCoeff.
+    :return arrays_new: SectionArrays object.
+
+    """
+    index = np.atleast_1d(np.asarray(index, dtype = np.int64))
+    insulation_new = arrays.insulation.copy()
+    insulation_new[index] = insulation
+
+    th_ins_m, k_ins_new = calculate_insulation_state(insulation_new[index], arrays.th_ins_catalog_m[index], damage_mode, th_ins_damage_avg_m, thermal_coeff)
+    d_ins_ext_new = arrays.d_ins_ext_m.copy()
+    d_ins_ext_new[index] = calculate_insulation_external_diameter(arrays.d_ext_m[index], th_ins_m)
+    k_ins_w_per_mk = arrays.k_ins_w_per_mk.copy()
+    k_ins_w_per_mk[index] = k_ins_new
+
+    r_tot_w_per_k = arrays.r_tot_w_per_k.copy()
+    r_tot_w_per_k[index] = calculate_r_total(arrays.d_int_m[index], arrays.l_m[index], thermal_coeff.h_water_w_per_m2k, arrays.d_ext_m[index],
+                                             thermal_coeff.k_pipe_w_per_mk, d_ins_ext_new[index], k_ins_new, arrays.h_loc_w_per_m2k[index])
+
+    return replace(arrays, insulation = insulation_new, d_ins_ext_m = d_ins_ext_new, k_ins_w_per_mk = k_ins_w_per_mk, r_tot_w_per_k = r_tot_w_per_k)
@@ -0,0 +1,298 @@
+import os
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from config_data import BranchInitialConfig
+from kernels import (COL_LAT, COL_LON, COL_L_TOT, COL_T, COL_MDOT, COL_QDOT_LOSS, COL_QDOTNORM_LOSS, COL_QDOT_LOSS_TOT, COL_V,
+                     COL_MDOT_CONSUMER, COL_QDOT_CONSUMER_ABS, COL_QDOT_CONSUMER_ACT, COL_QDOT_TOT, pipe_columns)
+from section_arrays import build_section_arrays, pair_return_consumers
+from utils.constants import TZERO
+from utils.functions import calculate_fluid_density, calculate_fluid_specific_heat
+from utils.readers import read_thickness_data, split_input_data
+
+
+#==============================================================================
+thickness_data_location = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "insulation_thickness.json")
+
+COALESCE_KEYS = ("Direction", "DN [mm]", "Dext [mm]", "Location", "Insulation")  # sections are merged only if these values are equal
+
+
+#==========================| MAPPING |=========================================
+@dataclass
+class SectionMapping:
+    """
+    Relation between the rows of a line before (original) and after preprocessing (new).
+    Merging and splitting keep the order and the total length of a line, so both sets of rows are described by the positions
+    of their ends along the line (cumulative length). Mappings of several steps are chained by keeping the original positions.
+
+    :param original_end_m: Position of the end of each original row in [m].
+    :param new_end_m: Position of the end of each new row in [m].
+
+    """
+    original_end_m: np.ndarray
+    new_end_m: np.ndarray
+
+    @classmethod
+    def identity(cls, l_m:np.ndarray) -> "SectionMapping":
+        end_m = np.cumsum(np.asarray(l_m, dtype = np.float64))
+        return cls(original_end_m = end_m, new_end_m = end_m.copy())
+
+    @property
+    def n_original(self) -> int:
+        return len(self.original_end_m)
+
+    @property
+    def n_new(self) -> int:
+        return len(self.new_end_m)
+
+    @property
+    def end_new(self) -> np.ndarray:
+        """
+        New row containing the end node of each original row.
+
+        """
+        return np.minimum(np.searchsorted(self.new_end_m, self.original_end_m, side = "left"), self.n_new - 1)
+
+    @property
+    def end_fraction(self) -> np.ndarray:
+        """
+        Position of the end node of each original row along the new row containing it (0 - 1).
+
+        """
+        end_new = self.end_new
+        new_start_m = np.concatenate([[0.0], self.new_end_m[:-1]])
+        return (self.original_end_m - new_start_m[end_new]) / (self.new_end_m[end_new] - new_start_m[end_new])
+
+    @property
+    def shared_end(self) -> np.ndarray:
+        """
+        True for original rows whose end node is also the end node of a new row (nodes where take-offs can be).
+
+        """
+        return self.new_end_m[self.end_new] == self.original_end_m
+
+    def to_original_extensive(self, values_new:np.ndarray) -> np.ndarray:
+        """
+        Distributes extensive section values of the new rows (e.g. heat flow loss) to the original rows in proportion to the overlapping length.
+
+        """
+        bounds_m = np.union1d(self.original_end_m, self.new_end_m)
+        length_m = np.diff(np.concatenate([[0.0], bounds_m]))
+        idx_new = np.minimum(np.searchsorted(self.new_end_m, bounds_m, side = "left"), self.n_new - 1)
+        idx_original = np.minimum(np.searchsorted(self.original_end_m, bounds_m, side = "left"), self.n_original - 1)
+        l_new_m = np.diff(np.concatenate([[0.0], self.new_end_m]))
+        share = np.divide(length_m, l_new_m[idx_new], out = np.zeros_like(length_m), where = l_new_m[idx_new] > 0)
+        return np.bincount(idx_original, weights = np.asarray(values_new, dtype = np.float64)[idx_new] * share, minlength = self.n_original)
+
+    def to_original_nodes(self, values_new:np.ndarray, values_start_new:np.ndarray) -> np.ndarray:
+        """
+        Interpolates node values of the new rows (e.g. temperature) to the end nodes of the original rows (linear along each new row).
+
+        :param values_new: Values at the end nodes of the new rows.
+        :param values_start_new: Values at the start of each new row (e.g. after mixing with the consumer flow at the previous node).
+        :return values_original: Values at the end nodes of the original rows.
+
+        """
+        end_new, fraction = self.end_new, self.end_fraction
+        return values_start_new[end_new] + fraction * (values_new[end_new] - values_start_new[end_new])
+
+
+#==========================| MERGING & SPLITTING |=============================
+def _check_mapping(df_line_in:pd.DataFrame, mapping:SectionMapping) -> SectionMapping:
+    if mapping is None:
+        return SectionMapping.identity(df_line_in["L [m]"].to_numpy(dtype = np.float64))
+    if mapping.n_new != len(df_line_in):
+        raise ValueError(f"The mapping has {mapping.n_new} rows, the line has {len(df_line_in)} rows.")
+    return mapping
+
+
+def coalesce_sections(df_line_in:pd.DataFrame, mapping:SectionMapping = None) -> tuple:
+    """
+    Merges runs of consecutive sections with the same COALESCE_KEYS values and without take-offs at the inner nodes.
+    A merged section has the length of the run and all other values of its last section (take-off and coordinates of the end node).
+
+    :param df_line_in: DataFrame with the data of one line (see data_input.py).
+    :param mapping: SectionMapping object of the previous preprocessing steps of df_line_in. Default: none (df_line_in are the original rows).
+    :returns:
+        df_line_new: DataFrame with the merged sections
+        mapping: SectionMapping object (original rows ---> rows of df_line_new)
+
+    """
+    mapping = _check_mapping(df_line_in, mapping)
+    n_rows = len(df_line_in)
+    if n_rows == 0:
+        return df_line_in.copy(), mapping
+
+    same_as_previous = np.ones(n_rows, dtype = np.bool_)
+    for key in COALESCE_KEYS:
+        values = df_line_in[key].to_numpy()
+        same_as_previous[1:] &= values[1:] == values[:-1]
+    same_as_previous[0] = False
+    takeoff = df_line_in["mdot take-off [kg/s]"].to_numpy(dtype = np.float64)
+    same_as_previous[1:] &= takeoff[:-1] == 0                                  # a take-off ends a run
+
+    is_last = np.append(~same_as_previous[1:], True)
+    new_end_m = mapping.new_end_m[is_last]
+    df_line_new = df_line_in[is_last].reset_index(drop = True)
+    df_line_new["L [m]"] = np.diff(np.concatenate([[0.0], new_end_m]))
+    return df_line_new, SectionMapping(original_end_m = mapping.original_end_m, new_end_m = new_end_m)
+
+
+def split_sections(df_line_in:pd.DataFrame, n_pieces, mapping:SectionMapping = None) -> tuple:
+    """
+    Splits sections into pieces of equal length. The take-off of a section stays at its end node (last piece); coordinates of the
+    inner nodes are interpolated between the end nodes of the previous and the split section.
+
+    :param df_line_in: DataFrame with the data of one line (see data_input.py).
+    :param n_pieces: Number of pieces of each section (integer or array, 1 = not split). See split_counts().
+    :param mapping: SectionMapping object of the previous preprocessing steps of df_line_in. Default: none.
+    :returns:
+        df_line_new: DataFrame with the split sections
+        mapping: SectionMapping object (original rows ---> rows of df_line_new)
+
+    """
+    mapping = _check_mapping(df_line_in, mapping)
+    n_pieces = np.broadcast_to(np.asarray(n_pieces, dtype = np.int64), (len(df_line_in),))
+    if (n_pieces < 1).any():
+        raise ValueError("Number of pieces must be at least 1.")
+
+    row = np.repeat(np.arange(len(df_line_in)), n_pieces)
+    piece = np.arange(len(row)) - np.repeat(np.cumsum(n_pieces) - n_pieces, n_pieces) + 1     # 1 ... n_pieces of each section
+    fraction = piece / n_pieces[row]
+
+    start_m = np.concatenate([[0.0], mapping.new_end_m[:-1]])
+    new_end_m = np.where(piece == n_pieces[row], mapping.new_end_m[row], start_m[row] + fraction * (mapping.new_end_m[row] - start_m[row]))
+
+    df_line_new = df_line_in.iloc[row].reset_index(drop = True)
+    df_line_new["L [m]"] = np.diff(np.concatenate([[0.0], new_end_m]))
+    inner = piece < n_pieces[row]
+    df_line_new.loc[inner, "mdot take-off [kg/s]"] = 0.0
+    for column in ("Longitude", "Latitude"):
+        end = df_line_in[column].to_numpy(dtype = np.float64)
+        start = np.concatenate([end[:1], end[:-1]])                            # first section: start node unknown ---> end node
+        df_line_new[column] = start[row] + fraction * (end[row] - start[row])
+    return df_line_new, SectionMapping(original_end_m = mapping.original_end_m, new_end_m = new_end_m)
+
+
+def split_counts(arrays, mdot_kg_per_s:np.ndarray, cp:float, ntu_max:float = None, l_max_m:float = None, max_pieces:int = 100) -> np.ndarray:
+    """
+    Returns the number of pieces of each section needed to meet the error tolerance of the outlet temperature calculation.
+    The error of calculate_output_temperature() grows with the number of transfer units of a section (NTU = 1 / (R_tot * mdot * cp),
+    relative temperature drop ~ 1 - exp(-NTU)); splitting a section into k pieces divides NTU by k.
+
+    :param arrays: SectionArrays object of the line.
+    :param mdot_kg_per_s: Mass flow in each section in [kg/s].
+    :param cp: Specific heat of the fluid in [J/kgK].
+    :param ntu_max: Highest NTU of a piece. Default: no limit.
+    :param l_max_m: Longest piece in [m]. Default: no limit.
+    :param max_pieces: Highest number of pieces of one section (e.g. sections without flow).
+    :return n_pieces: Number of pieces of each section.
+
+    """
+    n_pieces = np.ones(len(arrays), dtype = np.int64)
+    if ntu_max is not None:
+        with np.errstate(divide = "ignore"):
+            ntu = 1 / (arrays.r_tot_w_per_k * np.abs(mdot_kg_per_s) * cp)
+        n_pieces = np.maximum(n_pieces, np.ceil(np.minimum(ntu / ntu_max, max_pieces)).astype(np.int64))
+    if l_max_m is not None:
+        n_pieces = np.maximum(n_pieces, np.ceil(arrays.l_m / l_max_m).astype(np.int64))
+    return np.minimum(n_pieces, max_pieces)
+
+
+#==========================| BRANCH |==========================================
+def preprocess_branch(df_input_data:pd.DataFrame, th_values:dict = None, initial_values = None, coalesce:bool = True,
+                      ntu_max:float = None, l_max_m:float = None, damage_mode:str = "average", damage:float = None) -> tuple:
+    """
+    Merges short identical sections (coalesce_sections()) and then splits sections above the NTU or length limits (split_counts())
+    of both lines. Take-off nodes are kept, so consumers of the return line are connected to the same supply take-offs.
+
+    :param df_input_data: DataFrame with supply and return data (see data_input.py).
+    :param th_values: Pipe and insulation thickness data. Default: 'insulation_thickness.json' in the 'data' folder.
+    :param initial_values: BranchInitialConfig object (design flow for NTU). Default: BranchInitialConfig().
+    :param coalesce: If True, sections are merged.
+    :param ntu_max, l_max_m: Limits of split_counts(). Default: no splitting.
+    :param damage_mode: 'average' or 'element'. See the Branch class.
+    :param damage: Average thickness of the damaged insulation in [m]. Default: value from BranchInitialConfig.
+    :returns:
+        df_input_new: DataFrame with supply and return data of the preprocessed lines (renumbered 'n' column)
+        mappings: Dictionary {'supply': SectionMapping, 'return': SectionMapping}
+
+    """
+    iv = initial_values or BranchInitialConfig()
+    lines, mappings = {}, {}
+    for direction, df_line_in in zip(("supply", "return"), split_input_data(df_input_data)):
+        lines[direction], mappings[direction] = coalesce_sections(df_line_in) if coalesce else (df_line_in, None)
+
+    if ntu_max is not None or l_max_m is not None:
+        th_all = th_values or read_thickness_data(thickness_data_location)
+        th_ins_damage_avg_m = damage if damage is not None else iv.th_avg_ins_damage_m
+        takeoff_supply_kg_per_s = lines["supply"]["mdot take-off [kg/s]"].to_numpy(dtype = np.float64)
+        mdot_in_kg_per_s = iv.vdot_m3_per_h * calculate_fluid_density(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid) / 3600
+        mdot_supply_kg_per_s = mdot_in_kg_per_s + np.concatenate([[0.0], np.cumsum(takeoff_supply_kg_per_s)[:-1]])
+        consumer_return_kg_per_s = pair_return_consumers(takeoff_supply_kg_per_s, lines["return"]["mdot take-off [kg/s]"].to_numpy(dtype = np.float64))
+        mdot_kg_per_s = {"supply": mdot_supply_kg_per_s,
+                         "return": mdot_supply_kg_per_s[-1] + np.concatenate([[0.0], np.cumsum(consumer_return_kg_per_s)[:-1]])}
+        for direction, t_design_c in (("supply", iv.t_in_supply_c), ("return", iv.t_in_return_c)):
+            arrays = build_section_arrays(lines[direction], direction, th_all, damage_mode, th_ins_damage_avg_m)
+            cp = calculate_fluid_specific_heat(iv.p_nominal_pa, t_design_c - TZERO, iv.fluid)
+            lines[direction], mappings[direction] = split_sections(lines[direction], split_counts(arrays, mdot_kg_per_s[direction], cp, ntu_max, l_max_m),
+                                                                   mappings[direction])
+
+    for direction in lines:
+        if mappings[direction] is None:
+            mappings[direction] = SectionMapping.identity(lines[direction]["L [m]"].to_numpy(dtype = np.float64))
+    df_input_new = pd.concat([lines["supply"], lines["return"]], ignore_index = True)
+    if "n" in df_input_new.columns:
+        df_input_new["n"] = np.arange(1, len(df_input_new) + 1)
+    return df_input_new, mappings
+
+
+def expand_output(out:np.ndarray, mapping:SectionMapping, df_line_original:pd.DataFrame, t_in_c:float, l_tot_m:float, qdot_tot_w:float,
+                  is_return:bool, t_consumer_release_c:float, qdot_loss_tot_w:float = 0.0) -> np.ndarray:
+    """
+    Maps an output array of a preprocessed line (see solve_line() in kernels.py) back to the original rows.
+        - node values (temperature, position, cumulative and total heat flows): interpolated along the new rows
+          (take-off of the end node of a new row only in the total heat flow of the original row ending at that node),
+        - section values (mass flow, velocity): value of the new row containing the end node of the original row,
+        - heat flow loss: distributed by length (normalised loss recalculated),
+        - consumer values: at the original rows ending at a node of the new rows.
+
+    :param out: Output array of the preprocessed line (n new rows x 13 columns).
+    :param mapping: SectionMapping object of the line.
+    :param df_line_original: DataFrame with the original data of the line (coordinates and lengths).
+    :param t_in_c, l_tot_m, qdot_tot_w, qdot_loss_tot_w: Values at the start of the line (as passed to solve_line()).
+    :param is_return: False for the supply line, True for the return line (mixing with the consumer flow at the nodes).
+    :param t_consumer_release_c: Temperature of the fluid returning from the consumers in [°C].
+    :return out_original: Output array (n original rows x 13 columns).
+
+    """
+    if len(out) != mapping.n_new or len(df_line_original) != mapping.n_original:
+        raise ValueError("The output array and the original data do not match the mapping.")
+
+    # Values at the start of each new row:
+    start = np.empty_like(out)
+    start[0, [COL_T, COL_L_TOT, COL_QDOT_LOSS_TOT, COL_QDOT_TOT]] = t_in_c, l_tot_m, qdot_loss_tot_w, qdot_tot_w
+    start[1:] = out[:-1]
+    if is_return:
+        mdot, step = out[:-1, COL_MDOT], out[:-1, COL_MDOT_CONSUMER]
+        start[1:, COL_T] = (out[:-1, COL_T] * mdot + t_consumer_release_c * step) / (mdot + step)
+
+    out_original = np.zeros((mapping.n_original, len(pipe_columns)))
+    out_original[:, COL_LAT] = df_line_original["Latitude"].to_numpy(dtype = np.float64)
+    out_original[:, COL_LON] = df_line_original["Longitude"].to_numpy(dtype = np.float64)
+    for col in (COL_T, COL_L_TOT, COL_QDOT_LOSS_TOT):
+        out_original[:, col] = mapping.to_original_nodes(out[:, col], start[:, col])
+    # Total heat flow at the end of a new row includes the take-off of its end node (supply: - Q̇ cons abs, return: + Q̇ cons abs)
+    # ---> interpolated without it, added only at the original rows ending at that node:
+    end_new, shared_end = mapping.end_new, mapping.shared_end
+    qdot_consumer_w = out[:, COL_QDOT_CONSUMER_ABS] if is_return else - out[:, COL_QDOT_CONSUMER_ABS]
+    out_original[:, COL_QDOT_TOT] = mapping.to_original_nodes(out[:, COL_QDOT_TOT] - qdot_consumer_w, start[:, COL_QDOT_TOT])
+    out_original[shared_end, COL_QDOT_TOT] += qdot_consumer_w[end_new[shared_end]]
+    for col in (COL_MDOT, COL_V):
+        out_original[:, col] = out[end_new, col]
+    out_original[:, COL_QDOT_LOSS] = mapping.to_original_extensive(out[:, COL_QDOT_LOSS])
+    out_original[:, COL_QDOTNORM_LOSS] = out_original[:, COL_QDOT_LOSS] / df_line_original["L [m]"].to_numpy(dtype = np.float64)
+    for col in (COL_MDOT_CONSUMER, COL_QDOT_CONSUMER_ABS, COL_QDOT_CONSUMER_ACT):
+        out_original[shared_end, col] = out[end_new[shared_end], col]
+    return out_original
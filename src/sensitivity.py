@@ -0,0 +1,320 @@
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields, replace
+
+try:                                                                           # optional dependency ---> quasi-random (Sobol) sample matrices
+    from scipy.stats import qmc
+except ImportError:
+    qmc = None
+
+from checkpoint import Checkpoint
+from config_data import BranchInitialConfig, AmbientTemp
+from kernels import build_property_table, select_backend, solve_branch
+from model_param import ThermalCoeff
+from model_server import WhatIfModel
+from section_arrays import SectionArrays, location_codes, pair_return_consumers
+from utils.functions import calculate_insulation_external_diameter, calculate_r_total
+from utils.progress import ProgressReporter
+
+
+#==============================================================================
+_THERMAL_PARAMETERS = tuple(field.name for field in fields(ThermalCoeff))
+_AMBIENT_PARAMETERS = tuple(field.name for field in fields(AmbientTemp))
+_INITIAL_PARAMETERS = ("t_in_supply_c", "t_in_return_c", "t_consumer_release_c", "vdot_m3_per_h", "th_avg_ins_damage_m")
+PARAMETERS = _THERMAL_PARAMETERS + _AMBIENT_PARAMETERS + _INITIAL_PARAMETERS   # fluid and pressure define the property table ---> not varied
+
+
+#==========================| FORWARD MODEL |===================================
+class BranchForwardModel:
+    """
+    Batched forward model for sensitivity analyses: evaluates a KPI of the branch for a chunk of parameter sets (rows).
+    Geometry, consumer pairing and the fluid property table are prepared once; for each chunk the thermal resistances and ambient
+    temperatures of all rows are calculated as array operations (rows x sections) and the rows are solved with the array kernel.
+
+    Parameters are fields of ThermalCoeff, AmbientTemp and BranchInitialConfig (see PARAMETERS); parameters that are not varied keep
+    the values of the objects given to the constructor.
+
+    """
+
+    def __init__(self, arrays_supply:SectionArrays, arrays_return:SectionArrays, initial_values = None, thermal_coeff = ThermalCoeff,
+                 ambient_temp = AmbientTemp, damage_mode:str = "average", output = "Qdot loss total [W]", workers:int = 1,
+                 t_max_c:float = 150.0, tolerance:float = 0.001, backend:str = "auto"):
+        """
+        :param arrays_supply: SectionArrays object of the supply line (geometry and state of insulation).
+        :param arrays_return: SectionArrays object of the return line.
+        :param initial_values: BranchInitialConfig object. Default: BranchInitialConfig().
+        :param thermal_coeff: ThermalCoeff class or object with the values of the parameters that are not varied.
+        :param ambient_temp: AmbientTemp class or object with the values of the parameters that are not varied.
+        :param damage_mode: 'average' or 'element' (same as used for the section arrays). See the Branch class.
+        :param output: Name of a KPI (see WhatIfModel.calculate_kpis()) or function (out_supply, out_return) ---> float.
+        :param workers: Number of threads solving the rows of a chunk (the Numba kernel releases the GIL).
+        :param t_max_c: Highest temperature of the property table in [°C] (covers the bounds of the inlet temperatures).
+        :param tolerance, backend: See solve_branch().
+
+        """
+        if damage_mode not in ("average", "element"):
+            raise ValueError("Invalid damage mode. Use 'average' or 'element'.")
+        self.arrays_supply, self.arrays_return = arrays_supply, arrays_return
+        self.initial_values = initial_values or BranchInitialConfig()
+        self.base = {name: float(getattr(thermal_coeff, name)) for name in _THERMAL_PARAMETERS}
+        self.base.update({name: float(getattr(ambient_temp, name)) for name in _AMBIENT_PARAMETERS})
+        self.base.update({name: float(getattr(self.initial_values, name)) for name in _INITIAL_PARAMETERS})
+        self.damage_mode = damage_mode
+        self.output = output
+        self.workers = max(int(workers), 1)
+        self.tolerance = tolerance
+        self.backend = select_backend(backend)
+
+        iv = self.initial_values
+        self.mdot_consumer_return_kg_per_s = pair_return_consumers(arrays_supply.mdot_takeoff_kg_per_s, arrays_return.mdot_takeoff_kg_per_s)
+        t_min_c = -50.0                                                        # covers the bounds of the ambient temperatures
+        self.property_table = build_property_table(iv.p_nominal_pa, iv.fluid, t_min_c,
+                                                   max(t_max_c, iv.t_in_supply_c + 20, iv.t_in_return_c + 20, iv.t_consumer_release_c + 20))
+
+    def fingerprint(self) -> str:
+        """
+        Hash of everything that defines the outputs of the model (section arrays, values of the parameters that are not varied,
+        initial values, output and solver settings), e.g. for the run key of a checkpoint.
+
+        """
+        output = self.output if isinstance(self.output, str) else f"{getattr(self.output, '__module__', '')}.{getattr(self.output, '__qualname__', repr(self.output))}"
+        settings = {"base": self.base, "initial_values": {field.name: getattr(self.initial_values, field.name) for field in fields(self.initial_values)},
+                    "damage_mode": self.damage_mode, "output": output, "tolerance": self.tolerance}
+        arrays = [getattr(line_arrays, field.name) for line_arrays in (self.arrays_supply, self.arrays_return) for field in fields(line_arrays)
+                  if isinstance(getattr(line_arrays, field.name), np.ndarray)]
+        return Checkpoint.fingerprint(np.frombuffer(json.dumps(settings, sort_keys = True, default = str).encode(), dtype = np.uint8), *arrays)
+
+    def _values(self, names:list, x:np.ndarray, name:str) -> np.ndarray:
+        """
+        Values of a parameter for all rows of a chunk (column vector).
+
+        """
+        if name in names:
+            return x[:, names.index(name), np.newaxis]
+        return np.full((len(x), 1), self.base[name])
+
+    def _r_total(self, arrays:SectionArrays, names:list, x:np.ndarray) -> np.ndarray:
+        """
+        Thermal resistances of all sections for all rows of a chunk (rows x sections).
+
+        """
+        value = lambda name: self._values(names, x, name)
+        h_loc_table = np.zeros((len(x), max(location_codes.values()) + 1))
+        for location, code in location_codes.items():
+            h_loc_table[:, code] = value(f"h_{location}_w_per_m2k")[:, 0]
+        h_loc_w_per_m2k = h_loc_table[:, arrays.location_code]
+
+        if self.damage_mode == "average":                                      # same rule as calculate_insulation_state() with coefficients per row
+            damaged = arrays.insulation == 0
+            th_ins_m = np.where(damaged, value("th_avg_ins_damage_m"), arrays.th_ins_catalog_m)
+            k_ins_w_per_mk = np.where(damaged, value("k_ins_damaged_w_per_mk"), value("k_ins_w_per_mk"))
+        else:
+            th_ins_m = arrays.th_ins_catalog_m * arrays.insulation
+            k_ins_w_per_mk = value("k_ins_w_per_mk")
+        d_ins_ext_m = calculate_insulation_external_diameter(arrays.d_ext_m, th_ins_m)
+        return calculate_r_total(arrays.d_int_m, arrays.l_m, value("h_water_w_per_m2k"), arrays.d_ext_m, value("k_pipe_w_per_mk"),
+                                 d_ins_ext_m, k_ins_w_per_mk, h_loc_w_per_m2k)
+
+    def _t_amb(self, arrays:SectionArrays, names:list, x:np.ndarray) -> np.ndarray:
+        t_amb_table = np.zeros((len(x), max(location_codes.values()) + 1))
+        for location, code in location_codes.items():
+            t_amb_table[:, code] = self._values(names, x, f"t_{location}_c")[:, 0]
+        return t_amb_table[:, arrays.location_code]
+
+    def __call__(self, names:list, x:np.ndarray) -> np.ndarray:
+        """
+        Evaluates the output for a chunk of parameter sets.
+
+        :param names: Names of the varied parameters (columns of x).
+        :param x: Array (rows x parameters) with the values of the parameters.
+        :return y: Output for each row.
+
+        """
+        names = list(names)
+        unknown = [name for name in names if name not in PARAMETERS]
+        if unknown:
+            raise KeyError(f"Unknown parameters {unknown}. Parameters: {', '.join(PARAMETERS)}.")
+        x = np.atleast_2d(np.asarray(x, dtype = np.float64))
+
+        # Only the quantities depending on the varied parameters are recalculated:
+        lines = []
+        for arrays in (self.arrays_supply, self.arrays_return):
+            r_tot = self._r_total(arrays, names, x) if set(names) & set(_THERMAL_PARAMETERS + ("th_avg_ins_damage_m",)) else None
+            t_amb = self._t_amb(arrays, names, x) if set(names) & set(_AMBIENT_PARAMETERS) else None
+            lines.append((arrays, r_tot, t_amb))
+        initial = [name for name in names if name in _INITIAL_PARAMETERS]
+
+        def evaluate(row:int) -> float:
+            line_arrays = []
+            for arrays, r_tot, t_amb in lines:
+                changes = {}
+                if r_tot is not None:
+                    changes["r_tot_w_per_k"] = r_tot[row]
+                if t_amb is not None:
+                    changes["t_amb_c"] = t_amb[row]
+                line_arrays.append(replace(arrays, **changes) if changes else arrays)
+            iv = replace(self.initial_values, **{name: x[row, names.index(name)] for name in initial}) if initial else self.initial_values
+            out_supply, out_return = solve_branch(*line_arrays, iv, self.property_table, self.tolerance, self.backend,
+                                                  mdot_consumer_return_kg_per_s = self.mdot_consumer_return_kg_per_s)
+            if callable(self.output):
+                return float(self.output(out_supply, out_return))
+            return WhatIfModel.calculate_kpis(out_supply, out_return)[self.output]
+
+        if self.workers == 1:
+            return np.array([evaluate(row) for row in range(len(x))])
+        with ThreadPoolExecutor(max_workers = self.workers) as executor:
+            return np.array(list(executor.map(evaluate, range(len(x)))))
+
+
+#==========================| SAMPLING |========================================
+def saltelli_matrices(bounds:dict, n_base:int, seed:int = None) -> tuple:
+    """
+    Generates the two independent sample matrices A and B of the Saltelli scheme (quasi-random Sobol points if scipy is installed,
+    otherwise pseudo-random points), scaled to the bounds of the parameters.
+
+    :param bounds: Dictionary parameter name ---> (lower bound, upper bound).
+    :param n_base: Number of rows of each matrix (a power of 2 with the Sobol sequence).
+    :param seed: Seed of the random number generator.
+    :return a, b: Arrays (n_base x parameters).
+
+    """
+    d = len(bounds)
+    if qmc is not None:
+        unit = qmc.Sobol(d = 2 * d, scramble = True, seed = seed).random(n_base)
+    else:
+        unit = np.random.default_rng(seed).random((n_base, 2 * d))
+    low, high = np.array(list(bounds.values()), dtype = np.float64).T
+    if np.any(high < low):
+        raise ValueError("Upper bounds must not be lower than lower bounds.")
+    return low + unit[:, :d] * (high - low), low + unit[:, d:] * (high - low)
+
+
+def _saltelli_rows(a:np.ndarray, b:np.ndarray, start:int, stop:int) -> np.ndarray:
+    """
+    Rows start:stop of the stacked Saltelli design [A; B; AB_1; ...; AB_d] (AB_i = A with column i from B), built without storing the design.
+
+    """
+    n, d = a.shape
+    rows = np.arange(start, stop)
+    block, index = np.divmod(rows, n)
+    x = np.where((block == 1)[:, np.newaxis], b[index], a[index])
+    swap = block >= 2
+    x[swap, block[swap] - 2] = b[index[swap], block[swap] - 2]
+    return x
+
+
+#==========================| INDICES |=========================================
+def _sobol_indices(y_a:np.ndarray, y_b:np.ndarray, y_ab:np.ndarray) -> tuple:
+    """
+    First-order (Saltelli 2010) and total (Jansen) indices; works on the last axis, so bootstrap resamples are calculated together.
+
+    :param y_a, y_b: Outputs of A and B (... x n).
+    :param y_ab: Outputs of AB_i (parameters x ... x n).
+    :return s1, st: Arrays (parameters x ...).
+
+    """
+    y_all = np.concatenate([y_a, y_b], axis = -1)
+    mean = y_all.mean(axis = -1, keepdims = True)                              # centred outputs ---> first-order indices independent of an offset of the output
+    y_a, y_b, y_ab = y_a - mean, y_b - mean, y_ab - mean
+    variance = y_all.var(axis = -1)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        s1 = np.mean(y_b * (y_ab - y_a), axis = -1) / variance
+        st = 0.5 * np.mean((y_a - y_ab) ** 2, axis = -1) / variance
+    return s1, st
+
+
+@dataclass
+class SobolResult:
+    """
+    Result of a Sobol sensitivity analysis (see sobol_analysis()).
+
+    :param indices: DataFrame with one row per parameter: first-order ('S1') and total ('ST') indices with the bounds of their confidence intervals.
+    :param y_a, y_b: Outputs of the sample matrices A and B.
+    :param y_ab: Outputs of the matrices AB_i (parameters x n_base).
+    :param n_evaluations: Number of model evaluations.
+
+    """
+    indices: pd.DataFrame
+    y_a: np.ndarray
+    y_b: np.ndarray
+    y_ab: np.ndarray
+    n_evaluations: int
+
+
+def sobol_analysis(model, bounds:dict, n_base:int = 1024, chunk_size:int = 4096, n_bootstrap:int = 200, confidence:float = 0.95,
+                   seed:int = None, progress = None, checkpoint = None, cancel = None) -> SobolResult:
+    """
+    Variance-based global sensitivity analysis (Sobol indices, Saltelli sampling scheme) with n_base * (parameters + 2) model evaluations.
+    The design is evaluated chunk by chunk, so memory does not depend on the number of evaluations. Confidence intervals are
+    percentile intervals of bootstrap resamples of the rows.
+
+    :param model: Batched forward model: function (names, x) ---> y for a chunk x (rows x parameters), e.g. a BranchForwardModel object.
+    :param bounds: Dictionary parameter name ---> (lower bound, upper bound) of the uniform distribution of the parameter.
+    :param n_base: Number of base samples (rows of the matrices A and B).
+    :param chunk_size: Number of rows evaluated in one call of the model.
+    :param n_bootstrap: Number of bootstrap resamples (0 ---> no confidence intervals).
+    :param confidence: Confidence level of the intervals.
+    :param seed: Seed of the random number generator (sampling and bootstrap).
+    :param progress: Function called with ProgressEvent objects (evaluations done, rate, ETA), e.g. print_progress in utils/progress.py.
+    :param checkpoint: Checkpoint object (see checkpoint.py). Outputs of evaluated chunks are saved; chunks found in the checkpoint are not evaluated again.
+                       The run is identified by model.fingerprint() (e.g. BranchForwardModel); other models require the key argument of the Checkpoint.
+    :param cancel: CancellationToken object (utils/progress.py), checked before each chunk ---> CalculationCancelledError.
+    :return result: SobolResult object.
+
+    """
+    if not bounds:
+        raise ValueError("At least one parameter is required.")
+    names = list(bounds)
+    a, b = saltelli_matrices(bounds, n_base, seed)
+    n, d = a.shape
+    n_evaluations = n * (d + 2)
+
+    if checkpoint is not None:
+        if seed is None:
+            raise ValueError("A seed is required to resume an analysis from a checkpoint.")
+        if hasattr(model, "fingerprint"):
+            model_key = model.fingerprint()
+        elif checkpoint.user_key is not None:
+            model_key = None                                                   # the model is identified by the key of the checkpoint
+        else:
+            raise ValueError("The model has no fingerprint() method ---> identify it with the key argument of the Checkpoint "
+                             "(outputs of another model would be resumed otherwise).")
+        checkpoint.bind({"function": "sobol_analysis", "bounds": bounds, "n_base": n_base, "chunk_size": chunk_size, "seed": seed, "model": model_key})
+
+    reporter = ProgressReporter(n_evaluations, "sobol", progress, cancel)
+    y = np.empty(n_evaluations)
+    for start in range(0, n_evaluations, chunk_size):
+        reporter.update(start)
+        stop = min(start + chunk_size, n_evaluations)
+        if checkpoint is not None and start in checkpoint:
+            y[start:stop] = checkpoint.load(start)["y"]
+        else:
+            y[start:stop] = model(names, _saltelli_rows(a, b, start, stop))
+            if checkpoint is not None:
+                checkpoint.save(start, y = y[start:stop])
+    reporter.finish()
+    if checkpoint is not None:
+        checkpoint.flush()
+    invalid = ~np.isfinite(y)
+    if invalid.any():
+        example = dict(zip(names, _saltelli_rows(a, b, np.argmax(invalid), np.argmax(invalid) + 1)[0]))
+        raise ValueError(f"The model returned non-finite outputs for {int(invalid.sum())} of {n_evaluations} parameter sets, e.g. {example}. "
+                         f"Narrow the bounds of the parameters.")
+    y_a, y_b, y_ab = y[:n], y[n:2 * n], y[2 * n:].reshape(d, n)
+
+    s1, st = _sobol_indices(y_a, y_b, y_ab)
+    indices = pd.DataFrame({"S1": s1, "ST": st}, index = pd.Index(names, name = "Parameter"))
+    if n_bootstrap > 0:
+        rng = np.random.default_rng(None if seed is None else seed + 1)
+        s1_boot, st_boot = np.empty((d, n_bootstrap)), np.empty((d, n_bootstrap))
+        batch = max(1, 2 ** 22 // (n * (d + 2)))                               # resamples per batch ---> bounded memory
+        for start in range(0, n_bootstrap, batch):
+            resample = rng.integers(0, n, size = (min(batch, n_bootstrap - start), n))
+            s1_boot[:, start:start + len(resample)], st_boot[:, start:start + len(resample)] = _sobol_indices(y_a[resample], y_b[resample], y_ab[:, resample])
+        alpha = 100 * (1 - confidence) / 2
+        indices["S1 low"], indices["S1 high"] = np.percentile(s1_boot, [alpha, 100 - alpha], axis = 1)
+        indices["ST low"], indices["ST high"] = np.percentile(st_boot, [alpha, 100 - alpha], axis = 1)
+        indices = indices[["S1", "S1 low", "S1 high", "ST", "ST low", "ST high"]]
+    return SobolResult(indices = indices, y_a = y_a, y_b = y_b, y_ab = y_ab, n_evaluations = n_evaluations)
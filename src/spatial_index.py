@@ -0,0 +1,192 @@
+import numpy as np
+
+from utils.constants import EARTH_RADIUS_M
+
+
+#==========================| SPATIAL INDEX |===================================
+class SpatialIndex:
+    """
+    Uniform grid over the nodes of a line (section end points: 'Longitude', 'Latitude' of each row). Built once per network, answers
+    bounding box, radius, polygon and nearest-section queries; results are row indices (sections ending at the selected nodes).
+
+    Coordinates are projected to a local plane (equirectangular projection around the centre of the data, distances in [m]),
+    which is accurate for city-scale networks. Points are sorted by grid cell (CSR layout): the cells of one grid column within
+    a bounding box are a contiguous slice, so a query costs one slice per column plus an exact filter of the candidates.
+
+    Attributes:
+        lon, lat (np.ndarray): Coordinates of the nodes.
+        x_m, y_m (np.ndarray): Projected coordinates of the nodes in [m].
+        cell_size_m (float): Size of the grid cells in [m].
+
+    """
+
+    def __init__(self, lon, lat, cell_size_m:float = None):
+        """
+        :param lon: Longitudes of the nodes.
+        :param lat: Latitudes of the nodes.
+        :param cell_size_m: Size of the grid cells in [m]. Default: about 4 nodes per occupied cell.
+
+        """
+        self.lon = np.asarray(lon, dtype = np.float64)
+        self.lat = np.asarray(lat, dtype = np.float64)
+        if self.lon.shape != self.lat.shape or self.lon.ndim != 1:
+            raise ValueError("Longitude and latitude must be 1-D arrays of the same length.")
+        finite = np.isfinite(self.lon) & np.isfinite(self.lat)
+        if not finite.all():
+            raise ValueError(f"Coordinates of rows {np.flatnonzero(~finite).tolist()[:20]} are not finite.")
+
+        n_points = len(self.lon)
+        self.lat0_rad = np.radians(self.lat.mean()) if n_points else 0.0
+        self.lon0 = self.lon.mean() if n_points else 0.0
+        self.x_m, self.y_m = self.project(self.lon, self.lat)
+        self.x_min_m = self.x_m.min() if n_points else 0.0
+        self.y_min_m = self.y_m.min() if n_points else 0.0
+
+        if cell_size_m is None:
+            extent_m = max(np.ptp(self.x_m) if n_points else 0.0, np.ptp(self.y_m) if n_points else 0.0, 1.0)
+            cell_size_m = max(extent_m * np.sqrt(4 / max(n_points, 1)), 1.0)   # line-like data: occupied cells ~ extent / cell size
+        self.cell_size_m = float(cell_size_m)
+
+        ix, iy = self._cell(self.x_m, self.y_m)
+        self.nx = int(ix.max()) + 1 if n_points else 1
+        self.ny = int(iy.max()) + 1 if n_points else 1
+        cell_id = ix * self.ny + iy
+        self.order = np.argsort(cell_id, kind = "stable")                      # point indices sorted by cell
+        self.cell_start = np.searchsorted(cell_id[self.order], np.arange(self.nx * self.ny + 1))
+        self._x_sorted = self.x_m[self.order]
+        self._y_sorted = self.y_m[self.order]
+
+    @classmethod
+    def from_frame(cls, df_line, cell_size_m:float = None) -> "SpatialIndex":
+        """
+        Builds the index of a line from a DataFrame with 'Longitude' and 'Latitude' columns (input or output data).
+
+        """
+        return cls(df_line["Longitude"].to_numpy(dtype = np.float64), df_line["Latitude"].to_numpy(dtype = np.float64), cell_size_m)
+
+    def __len__(self) -> int:
+        return len(self.lon)
+
+
+    #______________________ Helper methods ____________________________________
+
+    def project(self, lon, lat) -> tuple:
+        """
+        Projects coordinates to the local plane of the index in [m].
+
+        """
+        x_m = EARTH_RADIUS_M * np.cos(self.lat0_rad) * np.radians(np.asarray(lon, dtype = np.float64) - self.lon0)
+        y_m = EARTH_RADIUS_M * np.radians(np.asarray(lat, dtype = np.float64))
+        return x_m, y_m
+
+    def _cell(self, x_m, y_m) -> tuple:
+        ix = np.floor((x_m - self.x_min_m) / self.cell_size_m).astype(np.int64)
+        iy = np.floor((y_m - self.y_min_m) / self.cell_size_m).astype(np.int64)
+        return ix, iy
+
+    def _candidates(self, x0_m:float, y0_m:float, x1_m:float, y1_m:float) -> np.ndarray:
+        """
+        Positions (in the sorted order) of the points in the grid cells overlapping a box of projected coordinates.
+
+        """
+        (ix0, ix1), (iy0, iy1) = self._cell(np.array([x0_m, x1_m]), np.array([y0_m, y1_m]))
+        ix0, ix1 = max(int(ix0), 0), min(int(ix1), self.nx - 1)
+        iy0, iy1 = max(int(iy0), 0), min(int(iy1), self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.empty(0, dtype = np.int64)
+        columns = np.arange(ix0, ix1 + 1) * self.ny
+        starts = self.cell_start[columns + iy0]
+        stops = self.cell_start[columns + iy1 + 1]
+        lengths = stops - starts
+        if lengths.sum() == 0:
+            return np.empty(0, dtype = np.int64)
+        return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+    #______________________ Queries ___________________________________________
+
+    def query_bbox(self, lon_min:float, lat_min:float, lon_max:float, lat_max:float) -> np.ndarray:
+        """
+        Returns indices of the nodes inside a bounding box (sorted).
+
+        """
+        (x0_m, x1_m), (y0_m, y1_m) = self.project([lon_min, lon_max], [lat_min, lat_max])
+        candidates = self._candidates(x0_m, y0_m, x1_m, y1_m)
+        lon, lat = self.lon[self.order[candidates]], self.lat[self.order[candidates]]
+        inside = (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+        return np.sort(self.order[candidates[inside]])
+
+    def query_radius(self, lon:float, lat:float, radius_m:float, return_distance:bool = False):
+        """
+        Returns indices of the nodes within a distance from a point (sorted by distance).
+
+        :param lon, lat: Coordinates of the point.
+        :param radius_m: Distance in [m].
+        :param return_distance: If True, distances in [m] are returned as well.
+
+        """
+        x_m, y_m = self.project(lon, lat)
+        candidates = self._candidates(x_m - radius_m, y_m - radius_m, x_m + radius_m, y_m + radius_m)
+        distance_m = np.hypot(self._x_sorted[candidates] - x_m, self._y_sorted[candidates] - y_m)
+        inside = distance_m <= radius_m
+        by_distance = np.argsort(distance_m[inside], kind = "stable")
+        index = self.order[candidates[inside]][by_distance]
+        return (index, distance_m[inside][by_distance]) if return_distance else index
+
+    def nearest(self, lon:float, lat:float, k:int = 1) -> tuple:
+        """
+        Returns the k nearest nodes of a point (growing search radius, starting at one grid cell).
+
+        :return index, distance_m: Indices of the nodes and distances in [m] (sorted by distance).
+
+        """
+        k = min(int(k), len(self))
+        if k <= 0:
+            return np.empty(0, dtype = np.int64), np.empty(0)
+        x_m, y_m = self.project(lon, lat)
+        radius_m = self.cell_size_m
+        # Distance of the point from the grid ---> the first radius that can reach any node:
+        outside_m = np.hypot(max(self.x_min_m - x_m, 0.0, x_m - (self.x_min_m + self.nx * self.cell_size_m)),
+                             max(self.y_min_m - y_m, 0.0, y_m - (self.y_min_m + self.ny * self.cell_size_m)))
+        radius_m = max(radius_m, outside_m + self.cell_size_m)
+        while True:
+            index, distance_m = self.query_radius(lon, lat, radius_m, return_distance = True)
+            if len(index) >= k:
+                return index[:k], distance_m[:k]
+            radius_m *= 2
+
+    def query_polygon(self, polygon_lonlat) -> np.ndarray:
+        """
+        Returns indices of the nodes inside a polygon (even-odd rule; sorted).
+
+        :param polygon_lonlat: Vertices of the polygon as an array (n x 2) of (longitude, latitude); the polygon is closed automatically.
+
+        """
+        polygon = np.asarray(polygon_lonlat, dtype = np.float64)
+        if polygon.ndim != 2 or polygon.shape[1] != 2 or len(polygon) < 3:
+            raise ValueError("Polygon must have at least 3 vertices (longitude, latitude).")
+        candidates = self.order[self._candidates(*self.project(polygon[:, 0].min(), polygon[:, 1].min()),
+                                                 *self.project(polygon[:, 0].max(), polygon[:, 1].max()))]
+        lon, lat = self.lon[candidates], self.lat[candidates]
+        inside = np.zeros(len(candidates), dtype = np.bool_)
+        lon_a, lat_a = polygon[:, 0], polygon[:, 1]
+        lon_b, lat_b = np.roll(lon_a, -1), np.roll(lat_a, -1)
+        for i in range(len(polygon)):                                          # one vectorized test per edge
+            crosses = (lat_a[i] > lat) != (lat_b[i] > lat)
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                lon_cross = lon_a[i] + (lat - lat_a[i]) * (lon_b[i] - lon_a[i]) / (lat_b[i] - lat_a[i])
+            inside ^= crosses & (lon < lon_cross)
+        return np.sort(candidates[inside])
+
+    def viewport_mask(self, lon_min:float, lat_min:float, lon_max:float, lat_max:float) -> np.ndarray:
+        """
+        Returns a mask of the nodes to draw in a map viewport: nodes inside the box and their neighbours along the line
+        (segments crossing the edge of the viewport are drawn completely).
+
+        """
+        mask = np.zeros(len(self), dtype = np.bool_)
+        index = self.query_bbox(lon_min, lat_min, lon_max, lat_max)
+        mask[index] = True
+        mask[np.maximum(index - 1, 0)] = True
+        mask[np.minimum(index + 1, len(self) - 1)] = True
+        return mask
@@ -0,0 +1,145 @@
+import os
+import numpy as np
+import pandas as pd
+
+from config_data import BranchInitialConfig
+from model_param import PipeSectionLocation
+from utils.readers import read_thickness_data
+
+
+#==============================================================================
+thickness_data_location = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "insulation_thickness.json")
+
+M_PER_DEG_LAT = 111_320                                                        # length of one degree of latitude in [m]
+
+
+#==========================| SYNTHETIC BRANCH |================================
+def generate_synthetic_branch(n_sections:int, seed:int = 0, th_values:dict = None, initial_values = None,
+                              location_share:dict = None, consumer_probability:float = 0.5, damage_probability:float = 0.03,
+                              v_design_m_per_s:float = 1.2, n_extra_return:int = 2, start_lat:float = 46.36368863, start_lon:float = 15.10484303) -> pd.DataFrame:
+    """
+    Generates input data of a synthetic branch in the format of the input file (same columns as 'input_reference.csv').
+    The supply line has n_sections sections; the return line follows the same route in the opposite direction
+    and starts with n_extra_return sections without consumers (as in 'input_reference.csv', Branch.calculate_system_heat_flow() expects a longer return line).
+
+    Distributions:
+        - section lengths: log-normal (median 35 m, clipped to 0.5 - 300 m),
+        - location: runs of the same location (mean run length 50 sections) with shares given by location_share,
+        - consumers: a take-off at a node with probability consumer_probability, log-normal sizes with a few large consumers;
+          take-offs are scaled to 95 % of the inlet mass flow,
+        - DN: smallest size from the thickness data with flow velocity below v_design_m_per_s (DN decreases along the line),
+        - insulation: damaged (0) with probability damage_probability, otherwise intact (1),
+        - coordinates: random walk with slowly changing heading, step equal to the section length (end node of each section in the flow direction).
+
+    :param n_sections: Number of sections of the supply line (and of the return line).
+    :param seed: Seed of the random number generator.
+    :param th_values: Pipe and insulation thickness data. Default: 'insulation_thickness.json' in the 'data' folder.
+    :param initial_values: BranchInitialConfig object (inlet flow). Default: BranchInitialConfig().
+    :param location_share: Share of sections per location, e.g. {'channel': 0.85, 'surface': 0.05, 'soil': 0.10}.
+    :param consumer_probability: Probability of a consumer at a node.
+    :param damage_probability: Probability of damaged insulation of a section.
+    :param v_design_m_per_s: Design flow velocity used to select DN in [m/s].
+    :param n_extra_return: Number of additional sections at the start of the return line.
+    :param start_lat: Latitude of the start of the branch.
+    :param start_lon: Longitude of the start of the branch.
+    :return df_input_data: DataFrame with supply and return data.
+
+    """
+    rng = np.random.default_rng(seed)
+    th_all = th_values or read_thickness_data(thickness_data_location)
+    iv = initial_values or BranchInitialConfig()
+    location_share = location_share or {PipeSectionLocation.loc1.value: 0.85, PipeSectionLocation.loc2.value: 0.05, PipeSectionLocation.loc3.value: 0.10}
+
+    # (i) Lengths:
+    l_m = np.clip(rng.lognormal(np.log(35), 0.9, n_sections), 0.5, 300)
+
+    # (ii) Locations in runs:
+    run_lengths = rng.geometric(1 / 50, n_sections // 10 + 10)
+    while run_lengths.sum() < n_sections:
+        run_lengths = np.concatenate([run_lengths, rng.geometric(1 / 50, n_sections // 10 + 10)])
+    location_names = np.array(list(location_share.keys()))
+    location_p = np.array(list(location_share.values()), dtype = np.float64)
+    run_locations = rng.choice(location_names, size = len(run_lengths), p = location_p / location_p.sum())
+    location = np.repeat(run_locations, run_lengths)[:n_sections]
+
+    # (iii) Consumers:
+    den_kg_per_m3 = 935.0                                                      # approximate density of water in the supply line
+    mdot_in_kg_per_s = iv.vdot_m3_per_h * den_kg_per_m3 / 3600
+    consumer = rng.random(n_sections) < consumer_probability
+    consumer[-1] = False                                                       # end of the line
+    weight = rng.lognormal(0, 0.5, n_sections) * np.where(rng.random(n_sections) < 0.01, 20, 1) * consumer
+    mdot_takeoff_kg_per_s = - 0.95 * mdot_in_kg_per_s * weight / max(weight.sum(), 1e-12)
+
+    # (iv) DN from the mass flow in each section:
+    mdot_section_kg_per_s = mdot_in_kg_per_s + np.concatenate([[0.0], np.cumsum(mdot_takeoff_kg_per_s)[:-1]])
+    dn_available = np.array(sorted(map(int, th_all["th_pipe"].keys())))
+    d_ext_available_mm = np.array([th_all["d_pipe_ext"][str(dn)] for dn in dn_available], dtype = np.float64)
+    d_int_available_m = (d_ext_available_mm - 2 * np.array([th_all["th_pipe"][str(dn)] for dn in dn_available])) / 1000
+    d_required_m = np.sqrt(4 * mdot_section_kg_per_s / (np.pi * den_kg_per_m3 * v_design_m_per_s))
+    idx_dn = np.minimum(np.searchsorted(d_int_available_m, d_required_m), len(dn_available) - 1)
+    d_nom_mm = dn_available[idx_dn]
+    d_ext_mm = d_ext_available_mm[idx_dn]
+
+    # (v) Insulation:
+    insulation = np.where(rng.random(n_sections) < damage_probability, 0, 1)
+
+    # (vi) Coordinates:
+    heading_rad = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.3, n_sections))
+    m_per_deg_lon = M_PER_DEG_LAT * np.cos(np.radians(start_lat))
+    lat_nodes = start_lat + np.concatenate([[0.0], np.cumsum(l_m * np.sin(heading_rad))]) / M_PER_DEG_LAT    # start node + end nodes of the sections
+    lon_nodes = start_lon + np.concatenate([[0.0], np.cumsum(l_m * np.cos(heading_rad))]) / m_per_deg_lon
+    lat, lon = lat_nodes[1:], lon_nodes[1:]
+
+    df_supply = pd.DataFrame({
+        "Direction": "Supply",
+        "DN [mm]": d_nom_mm,
+        "Dext [mm]": d_ext_mm.astype(np.int64),
+        "Location": location,
+        "L [m]": l_m,
+        "Longitude": lon,
+        "Latitude": lat,
+        "mdot take-off [kg/s]": mdot_takeoff_kg_per_s,
+        "Insulation": insulation
+    })
+    # Return line: same route in the opposite direction, consumers return the supply take-offs
+    # (coordinates are start nodes in the flow direction ---> end nodes of the supply sections, as in the reference data)
+    df_return = df_supply.iloc[::-1].reset_index(drop = True)
+    df_return["Direction"] = "Return"
+    df_return["mdot take-off [kg/s]"] = - df_return["mdot take-off [kg/s]"] + 0.0      # + 0.0 ---> no negative zeros
+    df_extra = df_return.iloc[[0] * n_extra_return].reset_index(drop = True)  # short connection sections (a spur) at the end of the branch
+    df_extra["L [m]"] = np.clip(rng.lognormal(np.log(5), 0.5, n_extra_return), 0.5, 50)
+    df_extra["mdot take-off [kg/s]"] = 0.0
+    spur_heading_rad = rng.uniform(0, 2 * np.pi)
+    spur_m = np.cumsum(df_extra["L [m]"].to_numpy()[::-1])[::-1]               # distance of each start node from the end of the supply line
+    df_extra["Longitude"] = lon_nodes[-1] + spur_m * np.cos(spur_heading_rad) / m_per_deg_lon
+    df_extra["Latitude"] = lat_nodes[-1] + spur_m * np.sin(spur_heading_rad) / M_PER_DEG_LAT
+    df_return = pd.concat([df_extra, df_return], ignore_index = True)
+
+    df_input_data = pd.concat([df_supply, df_return], ignore_index = True)
+    df_input_data.insert(0, "n", np.arange(1, len(df_input_data) + 1))
+    return df_input_data
+
+
+def write_synthetic_branch(output_file:str, n_sections:int, seed:int = 0, **kwargs) -> str:
+    """
+    Generates a synthetic branch (see generate_synthetic_branch()) and writes it to an input file.
+
+    :param output_file: Path to the output file. CSV (';' separator) or a binary format of convert_input_file() in utils/readers.py.
+    :param n_sections: Number of sections of the supply line (and of the return line).
+    :param seed: Seed of the random number generator.
+    :param kwargs: Other arguments of generate_synthetic_branch().
+    :return output_file: Path to the output file.
+
+    """
+    df_input_data = generate_synthetic_branch(n_sections, seed, **kwargs)
+    if output_file.lower().endswith(".csv"):
+        df_input_data.to_csv(output_file, sep=';', index = False)
+    else:
+        from utils.readers import convert_input_file
+        csv_file = output_file + ".tmp.csv"
+        df_input_data.to_csv(csv_file, sep=';', index = False)
+        try:
+            convert_input_file(csv_file, output_file)
+        finally:
+            os.remove(csv_file)
+    return output_file
@@ -0,0 +1,256 @@
+import math
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+
+from kernels import numba, select_backend
+from section_arrays import pair_return_consumers
+from utils.constants import TZERO
+from utils.functions import calculate_fluid_density, calculate_fluid_specific_heat
+
+
+#==========================| LINE KERNEL |=====================================
+def _simulate_line(t_in_series_c, load_series, is_return, t_consumer_release_c, r_tot_w_per_k, t_amb_c, mass_kg, mdot_design_kg_per_s,
+                   mdot_step_design_kg_per_s, cp, dt_s, max_delay_s, buffer, buffer_start, buffer_len, record_index,
+                   t_record_c, t_end_c, qdot_loss_w, qdot_consumer_w):
+    """
+    Node method for one line (reference implementation; compiled by Numba when available). All time steps are calculated in one call.
+
+    Each section keeps the history of its inlet temperature in a ring buffer (buffer[buffer_start[i] : buffer_start[i] + buffer_len[i]],
+    slot = time step % buffer_len[i]). The fluid leaving a section entered it one transport delay earlier (delay = fluid mass in the
+    section / mass flow of the current step) and cooled on the way:
+        T_out = T_amb + (T_in(t - delay) - T_amb) * exp(- delay / (R_tot * m_fluid * cp)).
+    A time step costs O(sections) and does not allocate memory.
+
+    :param t_in_series_c: Temperature at the start of the line in each time step in [°C].
+    :param load_series: Mass flow factor in each time step (multiplies the design mass flows of all sections and consumers).
+    :param is_return: False for the supply line, True for the return line (fluid from the consumers mixes into the line).
+    :param t_consumer_release_c: Temperature of the fluid returning from the consumers in [°C].
+    :param r_tot_w_per_k, t_amb_c: Section arrays (see SectionArrays).
+    :param mass_kg: Fluid mass in each section in [kg].
+    :param mdot_design_kg_per_s: Mass flow in each section at load 1 in [kg/s].
+    :param mdot_step_design_kg_per_s: Mass flow added after each node at load 1 in [kg/s] (supply: take-off, return: flow from the consumer).
+    :param cp: Specific heat of the fluid in [J/kgK].
+    :param dt_s: Time step in [s].
+    :param max_delay_s: Longest transport delay in [s] (sections without flow).
+    :param buffer, buffer_start, buffer_len: Ring buffers of the inlet temperatures (see above).
+    :param record_index: Sections whose outlet temperatures are recorded.
+    :param t_record_c: Output array (time steps x recorded sections) ---> filled in place.
+    :param t_end_c, qdot_loss_w, qdot_consumer_w: Output arrays (time steps) ---> temperature at the end of the line,
+        heat flow loss of the line and heat flow delivered to the consumers (supply only) ---> filled in place.
+
+    """
+    n_steps = t_in_series_c.shape[0]
+    n_sections = r_tot_w_per_k.shape[0]
+    n_record = record_index.shape[0]
+
+    # (i) Initial state: steady state of the first time step
+    load = load_series[0]
+    t_in_c = t_in_series_c[0]
+    for i in range(n_sections):
+        for j in range(buffer_len[i]):
+            buffer[buffer_start[i] + j] = t_in_c
+        mdot = load * mdot_design_kg_per_s[i]
+        delay_s = max_delay_s if mdot * max_delay_s <= mass_kg[i] else mass_kg[i] / mdot
+        t_out_c = t_amb_c[i] + (t_in_c - t_amb_c[i]) * math.exp(- delay_s / (r_tot_w_per_k[i] * mass_kg[i] * cp))
+        if is_return:
+            mdot_step = load * mdot_step_design_kg_per_s[i]
+            t_in_c = (t_out_c * mdot + t_consumer_release_c * mdot_step) / (mdot + mdot_step) if mdot + mdot_step > 0 else t_out_c
+        else:
+            t_in_c = t_out_c
+
+    # (ii) Time steps:
+    for step in range(n_steps):
+        load = load_series[step]
+        t_in_c = t_in_series_c[step]
+        loss = 0.0
+        consumer = 0.0
+        r = 0
+        t_out_c = t_in_c
+        for i in range(n_sections):
+            start = buffer_start[i]
+            length = buffer_len[i]
+            buffer[start + step % length] = t_in_c
+
+            mdot = load * mdot_design_kg_per_s[i]
+            delay_s = max_delay_s if mdot * max_delay_s <= mass_kg[i] else mass_kg[i] / mdot
+            delay_steps = delay_s / dt_s
+            k = int(delay_steps)
+            frac = delay_steps - k
+            if k > length - 2:
+                k = length - 2
+                frac = 1.0
+            t_newer_c = buffer[start + (step - k) % length]
+            t_older_c = buffer[start + (step - k - 1) % length]
+            t_delayed_c = t_newer_c + frac * (t_older_c - t_newer_c)
+
+            t_out_c = t_amb_c[i] + (t_delayed_c - t_amb_c[i]) * math.exp(- delay_s / (r_tot_w_per_k[i] * mass_kg[i] * cp))
+            if mdot > 0:
+                loss += mdot * cp * (t_delayed_c - t_out_c)
+            else:
+                loss += (t_out_c - t_amb_c[i]) / r_tot_w_per_k[i]
+
+            if r < n_record and record_index[r] == i:
+                t_record_c[step, r] = t_out_c
+                r += 1
+
+            mdot_step = load * mdot_step_design_kg_per_s[i]
+            if is_return:
+                t_in_c = (t_out_c * mdot + t_consumer_release_c * mdot_step) / (mdot + mdot_step) if mdot + mdot_step > 0 else t_out_c
+            else:
+                consumer += abs(mdot_step) * cp * (t_out_c - t_consumer_release_c)
+                t_in_c = t_out_c
+
+        t_end_c[step] = t_out_c
+        qdot_loss_w[step] = loss
+        qdot_consumer_w[step] = consumer
+
+
+_simulate_line_numba = numba.njit(cache = True, nogil = True)(_simulate_line) if numba is not None else None
+
+
+#==========================| RESULTS |=========================================
+@dataclass
+class TransientResult:
+    """
+    Time series of a transient simulation (see simulate_transient()).
+
+    :param time_s: Time of each step in [s].
+    :param t_end_supply_c, t_end_return_c: Temperature at the end of the supply and return line in [°C].
+    :param qdot_loss_supply_w, qdot_loss_return_w: Heat flow loss of the lines in [W].
+    :param qdot_consumer_w: Heat flow delivered to the consumers (take-off temperature - consumer release temperature) in [W].
+    :param record_supply, record_return: Indices of the recorded sections.
+    :param t_record_supply_c, t_record_return_c: Outlet temperatures of the recorded sections in [°C] (time steps x recorded sections).
+    :param delay_supply_s, delay_return_s: Transport delay from the start of the line to the outlet of each section at load 1 in [s].
+
+    """
+    time_s: np.ndarray
+    t_end_supply_c: np.ndarray
+    t_end_return_c: np.ndarray
+    qdot_loss_supply_w: np.ndarray
+    qdot_loss_return_w: np.ndarray
+    qdot_consumer_w: np.ndarray
+    record_supply: np.ndarray
+    record_return: np.ndarray
+    t_record_supply_c: np.ndarray
+    t_record_return_c: np.ndarray
+    delay_supply_s: np.ndarray
+    delay_return_s: np.ndarray
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the time series of the lines (without the recorded sections) as a DataFrame.
+
+        """
+        return pd.DataFrame({
+            "t [s]": self.time_s,
+            "T end supply [°C]": self.t_end_supply_c,
+            "T end return [°C]": self.t_end_return_c,
+            "Qdot loss supply [W]": self.qdot_loss_supply_w,
+            "Qdot loss return [W]": self.qdot_loss_return_w,
+            "Qdot consumer [W]": self.qdot_consumer_w
+        })
+
+
+#==========================| SIMULATION |======================================
+def _series(value, n_steps:int, name:str) -> np.ndarray:
+    series = np.ascontiguousarray(np.broadcast_to(np.asarray(value, dtype = np.float64), (n_steps,)))
+    if not np.isfinite(series).all():
+        raise ValueError(f"Time series '{name}' contains values that are not finite.")
+    return series
+
+
+def _ring_buffers(mass_kg:np.ndarray, mdot_min_kg_per_s:np.ndarray, dt_s:float, max_delay_s:float) -> tuple:
+    """
+    Returns start and length of the ring buffer of each section: long enough for the longest delay (lowest load) of the simulation.
+
+    """
+    with np.errstate(divide = "ignore"):
+        delay_max_s = np.where(mdot_min_kg_per_s > 0, mass_kg / mdot_min_kg_per_s, np.inf)
+    buffer_len = np.ceil(np.minimum(delay_max_s, max_delay_s) / dt_s).astype(np.int64) + 2
+    buffer_start = np.concatenate([[0], np.cumsum(buffer_len)[:-1]]).astype(np.int64)
+    return buffer_start, buffer_len
+
+
+def simulate_transient(arrays_supply, arrays_return, initial_values, t_in_supply_c, load_factor = 1.0, t_in_return_c = None,
+                       dt_s:float = 60.0, record_supply = None, record_return = None, max_delay_s:float = 86_400.0,
+                       backend:str = "auto") -> TransientResult:
+    """
+    Simulates the supply and return line with transport delays (node method, plug flow; see _simulate_line()).
+    Starts from the steady state of the first time step. Section resistances and ambient temperatures are taken from the section arrays.
+
+    Fluid properties are constant per line (at the inlet temperatures of initial_values) and the transport delay of a section
+    is calculated from the mass flow of the current step.
+
+    :param arrays_supply: SectionArrays object of the supply line.
+    :param arrays_return: SectionArrays object of the return line.
+    :param initial_values: BranchInitialConfig object (design flow, temperatures, fluid).
+    :param t_in_supply_c: Supply inlet temperature in [°C]: array (one value per time step) ---> defines the number of steps.
+    :param load_factor: Mass flow factor (scalar or array): inlet flow and all consumer take-offs are multiplied by it.
+    :param t_in_return_c: Temperature at the start of the return line in [°C] (scalar or array). Default: value from initial_values.
+    :param dt_s: Time step in [s].
+    :param record_supply: Indices of supply sections whose outlet temperatures are recorded in every step. Default: none.
+    :param record_return: Indices of return sections whose outlet temperatures are recorded in every step. Default: none.
+    :param max_delay_s: Longest transport delay in [s] (limits the ring buffers of sections with very low or no flow).
+    :param backend: 'auto', 'python' or 'numba'. See select_backend() in kernels.py.
+    :return result: TransientResult object.
+
+    """
+    iv = initial_values
+    kernel = _simulate_line_numba if select_backend(backend) == "numba" else _simulate_line
+    t_in_supply_series_c = np.ascontiguousarray(t_in_supply_c, dtype = np.float64)
+    if t_in_supply_series_c.ndim != 1 or len(t_in_supply_series_c) == 0:
+        raise ValueError("Supply inlet temperature must be a non-empty 1-D array (one value per time step).")
+    n_steps = len(t_in_supply_series_c)
+    t_in_supply_series_c = _series(t_in_supply_series_c, n_steps, "t_in_supply_c")
+    load_series = _series(load_factor, n_steps, "load_factor")
+    t_in_return_series_c = _series(iv.t_in_return_c if t_in_return_c is None else t_in_return_c, n_steps, "t_in_return_c")
+    if (load_series < 0).any():
+        raise ValueError("Load factor cannot be negative.")
+    if dt_s <= 0:
+        raise ValueError("Time step must be positive.")
+
+    # Design mass flows (same initial values as solve_branch() in kernels.py):
+    mdot_in_kg_per_s = iv.vdot_m3_per_h * calculate_fluid_density(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid) / 3600
+    step_supply_kg_per_s = arrays_supply.mdot_takeoff_kg_per_s
+    mdot_supply_kg_per_s = mdot_in_kg_per_s + np.concatenate([[0.0], np.cumsum(step_supply_kg_per_s)[:-1]])
+    step_return_kg_per_s = pair_return_consumers(step_supply_kg_per_s, arrays_return.mdot_takeoff_kg_per_s)
+    mdot_return_kg_per_s = mdot_supply_kg_per_s[-1] + np.concatenate([[0.0], np.cumsum(step_return_kg_per_s)[:-1]])
+
+    lines = {}
+    for direction, arrays, mdot_kg_per_s, step_kg_per_s, t_design_c, t_in_series_c, record in (
+            ("supply", arrays_supply, mdot_supply_kg_per_s, step_supply_kg_per_s, iv.t_in_supply_c, t_in_supply_series_c, record_supply),
+            ("return", arrays_return, mdot_return_kg_per_s, step_return_kg_per_s, iv.t_in_return_c, t_in_return_series_c, record_return)):
+        den = calculate_fluid_density(iv.p_nominal_pa, t_design_c - TZERO, iv.fluid)
+        cp = calculate_fluid_specific_heat(iv.p_nominal_pa, t_design_c - TZERO, iv.fluid)
+        mass_kg = den * np.pi / 4 * arrays.d_int_m ** 2 * arrays.l_m
+        mdot_kg_per_s = np.maximum(mdot_kg_per_s, 0.0)
+        buffer_start, buffer_len = _ring_buffers(mass_kg, load_series.min() * mdot_kg_per_s, dt_s, max_delay_s)
+        record_index = np.unique(np.asarray([] if record is None else record, dtype = np.int64))
+        if len(record_index) and (record_index[0] < 0 or record_index[-1] >= len(arrays)):
+            raise ValueError(f"Recorded section index out of range for the {direction} line (0 - {len(arrays) - 1}).")
+
+        line = {"t_record_c": np.empty((n_steps, len(record_index))), "t_end_c": np.empty(n_steps), "qdot_loss_w": np.empty(n_steps),
+                "qdot_consumer_w": np.empty(n_steps), "record_index": record_index}
+        with np.errstate(divide = "ignore"):
+            line["delay_s"] = np.cumsum(np.minimum(np.where(mdot_kg_per_s > 0, mass_kg / mdot_kg_per_s, np.inf), max_delay_s))
+        kernel(t_in_series_c, load_series, direction == "return", float(iv.t_consumer_release_c), arrays.r_tot_w_per_k, arrays.t_amb_c,
+               mass_kg, mdot_kg_per_s, np.ascontiguousarray(step_kg_per_s, dtype = np.float64), float(cp), float(dt_s), float(max_delay_s),
+               np.empty(int(buffer_len.sum())), buffer_start, buffer_len, record_index,
+               line["t_record_c"], line["t_end_c"], line["qdot_loss_w"], line["qdot_consumer_w"])
+        lines[direction] = line
+
+    return TransientResult(
+        time_s = np.arange(n_steps) * dt_s,
+        t_end_supply_c = lines["supply"]["t_end_c"],
+        t_end_return_c = lines["return"]["t_end_c"],
+        qdot_loss_supply_w = lines["supply"]["qdot_loss_w"],
+        qdot_loss_return_w = lines["return"]["qdot_loss_w"],
+        qdot_consumer_w = lines["supply"]["qdot_consumer_w"],
+        record_supply = lines["supply"]["record_index"],
+        record_return = lines["return"]["record_index"],
+        t_record_supply_c = lines["supply"]["t_record_c"],
+        t_record_return_c = lines["return"]["t_record_c"],
+        delay_supply_s = lines["supply"]["delay_s"],
+        delay_return_s = lines["return"]["delay_s"]
+    )
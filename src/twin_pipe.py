@@ -0,0 +1,192 @@
+import numpy as np
+from dataclasses import dataclass, replace
+
+from kernels import build_property_table, solve_line, COL_T, COL_MDOT
+from model_param import TwinPipeCoeff
+from section_arrays import location_codes, pair_return_consumers
+from utils.constants import TZERO
+from utils.functions import calculate_fluid_density, calculate_fluid_specific_heat
+
+
+#==========================| COUPLING GEOMETRY |===============================
+@dataclass
+class TwinPipeCoupling:
+    """
+    Overlap of the supply and return sections laid as twin pipes. Computed once per branch geometry and reused for every solve (e.g. hourly time series).
+
+    The branch is divided into segments at all section boundaries of both lines (position along the branch). Each segment lies in one supply
+    and one return section; only segments where both sections are at the twin pipe location are kept.
+
+    :param l_segment_m: Length of each coupled segment in [m].
+    :param supply_index: Supply section of each coupled segment.
+    :param return_index: Return section of each coupled segment.
+    :param g_mutual_w_per_k: Mutual thermal conductance of each segment in [W/K] (segment length / r_mutual_mk_per_w).
+    :param g_supply_w_per_k: Sum of the mutual conductances per supply section in [W/K].
+    :param g_return_w_per_k: Sum of the mutual conductances per return section in [W/K].
+
+    """
+    l_segment_m: np.ndarray
+    supply_index: np.ndarray
+    return_index: np.ndarray
+    g_mutual_w_per_k: np.ndarray
+    g_supply_w_per_k: np.ndarray
+    g_return_w_per_k: np.ndarray
+
+
+def _sum_by_section(index:np.ndarray, weights:np.ndarray, n_sections:int) -> np.ndarray:
+    return np.bincount(index, weights = weights, minlength = n_sections).astype(np.float64, copy = False)    # float also without coupled segments
+
+
+def build_twin_pipe_coupling(arrays_supply, arrays_return, twin_pipe_coeff = TwinPipeCoeff) -> TwinPipeCoupling:
+    """
+    Matches the supply and return sections by their position along the branch.
+    The supply line starts at position 0, the return line starts at the end of the branch (sum of the supply lengths) and runs back towards 0.
+
+    :param arrays_supply: SectionArrays object of the supply line.
+    :param arrays_return: SectionArrays object of the return line.
+    :param twin_pipe_coeff: TwinPipeCoeff class (or object) with the mutual resistance and the twin pipe location.
+    :return coupling: TwinPipeCoupling object.
+
+    """
+    l_branch_m = arrays_supply.l_m.sum()
+    end_supply_m = np.cumsum(arrays_supply.l_m)                                # position of the end of each supply section
+    end_return_m = np.cumsum(arrays_return.l_m)                                # distance of the end of each return section from the end of the branch
+
+    boundaries_m = np.unique(np.concatenate([[0.0], end_supply_m, np.clip(l_branch_m - end_return_m, 0.0, l_branch_m)]))
+    l_segment_m = np.diff(boundaries_m)
+    midpoint_m = boundaries_m[:-1] + l_segment_m / 2
+    supply_index = np.searchsorted(end_supply_m, midpoint_m)
+    return_index = np.searchsorted(end_return_m, l_branch_m - midpoint_m)
+
+    code = location_codes[twin_pipe_coeff.location]
+    valid = (l_segment_m > 0) & (supply_index < len(arrays_supply)) & (return_index < len(arrays_return))
+    valid[valid] &= (arrays_supply.location_code[supply_index[valid]] == code) & (arrays_return.location_code[return_index[valid]] == code)
+
+    supply_index, return_index = supply_index[valid], return_index[valid]
+    g_mutual_w_per_k = l_segment_m[valid] / twin_pipe_coeff.r_mutual_mk_per_w
+    return TwinPipeCoupling(
+        l_segment_m = l_segment_m[valid],
+        supply_index = supply_index,
+        return_index = return_index,
+        g_mutual_w_per_k = g_mutual_w_per_k,
+        g_supply_w_per_k = _sum_by_section(supply_index, g_mutual_w_per_k, len(arrays_supply)),
+        g_return_w_per_k = _sum_by_section(return_index, g_mutual_w_per_k, len(arrays_return))
+    )
+
+
+#==========================| COUPLED SOLVER |==================================
+def _section_mean_temperature(out:np.ndarray, t_in_c:float) -> np.ndarray:
+    """
+    Mean fluid temperature of each section (arithmetic mean of the temperatures at the start and at the end of the section).
+
+    """
+    t_out_c = out[:, COL_T]
+    t_start_c = np.concatenate([[t_in_c], t_out_c[:-1]])
+    return (t_start_c + t_out_c) / 2
+
+
+def _effective_ambient(arrays, g_coupled_w_per_k:np.ndarray, t_other_c:np.ndarray):
+    """
+    Combines the resistance to the surroundings and the mutual resistance to the other pipe into one effective resistance and ambient temperature:
+        Q̇ = (T - T_amb) / R_tot + (T - T_other) * G_m = (T - T_amb_eff) / R_eff.
+
+    """
+    g_ambient_w_per_k = 1 / arrays.r_tot_w_per_k
+    g_total_w_per_k = g_ambient_w_per_k + g_coupled_w_per_k
+    t_amb_eff_c = (g_ambient_w_per_k * arrays.t_amb_c + g_coupled_w_per_k * t_other_c) / g_total_w_per_k
+    return replace(arrays, r_tot_w_per_k = 1 / g_total_w_per_k, t_amb_c = t_amb_eff_c)
+
+
+def solve_branch_twin_pipe(arrays_supply, arrays_return, initial_values, coupling:TwinPipeCoupling = None, property_table = None,
+                           tolerance:float = 0.001, backend:str = "auto", max_iterations:int = 100,
+                           coupling_tolerance_k:float = 1e-4, max_coupling_iterations:int = 50, relaxation:float = 1.0) -> tuple:
+    """
+    Solves the supply and return lines together with heat exchange between twin pipe sections (mutual resistance, see TwinPipeCoeff).
+
+    Block Gauss-Seidel iteration: each iteration solves the whole supply line with the return temperatures of the previous iteration,
+    then the whole return line with the new supply temperatures (array kernel, one call per line). The coupling enters each section as an
+    effective resistance and ambient temperature (see _effective_ambient()), the mapping between the lines is a weighted bincount over the
+    coupled segments. Iterations stop when the largest change of the outlet temperatures is below coupling_tolerance_k.
+
+    'Qdot loss [W]' of a coupled section includes the heat exchanged with the other pipe; the sum of both lines is the loss to the surroundings.
+
+    :param arrays_supply: SectionArrays object of the supply line.
+    :param arrays_return: SectionArrays object of the return line.
+    :param initial_values: BranchInitialConfig object.
+    :param coupling: TwinPipeCoupling object. Default: build_twin_pipe_coupling(arrays_supply, arrays_return).
+    :param property_table: PropertyTable object. Default: built for the temperature range of the branch.
+    :param tolerance: Convergence tolerance of the outlet temperature iteration.
+    :param backend: 'auto', 'python' or 'numba'. See select_backend() in kernels.py.
+    :param max_iterations: Maximum number of iterations of the outlet temperature calculation per section.
+    :param coupling_tolerance_k: Convergence tolerance of the coupling iteration in [K].
+    :param max_coupling_iterations: Maximum number of coupling iterations.
+    :param relaxation: Under-relaxation factor (0 - 1] of the temperatures of the other pipe. Values below 1 stabilise strongly coupled long lines at low flow.
+    :returns:
+        out_supply: Array (n supply sections x 13 columns)
+        out_return: Array (n return sections x 13 columns)
+        info: Dictionary with the number of coupling iterations, the last temperature change, convergence flag, coupled length
+              and SolverDiagnostics objects of the last solve of both lines
+
+    """
+    iv = initial_values
+    coupling = coupling or build_twin_pipe_coupling(arrays_supply, arrays_return)
+    if property_table is None:
+        t_min_c = min(arrays_supply.t_amb_c.min(), arrays_return.t_amb_c.min()) - 1
+        t_max_c = max(iv.t_in_supply_c, iv.t_in_return_c, iv.t_consumer_release_c) + 1
+        property_table = build_property_table(iv.p_nominal_pa, iv.fluid, t_min_c, t_max_c)
+
+    # Initial values (same as in solve_branch() in kernels.py):
+    den_in_kg_per_m3 = calculate_fluid_density(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid)
+    mdot_in_s_kg_per_s = iv.vdot_m3_per_h * den_in_kg_per_m3 / 3600
+    qdot_in_tot_s_w = mdot_in_s_kg_per_s * (iv.t_in_supply_c - TZERO) * calculate_fluid_specific_heat(iv.p_nominal_pa, iv.t_in_supply_c - TZERO, iv.fluid)
+    cp_in_r_ws_per_kgk = calculate_fluid_specific_heat(iv.p_nominal_pa, iv.t_in_return_c - TZERO, iv.fluid)
+    mdot_consumer_r_kg_per_s = pair_return_consumers(arrays_supply.mdot_takeoff_kg_per_s, arrays_return.mdot_takeoff_kg_per_s)
+    l_branch_m = arrays_supply.l_m.sum()
+    line_kwargs = {"property_table": property_table, "t_consumer_release_c": iv.t_consumer_release_c, "tolerance": tolerance,
+                   "backend": backend, "max_iterations": max_iterations, "return_diagnostics": True}
+
+    def solve_supply(arrays):
+        return solve_line(arrays, iv.t_in_supply_c, mdot_in_s_kg_per_s, 0.0, qdot_in_tot_s_w, **line_kwargs)
+
+    def solve_return(arrays, mdot_in_r_kg_per_s):
+        return solve_line(arrays, iv.t_in_return_c, mdot_in_r_kg_per_s, l_branch_m, mdot_in_r_kg_per_s * (iv.t_in_return_c - TZERO) * cp_in_r_ws_per_kgk,
+                          mdot_step_kg_per_s = mdot_consumer_r_kg_per_s, **line_kwargs)
+
+    # Start: uncoupled lines
+    out_supply, diagnostics_supply = solve_supply(arrays_supply)
+    out_return, diagnostics_return = solve_return(arrays_return, out_supply[-1, COL_MDOT])
+
+    g_s, g_r = coupling.g_supply_w_per_k, coupling.g_return_w_per_k
+    coupled_s, coupled_r = g_s > 0, g_r > 0
+    t_other_s_c, t_other_r_c = None, None
+    change_k = np.inf if coupled_s.any() else 0.0                              # nothing to couple ---> uncoupled solution
+    n_coupling_iterations = 0
+    while (change_k > coupling_tolerance_k) and (n_coupling_iterations < max_coupling_iterations):
+        n_coupling_iterations += 1
+        t_prev_s, t_prev_r = out_supply[:, COL_T].copy(), out_return[:, COL_T].copy()
+
+        # (i) Supply with the return temperatures (conductance-weighted mean over the coupled segments of each supply section):
+        t_mean_r_c = _section_mean_temperature(out_return, iv.t_in_return_c)
+        t_new_s_c = _sum_by_section(coupling.supply_index, coupling.g_mutual_w_per_k * t_mean_r_c[coupling.return_index], len(arrays_supply))
+        t_new_s_c[coupled_s] /= g_s[coupled_s]
+        t_other_s_c = t_new_s_c if t_other_s_c is None else t_other_s_c + relaxation * (t_new_s_c - t_other_s_c)
+        out_supply, diagnostics_supply = solve_supply(_effective_ambient(arrays_supply, g_s, t_other_s_c))
+
+        # (ii) Return with the new supply temperatures:
+        t_mean_s_c = _section_mean_temperature(out_supply, iv.t_in_supply_c)
+        t_new_r_c = _sum_by_section(coupling.return_index, coupling.g_mutual_w_per_k * t_mean_s_c[coupling.supply_index], len(arrays_return))
+        t_new_r_c[coupled_r] /= g_r[coupled_r]
+        t_other_r_c = t_new_r_c if t_other_r_c is None else t_other_r_c + relaxation * (t_new_r_c - t_other_r_c)
+        out_return, diagnostics_return = solve_return(_effective_ambient(arrays_return, g_r, t_other_r_c), out_supply[-1, COL_MDOT])
+
+        change_k = max(np.abs(out_supply[:, COL_T] - t_prev_s).max(initial = 0.0), np.abs(out_return[:, COL_T] - t_prev_r).max(initial = 0.0))
+
+    info = {
+        "coupling_iterations": n_coupling_iterations,
+        "max_change_k": float(change_k),
+        "converged": bool(change_k <= coupling_tolerance_k),
+        "coupled_length_m": float(coupling.l_segment_m.sum()),
+        "diagnostics_supply": diagnostics_supply,
+        "diagnostics_return": diagnostics_return
+    }
+    return out_supply, out_return, info
@@ -1 +1,3 @@
-TZERO = -273.15                                                                # Absolute zero 
\ No newline at end of file
+TZERO = -273.15                                                                # Absolute zero
+SOLVER_VERSION = "1.0.1"                                                       # Version of the solver - part of the result cache key (change it when the calculation changes!)
+EARTH_RADIUS_M = 6_371_008.8                                                   # Mean Earth radius in [m]
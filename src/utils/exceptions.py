@@ -4,3 +4,20 @@ class SupplyDataMissingError(Exception):
     """
     pass
 
+
+class CalculationCancelledError(Exception):
+    """
+    A custom exception raised when a calculation is stopped with a CancellationToken (see utils/progress.py).
+    """
+    pass
+
+
+class InputValidationError(ValueError):
+    """
+    A custom exception raised when the input data has problems (see validate_input_frame() in utils/validation.py).
+    The report attribute lists all problems with the row numbers.
+    """
+
+    def __init__(self, message:str, report = None):
+        super().__init__(message)
+        self.report = report
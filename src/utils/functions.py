@@ -4,6 +4,7 @@ import CoolProp.CoolProp as CP                                                 #
 from model_param import ThermalCoeff
 from config_data import AmbientTemp
 from typing import Tuple                                                       # for type hints of function arguments
+from utils.constants import EARTH_RADIUS_M
 
 
 def calculate_r_conduction(d_outer_m:float, d_inner_m:float, l_m:float, k_w_per_mk:float) -> float:   # toplotna upornost - Rth [K/W]
@@ -59,6 +60,23 @@ def calculate_r_total(d_pipe_inner_m:float, l_m:float, h_mat1_w_per_m2k:float, d
     return r_tot
 
 
+def calculate_haversine_distance(lon1:float, lat1:float, lon2:float, lat2:float) -> float:
+    """
+    Calculates the great-circle distance between two points (haversine formula). Works on arrays (whole lines in one call).
+
+    :param lon1, lat1: coordinates of the first point in [°]
+    :param lon2, lat2: coordinates of the second point in [°]
+    :return distance_m: distance in [m]
+
+    """
+    lat1, lat2 = np.radians(lat1), np.radians(lat2)
+    sin_dlat = np.sin((lat2 - lat1) / 2)
+    sin_dlon = np.sin(np.radians(np.subtract(lon2, lon1)) / 2)
+    a = sin_dlat * sin_dlat + np.cos(lat1) * np.cos(lat2) * sin_dlon * sin_dlon
+    distance_m = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return distance_m
+
+
 def calculate_heat_flow_loss(r_tot:float, t_outer:float, t_inner:float) -> float:
     """
     Calculates the flow of thermal energy loss in [W].
@@ -212,7 +230,7 @@ def calculate_insulation_thickness(location:str, d_pipe_nominal:str, th_insulati
 
  
 def calculate_output_temperature(t_in:float, t_amb:float, mdot:float, cp:float,
-                                 r_tot:float, tolerance:float = 0.001) -> Tuple[float, float]:
+                                 r_tot:float, tolerance:float = 0.001, max_iterations:int = 100, return_diagnostics:bool = False) -> Tuple[float, float]:
     """
     Iteratively compute the outlet temperature accounting for energy loss and return the final heat loss.
 
@@ -222,10 +240,15 @@ def calculate_output_temperature(t_in:float, t_amb:float, mdot:float, cp:float,
     :param cp: Specific heat coefficient in [Ws/kgK]
     :param r_tot: Total thermal resistance in [K/W]
     :param tolerance: Convergence tolerance (default 0.01 = 1%)
+    :param max_iterations: Maximum number of iterations of the while loop. If reached, the last values are returned (not converged ---> see the residual).
+    :param return_diagnostics: If True, the number of iterations, the final residual and the ambient clamp flag are returned as well
     
     :returns:
         t_out_c: Final outlet temperature in [°C]
         qdot_loss: Final heat flow loss in [W]
+        n_iterations: Number of iterations of the while loop (only if return_diagnostics is True)
+        residual: Relative change of the outlet temperature in the last iteration (only if return_diagnostics is True)
+        clamped: True if the outlet temperature crossed the ambient temperature and was limited to it (only if return_diagnostics is True)
         
     """
     qdot_loss_initial = calculate_heat_flow_loss(r_tot, t_amb, t_in)
@@ -234,13 +257,16 @@ def calculate_output_temperature(t_in:float, t_amb:float, mdot:float, cp:float,
     t_out = t_in - (qdot_loss_initial / (mdot * cp))                           # calculates the outlet temperature value for the first iteration 
     
     qdot_loss = qdot_loss_initial
+    n_iterations = 0
+    clamped = False
+    residual = abs((t_out_ref - t_out) / t_out_ref)
     
-    while abs((t_out_ref - t_out) / t_out_ref) > tolerance:                    # loops until the temperature at the outlet node (T_out) is calculated 
-        if t_out <= t_amb:                                                     # if the temperature inside the pipe is equal to the temperature around it
-            #t_out_ref = t_out
+    while (residual > tolerance) and (n_iterations < max_iterations):          # loops until the temperature at the outlet node (T_out) is calculated 
+        n_iterations += 1
+        if (t_out - t_amb) * (t_in - t_amb) <= 0:                              # if the temperature inside the pipe reaches the temperature around it (cooling or heat gain)
             t_out = t_amb
+            clamped = True
             break
-            qdot_loss = 0.0   
         else:
             if (t_in <= 0) or (t_out <= 0):
                 raise ValueError(f"Temperature values at the inlet ({t_in}°C) and the outlet ({t_out}°C) nodes cannot be zero or negative.")
@@ -254,7 +280,10 @@ def calculate_output_temperature(t_in:float, t_amb:float, mdot:float, cp:float,
                             
             t_out_ref = t_out                                                  # T_ref becomes the current T_out
             t_out = t_in - (qdot_loss / (mdot * cp))                           # a new T_out is calculated (until new T_out < current T_out)
+            residual = abs((t_out_ref - t_out) / t_out_ref)
             
+    if return_diagnostics:
+        return t_out, qdot_loss, n_iterations, residual, clamped
     return t_out, qdot_loss
 
 
@@ -0,0 +1,198 @@
+import json
+import time
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+
+#==========================| RUN REPORT |======================================
+class RunReport:
+    """
+    Collects instrumentation data of a Branch run (opt-in: Branch(instrument=True) ---> Branch.report).
+
+    Recorded data:
+        - wall time and number of calls per phase (e.g. 'supply', 'supply.properties', 'supply.temperature', 'supply.dataframe'),
+        - number of fluid property evaluations (CoolProp calls) per property,
+        - fixed-point iteration counts of calculate_output_temperature() per section and line,
+        - peak traced memory (tracemalloc) per phase,
+        - number of rows written per output DataFrame.
+
+    Phases can also be recorded around user code, e.g.:
+        with network.report.phase("plots"):
+            plot_branch("all")
+
+    """
+
+    def __init__(self, trace_memory:bool = True):
+        """
+        :param trace_memory: If True, peak memory is traced with tracemalloc (slows down memory allocation while a phase is running).
+
+        """
+        self.trace_memory = trace_memory
+        self.phases = {}                                                       # {phase: {"wall_time_s": float, "calls": int, "peak_memory_bytes": int (phases recorded with phase() only)}}
+        self.property_evaluations = {}                                         # {property: number of evaluations}
+        self.iterations = {}                                                   # {line: [iterations per section]}
+        self.rows_written = {}                                                 # {DataFrame: number of rows}
+        self._depth = 0                                                        # nesting level of phases (tracemalloc is started by the outermost phase)
+
+    #______________________ Recording _________________________________________
+
+    def _phase_entry(self, name:str) -> dict:
+        if name not in self.phases:
+            self.phases[name] = {"wall_time_s": 0.0, "calls": 0}
+        return self.phases[name]
+
+    @contextmanager
+    def phase(self, name:str):
+        """
+        Context manager recording wall time (and peak memory) of a phase. Time of repeated phases with the same name is summed.
+
+        :param name: Name of the phase.
+
+        """
+        entry = self._phase_entry(name)
+        entry.setdefault("peak_memory_bytes", 0)
+        started_tracing = False
+        if self.trace_memory and self._depth == 0:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            entry["wall_time_s"] += time.perf_counter() - start
+            entry["calls"] += 1
+            self._depth -= 1
+            if self.trace_memory and tracemalloc.is_tracing():
+                entry["peak_memory_bytes"] = max(entry["peak_memory_bytes"], tracemalloc.get_traced_memory()[1])
+                if started_tracing:
+                    tracemalloc.stop()
+
+    def lap(self, name:str, start:float) -> float:
+        """
+        Adds the time since start to a phase (for phases inside loops, without a context manager).
+
+        :param name: Name of the phase.
+        :param start: Start time from time.perf_counter().
+        :return now: Current time from time.perf_counter() (start of the next lap).
+
+        """
+        now = time.perf_counter()
+        entry = self._phase_entry(name)
+        entry["wall_time_s"] += now - start
+        entry["calls"] += 1
+        return now
+
+    def count_property(self, name:str, n:int = 1) -> None:
+        self.property_evaluations[name] = self.property_evaluations.get(name, 0) + n
+
+    def add_iterations(self, line:str, n_iterations:int) -> None:
+        self.iterations.setdefault(line, []).append(n_iterations)
+
+    def add_rows(self, table:str, n:int = 1) -> None:
+        self.rows_written[table] = self.rows_written.get(table, 0) + n
+
+    def reset(self) -> None:
+        """
+        Deletes all recorded data.
+
+        """
+        self.phases.clear()
+        self.property_evaluations.clear()
+        self.iterations.clear()
+        self.rows_written.clear()
+
+    #______________________ Output ____________________________________________
+
+    def iteration_histogram(self, line:str) -> dict:
+        """
+        Returns the histogram of fixed-point iteration counts of a line.
+
+        :param line: 'supply' or 'return'.
+        :return histogram: Dictionary {number of iterations: number of sections}.
+
+        """
+        counts = np.bincount(np.asarray(self.iterations.get(line, []), dtype = np.int64))
+        return {int(n): int(c) for n, c in enumerate(counts) if c > 0}
+
+    @property
+    def peak_memory_bytes(self) -> int:
+        return max((entry.get("peak_memory_bytes", 0) for entry in self.phases.values()), default = 0)
+
+    def to_dict(self, include_sections:bool = False) -> dict:
+        """
+        Returns the report as a dictionary (JSON serialisable).
+
+        :param include_sections: If True, iteration counts of all sections are included (not only the histograms).
+        :return report: Dictionary with the recorded data.
+
+        """
+        iterations = {}
+        for line, counts in self.iterations.items():
+            counts_array = np.asarray(counts)
+            iterations[line] = {
+                "sections": len(counts),
+                "total": int(counts_array.sum()),
+                "max": int(counts_array.max()) if len(counts) else 0,
+                "mean": float(counts_array.mean()) if len(counts) else 0.0,
+                "histogram": self.iteration_histogram(line)
+            }
+            if include_sections:
+                iterations[line]["per_section"] = [int(n) for n in counts]
+        return {
+            "phases": {name: dict(entry) for name, entry in self.phases.items()},
+            "property_evaluations": dict(self.property_evaluations),
+            "iterations": iterations,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "rows_written": dict(self.rows_written)
+        }
+
+    def to_json(self, path:str = None, include_sections:bool = False) -> str:
+        """
+        Returns the report as a JSON string and optionally writes it to a file.
+
+        :param path: Path to the JSON file. If None, nothing is written.
+        :param include_sections: See to_dict().
+        :return report_json: JSON string.
+
+        """
+        report_json = json.dumps(self.to_dict(include_sections), indent = 2)
+        if path is not None:
+            with open(path, "w") as report_file:
+                report_file.write(report_json)
+        return report_json
+
+    def __str__(self) -> str:
+        lines = ["Phase                              time [s]     calls"]
+        for name, entry in self.phases.items():
+            lines.append(f"{name:<32} {entry['wall_time_s']:>10.4f} {entry['calls']:>9}")
+        lines.append(f"Property evaluations: {self.property_evaluations}")
+        for line in self.iterations:
+            lines.append(f"Iterations ({line}): {self.iteration_histogram(line)}")
+        lines.append(f"Peak memory: {self.peak_memory_bytes / 1e6:.1f} MB")
+        lines.append(f"Rows written: {self.rows_written}")
+        return "\n".join(lines)
+
+
+def instrumented(phase_name:str):
+    """
+    Decorator of Branch methods: records the method as a phase of self.report when instrumentation is enabled.
+    Without instrumentation (self.report is None) the method is called directly.
+
+    :param phase_name: Name of the phase.
+
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.report is None:
+                return method(self, *args, **kwargs)
+            with self.report.phase(phase_name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
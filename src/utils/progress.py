@@ -0,0 +1,167 @@
+import sys
+import time
+import threading
+from dataclasses import dataclass
+
+from utils.exceptions import CalculationCancelledError
+
+
+#==========================| CANCELLATION |====================================
+class CancellationToken:
+    """
+    Flag for stopping long calculations cooperatively. Calculations check the token at chunk boundaries (e.g. every few hundred
+    sections or after each chunk of scenarios) and raise CalculationCancelledError when it is set.
+
+    The default token works within one process (threads). A token created with CancellationToken.shared() is backed by a
+    multiprocessing manager and can be passed to process pools (e.g. as an argument of ProcessPoolExecutor.submit()).
+
+    """
+
+    def __init__(self, event = None):
+        """
+        :param event: Object with set() and is_set() methods. Default: threading.Event().
+
+        """
+        self._event = event if event is not None else threading.Event()
+        self.reason = None
+
+    @classmethod
+    def shared(cls, manager = None) -> "CancellationToken":
+        """
+        Creates a token that can be used in other processes.
+
+        :param manager: multiprocessing Manager object. Default: a new manager (runs until the program ends).
+
+        """
+        if manager is None:
+            import multiprocessing
+            manager = multiprocessing.Manager()
+        return cls(manager.Event())
+
+    def __getstate__(self) -> dict:
+        if isinstance(self._event, type(threading.Event())):
+            raise TypeError("A thread token cannot be used in another process. Create the token with CancellationToken.shared().")
+        return self.__dict__
+
+    def cancel(self, reason:str = None) -> None:
+        """
+        Requests the calculations using the token to stop.
+
+        :param reason: Text of the CalculationCancelledError (e.g. 'superseded by a newer query').
+
+        """
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Raises CalculationCancelledError if the token is set.
+
+        """
+        if self._event.is_set():
+            raise CalculationCancelledError(self.reason or "Calculation was cancelled.")
+
+
+#==========================| PROGRESS |========================================
+@dataclass
+class ProgressEvent:
+    """
+    Progress of a calculation passed to progress callbacks.
+
+    :param task: Name of the calculation (e.g. 'supply', 'sobol').
+    :param done: Number of finished units (sections, scenarios, years, ...).
+    :param total: Number of all units (None if unknown).
+    :param elapsed_s: Time since the start in [s].
+    :param rate_per_s: Finished units per second.
+    :param eta_s: Estimated time to the end in [s] (None if unknown).
+    :param finished: True for the last event of the calculation.
+
+    """
+    task: str
+    done: int
+    total: int
+    elapsed_s: float
+    rate_per_s: float
+    eta_s: float
+    finished: bool = False
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 0.0
+
+
+class ProgressReporter:
+    """
+    Progress of one calculation: calls a callback with ProgressEvent objects (at most every min_interval_s seconds and at the end)
+    and checks a cancellation token. Calculations call update() at chunk boundaries only, so the hot loops are not slowed down.
+
+    """
+
+    def __init__(self, total:int = None, task:str = "", callback = None, token:CancellationToken = None, min_interval_s:float = 0.5):
+        """
+        :param total: Number of all units (None if unknown).
+        :param task: Name of the calculation.
+        :param callback: Function called with a ProgressEvent object (e.g. print_progress). Default: no reporting.
+        :param token: CancellationToken object. Default: calculation cannot be cancelled.
+        :param min_interval_s: Minimum time between two events in [s].
+
+        """
+        self.total = total
+        self.task = task
+        self.callback = callback
+        self.token = token
+        self.min_interval_s = min_interval_s
+        self.done = 0
+        self._start = time.perf_counter()
+        self._last_event = -float("inf")
+
+    def event(self, finished:bool = False) -> ProgressEvent:
+        elapsed_s = time.perf_counter() - self._start
+        rate_per_s = self.done / elapsed_s if elapsed_s > 0 else 0.0
+        eta_s = (self.total - self.done) / rate_per_s if self.total is not None and rate_per_s > 0 else None
+        return ProgressEvent(self.task, self.done, self.total, elapsed_s, rate_per_s, 0.0 if finished else eta_s, finished)
+
+    def update(self, done:int) -> None:
+        """
+        Sets the number of finished units, reports progress and raises CalculationCancelledError if the token is set.
+
+        """
+        self.done = done
+        if self.token is not None:
+            self.token.raise_if_cancelled()
+        if self.callback is not None:
+            now = time.perf_counter()
+            if now - self._last_event >= self.min_interval_s:
+                self._last_event = now
+                self.callback(self.event())
+
+    def advance(self, n:int = 1) -> None:
+        self.update(self.done + n)
+
+    def finish(self) -> None:
+        """
+        Reports the end of the calculation.
+
+        """
+        if self.total is not None:
+            self.done = self.total
+        if self.callback is not None:
+            self.callback(self.event(finished = True))
+
+
+def print_progress(event:ProgressEvent, file = None) -> None:
+    """
+    Progress callback for the command line and notebooks: one line, overwritten by the next event.
+
+    """
+    file = file or sys.stderr
+    total = f"/{event.total}" if event.total is not None else ""
+    percent = f" ({100 * event.fraction:5.1f} %)" if event.total else ""
+    eta = f", ETA {event.eta_s:.0f} s" if event.eta_s is not None and not event.finished else ""
+    line = f"{event.task}: {event.done}{total}{percent}, {event.rate_per_s:.1f}/s, {event.elapsed_s:.1f} s{eta}"
+    file.write("\r" + line.ljust(79) + ("\n" if event.finished else ""))
+    file.flush()
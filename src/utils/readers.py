@@ -0,0 +1,260 @@
+import os
+import json
+import struct
+import zipfile
+import numpy as np
+import pandas as pd
+
+
+#==============================================================================
+# Supported input file formats (by file extension):
+INPUT_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".feather": "arrow",
+    ".arrow": "arrow",
+    ".npz": "npz"
+}
+CATEGORICAL_COLUMNS = ("Direction", "Location")                                # stored as categoricals in the binary formats
+# Columns stored as float32 in compact mode (coordinates stay float64):
+COMPACT_FLOAT32_COLUMNS = ("Dext [mm]", "L [m]", "mdot take-off [kg/s]", "Insulation")
+
+
+def _input_format(data_file:str) -> str:
+    extension = os.path.splitext(data_file)[1].lower()
+    if extension not in INPUT_FORMATS:
+        raise ValueError(f"Unknown input file format '{extension}'. Supported formats: {list(INPUT_FORMATS.keys())}.")
+    return INPUT_FORMATS[extension]
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow input files require the pyarrow package. Install it with 'pip install pyarrow'.")
+    return pyarrow
+
+
+#______________________ NPZ (memory-mapped) ___________________________________
+
+def _memmap_npz(npz_file:str) -> dict:
+    """
+    Memory-maps all arrays of an uncompressed NPZ file (np.load() cannot memory-map arrays inside an NPZ archive).
+    Compressed members are read into memory.
+
+    :param npz_file: Path to the NPZ file.
+    :return arrays: Dictionary {name: array}.
+
+    """
+    arrays = {}
+    with zipfile.ZipFile(npz_file) as archive, open(npz_file, "rb") as raw:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle = False)
+                continue
+            raw.seek(info.header_offset)
+            local_header = raw.read(30)                                        # local file header of the ZIP member
+            name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+            raw.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(raw)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(raw)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(raw)
+            if dtype.hasobject:
+                raise ValueError(f"Array '{name}' in {npz_file} contains Python objects and cannot be memory-mapped.")
+            memmap = np.memmap(npz_file, dtype = dtype, mode = "r", offset = raw.tell(), shape = shape, order = "F" if fortran_order else "C")
+            arrays[name] = np.asarray(memmap)                                  # plain ndarray view of the mapped file (no copy)
+    return arrays
+
+
+def _read_npz(data_file:str) -> pd.DataFrame:
+    """
+    Reads input data from an NPZ file written by convert_input_file(). Numeric columns are memory-mapped.
+
+    """
+    return _npz_frame(_memmap_npz(data_file))
+
+
+def _npz_frame(arrays:dict, rows:slice = slice(None)) -> pd.DataFrame:
+    columns = {}
+    for i, name in enumerate(arrays["columns"].tolist()):
+        if f"col{i}_codes" in arrays:
+            columns[name] = pd.Categorical.from_codes(np.asarray(arrays[f"col{i}_codes"][rows]), categories = arrays[f"col{i}_categories"].tolist())
+        else:
+            columns[name] = arrays[f"col{i}"][rows]
+    return pd.DataFrame(columns, copy = False)
+
+
+def _write_npz(df_input_data:pd.DataFrame, output_file:str) -> None:
+    arrays = {"columns": np.array(list(map(str, df_input_data.columns)), dtype = str)}
+    for i, name in enumerate(df_input_data.columns):
+        column = df_input_data[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            arrays[f"col{i}_codes"] = column.cat.codes.to_numpy()
+            arrays[f"col{i}_categories"] = np.array(list(map(str, column.cat.categories)), dtype = str)     # fixed-width unicode ---> no Python objects
+        else:
+            arrays[f"col{i}"] = column.to_numpy()
+    np.savez(output_file, **arrays)                                            # uncompressed ---> can be memory-mapped
+
+
+#______________________ Reading & converting __________________________________
+
+def compact_input_frame(df_input_data:pd.DataFrame, float32:bool = True) -> pd.DataFrame:
+    """
+    Compact representation of the input data: 'Direction' and 'Location' as categoricals (int8 codes instead of Python strings),
+    'DN [mm]' as int16 and, if float32 is True, the columns of COMPACT_FLOAT32_COLUMNS as float32. Coordinates stay float64
+    (float32 would move the nodes by up to 0.5 m). The section arrays are calculated in float64 from the compact values; the
+    rounding of lengths and diameters changes the results by about 1e-7 (relative), see the accuracy table in README.md.
+
+    :param df_input_data: DataFrame with supply and return data.
+    :param float32: If False, only the text and DN columns are converted (numeric columns stay float64).
+    :return df_compact: Converted DataFrame (new object, the input is not changed).
+
+    """
+    columns = {}
+    for name in df_input_data.columns:
+        column = df_input_data[name]
+        if name in CATEGORICAL_COLUMNS:
+            column = column.astype("category")
+        elif name == "DN [mm]" and pd.api.types.is_numeric_dtype(column) and column.notna().all() and column.abs().max() < 2 ** 15:
+            column = column.astype(np.int16)
+        elif float32 and name in COMPACT_FLOAT32_COLUMNS and pd.api.types.is_numeric_dtype(column):
+            column = column.astype(np.float32)
+        columns[name] = column
+    return pd.DataFrame(columns)
+
+
+def read_input_file(data_file:str, compact:bool = False) -> pd.DataFrame:
+    """
+    Reads the network/branch topology data from an input file. The format is selected by the file extension:
+        - '.csv': text file with ';' as separator,
+        - '.parquet': Parquet file (requires pyarrow),
+        - '.feather' or '.arrow': Arrow IPC/Feather file, memory-mapped (requires pyarrow),
+        - '.npz': NumPy archive written by convert_input_file(), memory-mapped.
+    All formats have the same columns ('DN [mm]', 'Dext [mm]', 'Location', 'L [m]', ...).
+
+    :param data_file: Path to the input file.
+    :param compact: If True, the data is converted with compact_input_frame() (categoricals, int16 DN, float32 lengths & flows).
+    :return df_input_data: DataFrame with supply and return data.
+
+    """
+    input_format = _input_format(data_file)
+
+    if input_format == "csv":
+        df_input_data = pd.read_csv(data_file, sep=';')
+    elif input_format == "parquet":
+        _import_pyarrow()
+        df_input_data = pd.read_parquet(data_file, memory_map = True)
+    elif input_format == "arrow":
+        pyarrow = _import_pyarrow()
+        import pyarrow.feather
+        table = pyarrow.feather.read_table(data_file, memory_map = True)
+        df_input_data = table.to_pandas(split_blocks = True)                   # one block per column ---> avoids copying into consolidated blocks
+    else:
+        df_input_data = _read_npz(data_file)
+    if compact:
+        df_input_data = compact_input_frame(df_input_data)
+    return df_input_data
+
+
+def convert_input_file(data_file:str, output_file:str) -> None:
+    """
+    Converts an input file (e.g. the CSV format) to one of the binary formats. The format is selected by the extension of output_file.
+    'Direction' and 'Location' are stored as categoricals.
+
+    :param data_file: Path to the input file.
+    :param output_file: Path to the output file ('.parquet', '.feather', '.arrow' or '.npz').
+
+    """
+    output_format = _input_format(output_file)
+    df_input_data = read_input_file(data_file)
+    for name in CATEGORICAL_COLUMNS:
+        if name in df_input_data.columns:
+            df_input_data[name] = df_input_data[name].astype("category")
+
+    if output_format == "csv":
+        df_input_data.to_csv(output_file, sep=';', index = False)
+    elif output_format == "parquet":
+        _import_pyarrow()
+        df_input_data.to_parquet(output_file, index = False)
+    elif output_format == "arrow":
+        _import_pyarrow()
+        import pyarrow.feather
+        pyarrow.feather.write_feather(df_input_data, output_file, compression = "uncompressed")     # uncompressed ---> can be memory-mapped
+    else:
+        _write_npz(df_input_data, output_file)
+
+
+def split_input_data(df_input_data:pd.DataFrame) -> tuple:
+    """
+    Splits input data into supply and return DataFrames.
+
+    :param df_input_data: DataFrame with supply and return data.
+    :returns:
+        df_supply_in: Supply data
+        df_return_in: Return data
+
+    """
+    df_supply_in = df_input_data[df_input_data['Direction'] == 'Supply'].reset_index(drop=True)
+    df_return_in = df_input_data[df_input_data['Direction'] == 'Return'].reset_index(drop=True)
+    return df_supply_in, df_return_in
+
+
+def read_thickness_data(thickness_data_location:str) -> dict:
+    """
+    Reads pipe and insulation thickness data from the JSON file.
+
+    :param thickness_data_location: Path to the JSON file (e.g. 'insulation_thickness.json' in the 'data' folder).
+    :return th_mm: Content of 'thickness_data' in the JSON file. Empty dictionary if the file is not found.
+
+    """
+    try:
+        with open(thickness_data_location, "r") as th_file:
+            data = json.load(th_file)
+            th_mm = data.get("thickness_data", {})
+    except FileNotFoundError:
+        print("File not found.")
+        th_mm = {}
+    return th_mm
+
+
+def read_input_chunks(data_file:str, chunksize:int = 100_000):
+    """
+    Reads the input file in chunks of rows (the whole file is never loaded into memory). The format is selected by the file
+    extension as in read_input_file(); the Arrow/Feather and NPZ files are memory-mapped and sliced. The chunks are numbered
+    continuously (RangeIndex over the whole file).
+
+    :param data_file: Path to the input file.
+    :param chunksize: Number of rows in a chunk.
+    :return chunks: Iterator over DataFrames with at most chunksize rows.
+
+    """
+    input_format = _input_format(data_file)
+    if chunksize < 1:
+        raise ValueError(f"Chunk size must be a positive number of rows (got {chunksize}).")
+
+    if input_format == "csv":
+        with pd.read_csv(data_file, sep=';', chunksize = chunksize) as reader:
+            yield from reader
+        return
+    if input_format == "parquet":
+        _import_pyarrow()
+        import pyarrow.parquet
+        batches = (batch.to_pandas() for batch in pyarrow.parquet.ParquetFile(data_file).iter_batches(batch_size = chunksize))
+    elif input_format == "arrow":
+        _import_pyarrow()
+        import pyarrow.feather
+        table = pyarrow.feather.read_table(data_file, memory_map = True)
+        batches = (table.slice(start, chunksize).to_pandas(split_blocks = True) for start in range(0, table.num_rows, chunksize))
+    else:
+        arrays = _memmap_npz(data_file)
+        n_rows = len(arrays["col0_codes"] if "col0_codes" in arrays else arrays["col0"]) if len(arrays["columns"]) else 0
+        batches = (_npz_frame(arrays, slice(start, start + chunksize)) for start in range(0, n_rows, chunksize))
+    start = 0
+    for df_chunk in batches:
+        df_chunk.index = pd.RangeIndex(start, start + len(df_chunk))
+        start += len(df_chunk)
+        yield df_chunk
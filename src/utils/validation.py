@@ -38,3 +38,249 @@ def validate_damage(mode: str, percent: Union[float, int, List[Union[float, int]
         raise ValueError("Invalid damage mode. Use 'average' or 'element'.")
 
 
+
+
+# Validating section lengths
+SECTION_NODES = {"Supply": "end", "Return": "start"}                           # node of a section given by its coordinates (fits the reference data)
+
+
+def check_section_lengths(df_input_data, fill_missing: bool = True, max_detour: float = 2.0, tolerance_m: float = 5.0,
+                          raise_on_mismatch: bool = False, nodes: dict = None):
+    """
+    Compares the stated section lengths ('L [m]') with the distances between the nodes ('Longitude', 'Latitude'). The coordinates of
+    a row are either the end node of the section (the start node is then given by the previous row of the same line) or its start
+    node (the end node is given by the next row), chosen per line with 'nodes'. All rows are checked in one vectorized pass.
+
+    A length is flagged if it is shorter than the straight distance (by more than tolerance_m) or longer than max_detour times
+    the straight distance (+ tolerance_m): pipes follow the streets, so the stated length is usually somewhat longer than the distance.
+    The default convention fits the reference data best (median ratio of the stated lengths and the distances about 1.18 in both
+    lines), but its lengths scatter widely around the distances: about 50 of its 130 rows are flagged with the default tolerances.
+
+    :param df_input_data: DataFrame with supply and return data (see data_input.py). A missing 'L [m]' column is treated as all lengths missing.
+    :param fill_missing: If True, missing lengths (NaN) are replaced by the distance between the nodes.
+    :param max_detour: Highest allowed ratio of the stated length and the straight distance.
+    :param tolerance_m: Absolute tolerance in [m] (e.g. coordinate accuracy).
+    :param raise_on_mismatch: If True, a ValueError with all flagged rows is raised.
+    :param nodes: Node given by the coordinates of each line, 'start' or 'end', e.g. {"Supply": "end", "Return": "start"}. Default: SECTION_NODES.
+    :returns:
+        df_checked: Input data (a copy with filled lengths if any length was filled)
+        report: DataFrame with one row per flagged section (row, Direction, L [m], L coordinates [m], issue)
+
+    Raises
+    ------
+        ValueError
+    
+    """
+    import numpy as np
+    import pandas as pd
+    from utils.functions import calculate_haversine_distance
+
+    df_checked = df_input_data
+    n_rows = len(df_checked)
+    lon = df_checked["Longitude"].to_numpy(dtype = np.float64)
+    lat = df_checked["Latitude"].to_numpy(dtype = np.float64)
+    l_m = df_checked["L [m]"].to_numpy(dtype = np.float64, copy = True) if "L [m]" in df_checked else np.full(n_rows, np.nan)
+    is_supply = (df_checked["Direction"] == "Supply").to_numpy()               # one comparison with a scalar (fast also for object columns)
+
+    nodes = {**SECTION_NODES, **(nodes or {})}
+    unknown = {line: node for line, node in nodes.items() if line not in SECTION_NODES or node not in ("start", "end")}
+    if unknown:
+        raise ValueError(f"Invalid node convention {unknown}. Use {{'Supply' | 'Return': 'start' | 'end'}}.")
+    uses_start = np.where(is_supply, nodes["Supply"] == "start", nodes["Return"] == "start")
+    finite = np.isfinite(lon) & np.isfinite(lat)
+    has_next, has_prev = np.zeros(n_rows, dtype = bool), np.zeros(n_rows, dtype = bool)
+    has_next[:-1] = has_prev[1:] = is_supply[1:] == is_supply[:-1]             # first (last) row of each line has no previous (next) row
+    gap_next_m, gap_prev_m = np.full(n_rows, np.nan), np.full(n_rows, np.nan)
+    gap_next_m[:-1] = gap_prev_m[1:] = calculate_haversine_distance(lon[:-1], lat[:-1], lon[1:], lat[1:])
+    finite_next, finite_prev = np.zeros(n_rows, dtype = bool), np.zeros(n_rows, dtype = bool)
+    finite_next[:-1], finite_prev[1:] = finite[1:], finite[:-1]
+
+    has_pair = np.where(uses_start, has_next, has_prev)                        # start node ---> end node in the next row, end node ---> start node in the previous row
+    distance_m = np.where(uses_start, gap_next_m, gap_prev_m)
+    valid_coordinates = finite & (np.where(uses_start, finite_next, finite_prev) | ~has_pair)
+    distance_m[~has_pair | ~valid_coordinates] = np.nan
+
+    missing = ~np.isfinite(l_m)
+    can_fill = missing & np.isfinite(distance_m)
+    if fill_missing and can_fill.any():
+        l_m[can_fill] = distance_m[can_fill]
+        df_checked = df_input_data.copy()
+        df_checked["L [m]"] = l_m
+
+    checked = ~missing & np.isfinite(distance_m)
+    too_short = checked & (l_m < distance_m - tolerance_m)
+    too_long = checked & (l_m > max_detour * distance_m + tolerance_m)
+    issue_texts = np.array(["", "shorter than the distance between the nodes", f"longer than {max_detour} x the distance between the nodes",
+                            "missing length without a second node or valid coordinates", "missing length", "invalid coordinates"], dtype = object)
+    issues = np.zeros(n_rows, dtype = np.int8)                                 # index in issue_texts
+    issues[too_short] = 1
+    issues[too_long] = 2
+    issues[missing & ~can_fill] = 3
+    if not fill_missing:
+        issues[missing & can_fill] = 4
+    issues[~valid_coordinates] = 5
+    flagged = np.flatnonzero(issues)
+
+    report = pd.DataFrame({
+        "row": flagged,
+        "Direction": df_input_data["Direction"].iloc[flagged].to_numpy(),
+        "L [m]": df_input_data["L [m]"].to_numpy(dtype = np.float64)[flagged] if "L [m]" in df_input_data else np.nan,
+        "L coordinates [m]": distance_m[flagged],
+        "issue": issue_texts[issues[flagged]]
+    })
+    if raise_on_mismatch and len(report):
+        raise ValueError(f"{len(report)} section(s) with inconsistent lengths:\n{report.to_string(index = False, max_rows = 50)}")
+    return df_checked, report
+
+
+
+
+# Validating the whole input frame
+INPUT_COLUMNS = ("Direction", "DN [mm]", "Dext [mm]", "Location", "L [m]", "Longitude", "Latitude", "mdot take-off [kg/s]", "Insulation")
+_NUMERIC_COLUMNS = ("DN [mm]", "Dext [mm]", "L [m]", "Longitude", "Latitude", "mdot take-off [kg/s]", "Insulation")
+
+
+def validate_input_frame(df_input_data, th_all: dict = None, raise_on_error: bool = False):
+    """
+    Checks the whole input frame (supply and return rows) before any calculation and reports all problems at once. Every check
+    is one vectorized mask over all rows, so large GIS imports are validated in a single pass:
+        - required columns, numeric values in the numeric columns, missing values,
+        - 'Direction' ('Supply' or 'Return') and 'Location' ('channel', 'surface' or 'soil'),
+        - 'DN [mm]' in the thickness catalog ('th_pipe' and the insulation table of the location and direction of each row),
+        - positive lengths and external diameters (larger than twice the pipe wall),
+        - 'Insulation' between 0 and 1,
+        - sign of the take-offs (supply: <= 0, return: >= 0) and consumers of the return line paired with supply take-offs.
+
+    Missing lengths can be filled from the coordinates with check_section_lengths() before the validation.
+
+    :param df_input_data: DataFrame with supply and return data (see data_input.py).
+    :param th_all: Pipe and insulation thickness data (content of 'thickness_data' in the JSON file). If None, DN is not checked against the catalog.
+    :param raise_on_error: If True, an InputValidationError with the report is raised when problems are found.
+    :return report: DataFrame with one row per problem (row, Direction, column, value, issue). 'row' is the position in df_input_data
+                    (<NA> for problems of the whole frame). Empty if the input is valid.
+
+    Raises
+    ------
+        InputValidationError
+    
+    """
+    import numpy as np
+    import pandas as pd
+    from model_param import PipeSectionLocation
+    from utils.exceptions import InputValidationError
+
+    n_rows = len(df_input_data)
+    problems = []                                                              # (row positions, column, issue)
+
+    def flag(mask, column, issue):
+        rows = np.flatnonzero(mask)
+        if len(rows):
+            problems.append((rows, column, issue))
+
+    missing_columns = [column for column in INPUT_COLUMNS if column not in df_input_data]
+    for column in missing_columns:
+        problems.append((np.array([-1]), column, "missing column"))
+
+    # (i) Text columns:
+    directions = np.zeros(n_rows, dtype = np.int8)                             # 1: supply, 2: return, 0: invalid
+    if "Direction" in df_input_data:
+        direction = df_input_data["Direction"]
+        directions[(direction == "Supply").to_numpy()] = 1
+        directions[(direction == "Return").to_numpy()] = 2
+        flag(direction.isna().to_numpy(), "Direction", "missing value")
+        flag((directions == 0) & direction.notna().to_numpy(), "Direction", "unknown direction (must be 'Supply' or 'Return')")
+
+    locations = [location.value for location in PipeSectionLocation]
+    location_valid = np.zeros(n_rows, dtype = bool)
+    if "Location" in df_input_data:
+        location = df_input_data["Location"]
+        location_valid = location.isin(locations).to_numpy()
+        flag(location.isna().to_numpy(), "Location", "missing value")
+        flag(~location_valid & location.notna().to_numpy(), "Location", f"unknown location (must be one of {locations})")
+
+    # (ii) Numeric columns (strings, objects, ... ---> NaN):
+    values = {}
+    for column in _NUMERIC_COLUMNS:
+        if column not in df_input_data:
+            values[column] = np.full(n_rows, np.nan)
+            continue
+        raw = df_input_data[column]
+        values[column] = pd.to_numeric(raw, errors = "coerce").to_numpy(dtype = np.float64)
+        missing = raw.isna().to_numpy()
+        flag(missing, column, "missing value")
+        flag(~np.isfinite(values[column]) & ~missing, column, "not a finite number")
+
+    dn = values["DN [mm]"]
+    dn_valid = np.isfinite(dn) & (dn == np.round(dn))
+    flag(np.isfinite(dn) & ~dn_valid, "DN [mm]", "not an integer")
+    flag(values["L [m]"] <= 0, "L [m]", "length not positive")
+    flag(values["Dext [mm]"] <= 0, "Dext [mm]", "external diameter not positive")
+    insulation = values["Insulation"]
+    flag((insulation < 0) | (insulation > 1), "Insulation", "outside the range 0 ... 1")
+    mdot_takeoff = values["mdot take-off [kg/s]"]
+    flag((directions == 1) & (mdot_takeoff > 0), "mdot take-off [kg/s]", "positive take-off on the supply line (take-offs are <= 0)")
+    flag((directions == 2) & (mdot_takeoff < 0), "mdot take-off [kg/s]", "negative take-off on the return line (consumer returns are >= 0)")
+
+    # (iii) Thickness catalog:
+    if th_all is not None and dn_valid.any():
+        dn_int = np.where(dn_valid, dn, -1).astype(np.int64)
+        table_names = ["th_pipe"] + [f"th_insulation_{location}_{line}" for line in ("supply", "return") for location in locations]
+        catalog = {name: np.array(sorted(int(key) for key in th_all.get(name, {})), dtype = np.int64) for name in table_names}
+
+        in_pipe_table = np.isin(dn_int, catalog["th_pipe"])
+        flag(dn_valid & ~in_pipe_table, "DN [mm]", "DN not in the 'th_pipe' data")
+        for code, line in ((1, "supply"), (2, "return")):
+            for location in locations:
+                table_name = f"th_insulation_{location}_{line}"
+                rows = dn_valid & (directions == code) & location_valid & (df_input_data["Location"] == location).to_numpy()
+                flag(rows & ~np.isin(dn_int, catalog[table_name]), "DN [mm]", f"DN not in the '{table_name}' data")
+
+        # Wall thickness of the valid DN (sorted keys ---> searchsorted):
+        th_pipe_table = th_all.get("th_pipe", {})
+        th_pipe_mm = np.full(n_rows, np.nan)
+        if len(catalog["th_pipe"]):
+            th_values_mm = np.array([float(th_pipe_table[str(key)]) for key in catalog["th_pipe"]])
+            idx = np.minimum(np.searchsorted(catalog["th_pipe"], dn_int), len(catalog["th_pipe"]) - 1)
+            th_pipe_mm = np.where(in_pipe_table, th_values_mm[idx], np.nan)
+        d_ext_mm = values["Dext [mm]"]
+        flag((d_ext_mm > 0) & (d_ext_mm <= 2 * th_pipe_mm), "Dext [mm]", "external diameter not larger than twice the pipe wall ('th_pipe')")
+
+    # (iv) Whole frame:
+    frame_issues = []
+    if "Direction" in df_input_data and not missing_columns:
+        if not (directions == 1).any():
+            frame_issues.append(("Direction", "no supply rows"))
+        n_consumers_return = np.count_nonzero((directions == 2) & (mdot_takeoff != 0) & np.isfinite(mdot_takeoff))
+        n_takeoffs_supply = np.count_nonzero((directions == 1) & (mdot_takeoff != 0) & np.isfinite(mdot_takeoff))
+        if n_consumers_return > n_takeoffs_supply:
+            frame_issues.append(("mdot take-off [kg/s]", f"the return line has more consumers ({n_consumers_return}) than the supply line take-offs ({n_takeoffs_supply})"))
+    for column, issue in frame_issues:
+        problems.append((np.array([-1]), column, issue))
+
+    # Report (rows in the order of the frame, problems of the whole frame first):
+    rows = np.concatenate([p[0] for p in problems]) if problems else np.array([], dtype = np.int64)
+    columns = np.concatenate([np.full(len(p[0]), p[1], dtype = object) for p in problems]) if problems else np.array([], dtype = object)
+    issues = np.concatenate([np.full(len(p[0]), p[2], dtype = object) for p in problems]) if problems else np.array([], dtype = object)
+    order = np.argsort(rows, kind = "stable")
+    rows, columns, issues = rows[order], columns[order], issues[order]
+    in_frame = rows >= 0
+
+    direction_values = np.full(len(rows), None, dtype = object)
+    cell_values = np.full(len(rows), None, dtype = object)
+    if "Direction" in df_input_data:
+        direction_values[in_frame] = df_input_data["Direction"].to_numpy(dtype = object)[rows[in_frame]]
+    for column in np.unique(columns[in_frame]) if in_frame.any() else []:
+        selected = in_frame & (columns == column)
+        cell_values[selected] = df_input_data[column].to_numpy(dtype = object)[rows[selected]]
+
+    report = pd.DataFrame({
+        "row": pd.array(np.where(in_frame, rows, 0), dtype = "Int64"),
+        "Direction": direction_values,
+        "column": columns,
+        "value": cell_values,
+        "issue": issues
+    })
+    report.loc[~in_frame, "row"] = pd.NA
+    if raise_on_error and len(report):
+        raise InputValidationError(f"{len(report)} problem(s) in the input data:\n{report.to_string(index = False, max_rows = 50)}", report)
+    return report
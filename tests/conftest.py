@@ -0,0 +1,10 @@
+import os
+
+
+# data_input.py reads the input file on import (file dialog if the variable is not set) ---> reference data of the repository
+os.environ.setdefault("DHNPYPE_INPUT_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "network_config_data", "input_reference.csv"))
+
+
+def pytest_sessionstart(session):
+    # The modules are run from the 'src' folder (relative paths of the data files, e.g. in branch.py):
+    os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
@@ -0,0 +1,32 @@
+import pytest
+
+import data_output
+from branch import Branch
+from utils.exceptions import CalculationCancelledError
+from utils.progress import CancellationToken
+
+
+def test_cancelled_calculation_leaves_no_partial_rows():
+    data_output.clear_output_frames()
+    token = CancellationToken()
+    network = Branch(cancel = token, progress = lambda event: token.cancel(), progress_chunk = 10)     # cancelled after the first chunk
+
+    with pytest.raises(CalculationCancelledError):
+        network.calculate_supply()
+
+    assert data_output.df_supply_out.empty
+
+
+def test_cancelled_return_line_keeps_the_supply_results():
+    data_output.clear_output_frames()
+    token = CancellationToken()
+    network = Branch(cancel = token)
+    network.calculate_supply()
+    n_supply = len(data_output.df_supply_out)
+    network.progress, network.progress_chunk = (lambda event: token.cancel()), 10
+
+    with pytest.raises(CalculationCancelledError):
+        network.calculate_return()
+
+    assert len(data_output.df_supply_out) == n_supply
+    assert data_output.df_return_out.empty and data_output.df_system_out.empty
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chunked_solver import solve_chunked
+from compiled_network import compile
+from synthetic_network import generate_synthetic_branch
+from utils.readers import read_input_chunks, read_input_file, convert_input_file
+
+
+@pytest.fixture(scope = "module")
+def input_files(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("input")
+    df_input_data = generate_synthetic_branch(250, seed = 2)
+    files = {"csv": str(folder / "branch.csv")}
+    df_input_data.to_csv(files["csv"], sep = ";", index = False)
+    for extension in ("parquet", "feather", "npz"):
+        files[extension] = str(folder / f"branch.{extension}")
+        convert_input_file(files["csv"], files[extension])
+    return df_input_data, files
+
+
+@pytest.mark.parametrize("extension", ["csv", "parquet", "feather", "npz"])
+def test_chunks_of_every_format_add_up_to_the_file(input_files, extension):
+    _, files = input_files
+
+    chunks = list(read_input_chunks(files[extension], chunksize = 64))
+
+    assert [len(chunk) for chunk in chunks[:-1]] == [64] * (len(chunks) - 1)
+    df_chunks = pd.concat(chunks)
+    pd.testing.assert_index_equal(df_chunks.index, pd.RangeIndex(len(df_chunks)))
+    pd.testing.assert_frame_equal(df_chunks, read_input_file(files[extension]))
+
+
+def test_unknown_format_and_chunk_size_are_rejected(input_files, tmp_path):
+    _, files = input_files
+    with pytest.raises(ValueError, match = "Unknown input file format"):
+        next(read_input_chunks(str(tmp_path / "branch.txt")))
+    with pytest.raises(ValueError, match = "Chunk size"):
+        next(read_input_chunks(files["csv"], chunksize = 0))
+
+
+@pytest.mark.parametrize("extension", ["csv", "npz"])
+def test_chunked_solution_equals_the_in_memory_solution(input_files, extension, tmp_path):
+    df_input_data, files = input_files
+    out_supply, out_return = compile(df_input_data).solve(backend = "python")
+
+    summary = solve_chunked(files[extension], str(tmp_path), chunksize = 37, backend = "python")
+
+    for line, out in (("supply", out_supply), ("return", out_return)):
+        df_out = pd.read_csv(summary[line]["path"], sep = ";")
+        assert summary[line]["rows_written"] == len(out)
+        np.testing.assert_allclose(df_out.to_numpy(dtype = np.float64), out, rtol = 1e-9, atol = 1e-9)
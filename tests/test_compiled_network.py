@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import compiled_network
+import data_input
+from compiled_network import compile, load, _ARRAY_FIELDS
+
+
+@pytest.fixture(scope = "module")
+def network():
+    return compile(data_input.data_file)
+
+
+def test_saved_network_loads_with_the_same_arrays_and_results(network, tmp_path):
+    path = network.save(str(tmp_path / "branch.npz"))
+
+    loaded = load(path)
+
+    assert loaded.metadata == network.metadata
+    for line in ("arrays_supply", "arrays_return"):
+        for name in _ARRAY_FIELDS:
+            np.testing.assert_array_equal(getattr(getattr(loaded, line), name), getattr(getattr(network, line), name))
+    assert not loaded.arrays_supply.l_m.flags.writeable                        # memory-mapped, read-only
+    for out_loaded, out in zip(loaded.solve(backend = "python"), network.solve(backend = "python")):
+        np.testing.assert_array_equal(out_loaded, out)
+    assert not list(tmp_path.glob("*.tmp"))                                    # replaced atomically
+
+
+def test_file_of_another_format_version_is_rejected(network, tmp_path, monkeypatch):
+    path = network.save(str(tmp_path / "branch.npz"))
+    monkeypatch.setattr(compiled_network, "FORMAT_VERSION", compiled_network.FORMAT_VERSION + 1)
+
+    with pytest.raises(ValueError, match = "format version"):
+        load(path)
+    np.savez(str(tmp_path / "other.npz"), values = np.zeros(3))
+    monkeypatch.undo()
+    with pytest.raises(ValueError, match = "not a compiled network"):
+        load(str(tmp_path / "other.npz"))
@@ -0,0 +1,13 @@
+import numpy as np
+
+from data_output import SolverDiagnostics
+
+
+def test_sections_converged_on_the_last_iteration_are_not_counted_as_stopped():
+    diagnostics = SolverDiagnostics(iterations = np.array([1, 1, 1, 0]), residual = np.array([1e-5, 0.2, 1e-4, 0.0]),
+                                    clamped = np.zeros(4, dtype = bool), tolerance = 0.001, max_iterations = 1)
+
+    summary = diagnostics.summary()
+
+    assert summary["not_converged"] == 1
+    assert summary["max_iterations_reached"] == 1
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from checkpoint import Checkpoint
+from compiled_network import compile
+from degradation import iter_degradation, simulate_degradation
+from synthetic_network import generate_synthetic_branch
+
+
+@pytest.fixture(scope = "module")
+def network():
+    return compile(generate_synthetic_branch(60, seed = 7))
+
+
+def run(network, **kwargs):
+    return iter_degradation(network.arrays_supply, network.arrays_return, network.initial_values, years = 6, n_samples = 8, seed = 11,
+                            backend = "python", **kwargs)
+
+
+def test_resumed_run_gives_the_same_results_as_an_uninterrupted_one(network, tmp_path):
+    records = list(run(network))
+
+    with Checkpoint(str(tmp_path), interval_s = 3600) as checkpoint:           # written when the run stops
+        for record in run(network, checkpoint = checkpoint):
+            if record["year"] == 2:
+                break
+    with Checkpoint(str(tmp_path)) as checkpoint:
+        assert 2 in checkpoint and 3 not in checkpoint
+        records_resumed = list(run(network, checkpoint = checkpoint))
+
+    assert [record["year"] for record in records_resumed] == list(range(7))
+    for record, record_resumed in zip(records, records_resumed):
+        assert record["new damage"] == record_resumed["new damage"]
+        np.testing.assert_array_equal(record["damaged share supply [-]"], record_resumed["damaged share supply [-]"])
+        for name, values in record["kpi"].items():
+            np.testing.assert_array_equal(record_resumed["kpi"][name], values)
+    assert records[-1]["new damage"] > 0
+
+
+def test_checkpoint_of_other_settings_is_not_resumed(network, tmp_path):
+    with Checkpoint(str(tmp_path), interval_s = 0) as checkpoint:
+        list(run(network, checkpoint = checkpoint))
+
+    with pytest.raises(ValueError, match = "another run"):
+        simulate_degradation(network.arrays_supply, network.arrays_return, network.initial_values, years = 6, n_samples = 8, seed = 12,
+                             backend = "python", checkpoint = Checkpoint(str(tmp_path)))
+    with pytest.raises(ValueError, match = "seed is required"):
+        next(iter_degradation(network.arrays_supply, network.arrays_return, network.initial_values, checkpoint = Checkpoint(str(tmp_path))))
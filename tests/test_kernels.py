@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import data_input
+import data_output
+from branch import Branch
+from config_data import BranchInitialConfig
+from kernels import solve_branch, numba
+from section_arrays import build_section_arrays
+from utils.functions import calculate_output_temperature
+
+
+BACKENDS = ["python", pytest.param("numba", marks = pytest.mark.skipif(numba is None, reason = "numba is not installed"))]
+INITIAL_VALUES = {
+    "reference": BranchInitialConfig(),
+    "heat gain": BranchInitialConfig(t_in_return_c = 20.0, t_consumer_release_c = 25.0)      # return line colder than the channels (30 °C)
+}
+
+
+@pytest.fixture(scope = "module", params = list(INITIAL_VALUES))
+def reference(request):
+    network = Branch(initial_values = INITIAL_VALUES[request.param])
+    data_output.clear_output_frames()
+    network.calculate_supply()
+    network.calculate_return()
+    return network, data_output.df_supply_out.to_numpy(dtype = np.float64), data_output.df_return_out.to_numpy(dtype = np.float64)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_kernel_reproduces_branch(reference, backend):
+    network, out_supply_ref, out_return_ref = reference
+    arrays_supply = build_section_arrays(data_input.df_supply_in, "supply", network.th_all, network.ins_damage_mode, network.th_ins_damage_avg_m)
+    arrays_return = build_section_arrays(data_input.df_return_in, "return", network.th_all, network.ins_damage_mode, network.th_ins_damage_avg_m)
+
+    out_supply, out_return, diagnostics_supply, diagnostics_return = solve_branch(arrays_supply, arrays_return, network.iv, tolerance = network.tolerance,
+                                                                                  backend = backend, return_diagnostics = True)
+
+    for out, out_ref in ((out_supply, out_supply_ref), (out_return, out_return_ref)):
+        assert out.shape == out_ref.shape
+        scale = np.abs(out_ref).max(axis = 0)                                  # per column
+        assert np.all(np.abs(out - out_ref) <= 1e-7 * scale)
+    for line in ("supply", "return"):
+        np.testing.assert_array_equal({"supply": diagnostics_supply, "return": diagnostics_return}[line].clamped, network.diagnostics[line].clamped)
+
+
+def test_reference_function_does_not_clamp_heat_gain():
+    t_out_c, qdot_loss_w, _, _, clamped = calculate_output_temperature(20.0, 30.0, 1.0, 4180.0, 0.01, 0.001, 100.0, True)
+
+    assert not clamped
+    assert 20.0 < t_out_c < 30.0
+    assert qdot_loss_w == pytest.approx(-4180.0 * (t_out_c - 20.0))
@@ -0,0 +1,51 @@
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_input
+from compiled_network import compile
+from kernels import pipe_columns, solve_branch_batch
+from kpi import GROUPINGS, KpiAggregator
+from model_server import WhatIfModel
+
+
+@pytest.fixture(scope = "module")
+def network():
+    return compile(data_input.df_input_data)
+
+
+def test_grouped_kpis_agree_with_the_what_if_kpis(network):
+    out_supply, out_return = network.solve(backend = "python")
+    aggregator = KpiAggregator.from_network(network)
+
+    kpis = aggregator.aggregate(out_supply, out_return)
+
+    expected = WhatIfModel.calculate_kpis(out_supply, out_return)
+    np.testing.assert_allclose(kpis.loss_w["direction"], [expected["Qdot loss supply [W]"], expected["Qdot loss return [W]"]], rtol = 1e-9)
+    assert kpis.loss_total_w == pytest.approx(expected["Qdot loss total [W]"], rel = 1e-9)
+    assert kpis.consumer_heat_w == pytest.approx(expected["Qdot consumer actual [W]"], rel = 1e-12)
+    assert kpis.loss_share == pytest.approx(expected["Loss share [-]"], rel = 1e-9)
+    l_total_m = network.arrays_supply.l_m.sum() + network.arrays_return.l_m.sum()
+    for grouping in GROUPINGS:                                                 # every grouping splits the same totals
+        assert kpis.loss_w[grouping].sum() == pytest.approx(kpis.loss_total_w, rel = 1e-12)
+        assert kpis.length_m[grouping].sum() == pytest.approx(l_total_m, rel = 1e-12)
+    frames = (pd.DataFrame(out_supply, columns = pipe_columns), pd.DataFrame(out_return, columns = pipe_columns))
+    assert aggregator.aggregate(*frames).loss_total_w == kpis.loss_total_w
+
+
+def test_sweep_is_aggregated_like_single_runs(network):
+    iv = replace(network.initial_values, t_in_supply_c = np.linspace(100, 130, 5))
+    out_supply, out_return = solve_branch_batch(network.arrays_supply, network.arrays_return, iv)
+    aggregator = KpiAggregator.from_network(network)
+
+    kpis = aggregator.aggregate(out_supply, out_return, chunk_size = 2)
+
+    assert kpis.loss_total_w.shape == (5,) and kpis.loss_w["location"].shape == (5, 3)
+    for run in range(5):
+        expected = WhatIfModel.calculate_kpis(out_supply[run], out_return[run])
+        assert kpis.loss_total_w[run] == pytest.approx(expected["Qdot loss total [W]"], rel = 1e-9)
+        assert kpis.loss_share[run] == pytest.approx(expected["Loss share [-]"], rel = 1e-9)
+        np.testing.assert_array_equal(kpis.loss_w["dn"][run], aggregator.aggregate(out_supply[run], out_return[run]).loss_w["dn"])
+    assert np.all(np.diff(kpis.loss_total_w) > 0)                              # hotter supply ---> higher loss
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from live_feed import LiveFeed, MeasurementSource, QueueSource
+
+
+def test_measurement_source_is_abstract():
+    with pytest.raises(TypeError):
+        MeasurementSource()
+
+
+def test_queue_source_yields_measurements_until_none():
+    async def collect():
+        source = QueueSource()
+        for measurement in ({"t_soil_c": 8.0}, {"t_soil_c": 7.5}, None):
+            source.put(measurement)
+        return [measurement async for measurement in source]
+
+    assert asyncio.run(collect()) == [{"t_soil_c": 8.0}, {"t_soil_c": 7.5}]
+
+
+def test_error_of_the_source_is_raised_after_the_pending_measurements_are_solved():
+    class LostConnectionSource(MeasurementSource):
+        async def measurements(self):
+            yield {"t_soil_c": 8.0}
+            raise ConnectionError("connection to the SCADA server lost")
+
+    class Model:
+        def solve(self, query):
+            return {"kpi": {"t_soil_c": query["t_soil_c"]}}
+
+    published = []
+    feed = LiveFeed(Model(), LostConnectionSource(), publishers = [published.append])
+
+    with pytest.raises(ConnectionError, match = "connection"):
+        asyncio.run(feed.run())
+    assert [record["t_soil_c"] for record in published] == [8.0]
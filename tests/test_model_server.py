@@ -0,0 +1,77 @@
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import data_input
+from model_server import WhatIfModel, _ClientTokens, _handle_connection
+from utils.progress import CancellationToken
+
+
+@pytest.fixture(scope = "module")
+def model():
+    return WhatIfModel(data_input.data_file, backend = "python")
+
+
+def test_insulation_change_with_unknown_direction_is_rejected(model):
+    with pytest.raises(ValueError, match = "Unknown direction"):
+        model.solve({"insulation": [{"direction": "sup", "section": 0, "value": 0}]})
+    assert model.solve({"insulation": [{"direction": "Return", "section": 0, "value": 0}]})["kpi"]
+
+
+@pytest.mark.parametrize("insulation", [[1], {"a": 1}, "supply"])
+def test_insulation_changes_of_wrong_type_are_rejected(model, insulation):
+    with pytest.raises(ValueError, match = "list of objects"):
+        model.solve({"insulation": insulation})
+
+
+def test_property_table_keeps_its_range_when_extended_concurrently(model):
+    t_max_c = model.property_table.t_min_c + model.property_table.dt_c * (len(model.property_table.cp_ws_per_kgk) - 1)
+    with ThreadPoolExecutor(max_workers = 8) as executor:
+        list(executor.map(lambda i: model._property_table_for(t_max_c + i, model.t_amb_min_c - i), range(1, 17)))
+
+    table = model.property_table
+    assert table.t_min_c <= model.t_amb_min_c - 16
+    assert table.t_min_c + table.dt_c * (len(table.cp_ws_per_kgk) - 1) >= t_max_c + 16
+
+
+def test_newer_query_of_a_client_cancels_the_running_one():
+    started, release = threading.Event(), threading.Event()
+
+    def solve(query, cancel):
+        if query.get("slow"):
+            started.set()
+            release.wait(5)
+        cancel.raise_if_cancelled()
+        return {"kpi": query}
+
+    async def request(port:int, query:dict):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        body = json.dumps(query).encode()
+        writer.write(b"POST /whatif HTTP/1.1\r\nX-Client-Id: dashboard\r\nConnection: close\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        response = await reader.read()
+        writer.close()
+        return response.split(b" ", 2)[1].decode(), json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+    async def run():
+        executor = ThreadPoolExecutor(max_workers = 2)
+        tokens = _ClientTokens(CancellationToken)
+        server = await asyncio.start_server(lambda reader, writer: _handle_connection(reader, writer, solve, executor, tokens), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            superseded = asyncio.create_task(request(port, {"slow": True}))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            newer = await request(port, {"t_soil_c": 5.0})
+            release.set()
+            result = await superseded, newer
+        executor.shutdown()
+        return result
+
+    (status_superseded, payload_superseded), (status_newer, payload_newer) = asyncio.run(run())
+
+    assert status_superseded == "409" and payload_superseded["cancelled"]
+    assert status_newer == "200" and payload_newer["kpi"] == {"t_soil_c": 5.0}
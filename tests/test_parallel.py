@@ -0,0 +1,57 @@
+from dataclasses import replace
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import parallel
+from compiled_network import compile
+from parallel import SharedArray, solve_scenarios
+from synthetic_network import generate_synthetic_branch
+
+
+@pytest.fixture(scope = "module")
+def network():
+    return compile(generate_synthetic_branch(40, seed = 8))
+
+
+@pytest.fixture
+def created_segments(monkeypatch):
+    names = []
+    create = SharedArray.create.__func__
+
+    def create_recorded(cls, *args, **kwargs):
+        shared = create(cls, *args, **kwargs)
+        names.append(shared.spec[0])
+        return shared
+
+    monkeypatch.setattr(parallel.SharedArray, "create", classmethod(create_recorded))
+    return names
+
+
+def assert_removed(names):
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name = name)
+
+
+def test_results_equal_the_serial_solution_and_segments_are_removed_on_close(network, created_segments):
+    scenarios = [{"t_in_supply_c": t_in_c} for t_in_c in (110.0, 120.0, 130.0)]
+
+    with solve_scenarios(network, scenarios, workers = 2, batch_size = 2, backend = "python") as result:
+        for i, scenario in enumerate(scenarios):
+            out_supply, _ = network.solve(initial_values = replace(network.initial_values, **scenario), backend = "python")
+            np.testing.assert_allclose(result.frame(i, "supply").to_numpy(dtype = np.float64), out_supply, rtol = 1e-12)
+
+    assert len(created_segments) == 2
+    assert_removed(created_segments)
+
+
+def test_failed_worker_leaves_no_shared_memory_segment(network, created_segments):
+    scenarios = [{"t_in_supply_c": 120.0}] * 3 + [{"t_in_supply": 120.0}]     # unknown key ---> ValueError in a worker
+
+    with pytest.raises(ValueError, match = "Unknown scenario key"):
+        solve_scenarios(network, scenarios, workers = 2, batch_size = 1, backend = "python")
+
+    assert len(created_segments) == 2
+    assert_removed(created_segments)
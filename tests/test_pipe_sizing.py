@@ -0,0 +1,45 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import data_input
+from kernels import numba
+from pipe_sizing import _size_line, _size_line_numba, size_branch
+
+
+@pytest.mark.parametrize("change_penalty", [0.0, 2.5])
+def test_dynamic_programming_finds_the_cheapest_telescoping_profile(change_penalty):
+    rng = np.random.default_rng(4)
+    cost = rng.uniform(0, 10, (6, 4))
+    cost[rng.random(cost.shape) < 0.15] = np.inf                               # infeasible DN
+
+    best_total = np.inf
+    for profile in itertools.product(range(4), repeat = 6):
+        if all(a >= b for a, b in zip(profile, profile[1:])):                  # DN not increasing along the line
+            total = cost[np.arange(6), profile].sum() + change_penalty * np.count_nonzero(np.diff(profile))
+            best_total = min(best_total, total)
+
+    kernels = [_size_line] + ([_size_line_numba] if numba is not None else [])
+    for kernel in kernels:
+        choice = np.empty(6, dtype = np.int64)
+        total = kernel(cost, change_penalty, choice)
+        assert total == pytest.approx(best_total)
+        assert np.all(np.diff(choice) <= 0)
+        assert cost[np.arange(6), choice].sum() + change_penalty * np.count_nonzero(np.diff(choice)) == pytest.approx(total)
+
+
+def test_sized_reference_branch_is_telescoping_and_within_the_velocity_limit():
+    result = size_branch(data_input.df_input_data, v_max_m_per_s = 1.5, backend = "python")
+
+    dn_supply, dn_return = result["supply"]["DN [mm]"].to_numpy(), result["return"]["DN [mm]"].to_numpy()
+    assert np.all(np.diff(dn_supply) <= 0) and np.all(np.diff(dn_return) >= 0)
+    for line in ("supply", "return"):
+        assert result[line]["v [m/s]"].max() <= 1.5
+        assert result["summary"][line]["Qdot loss [W]"] == pytest.approx(result[line]["Qdot loss [W]"].sum())
+    df_sized = result["input_data"]
+    np.testing.assert_array_equal(df_sized.loc[df_sized["Direction"] == "Supply", "DN [mm]"], dn_supply)
+    np.testing.assert_array_equal(df_sized.loc[df_sized["Direction"] == "Return", "DN [mm]"], dn_return)
+
+    with pytest.raises(ValueError, match = "velocity limits"):
+        size_branch(data_input.df_input_data, v_max_m_per_s = 0.01, backend = "python")
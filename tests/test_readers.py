@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_input
+from utils.readers import read_input_file, convert_input_file, compact_input_frame
+
+
+@pytest.mark.parametrize("extension", ["csv", "parquet", "feather", "arrow", "npz"])
+def test_converted_input_file_reads_back_the_same_data(tmp_path, extension):
+    output_file = str(tmp_path / f"input.{extension}")
+
+    convert_input_file(data_input.data_file, output_file)
+    df_input_data = read_input_file(output_file)
+
+    df_expected = read_input_file(data_input.data_file)
+    assert list(df_input_data.columns) == list(df_expected.columns)
+    for name in df_expected.columns:
+        if extension != "csv" and name in ("Direction", "Location"):
+            assert isinstance(df_input_data[name].dtype, pd.CategoricalDtype)
+        pd.testing.assert_series_equal(df_input_data[name].astype(df_expected[name].dtype), df_expected[name])
+
+
+def test_compact_frame_keeps_the_values(tmp_path):
+    output_file = str(tmp_path / "input.npz")
+    convert_input_file(data_input.data_file, output_file)
+
+    df_compact = read_input_file(output_file, compact = True)
+
+    df_expected = read_input_file(data_input.data_file)
+    assert df_compact["DN [mm]"].dtype == np.int16 and df_compact["L [m]"].dtype == np.float32
+    assert df_compact["Longitude"].dtype == np.float64                         # coordinates stay float64
+    np.testing.assert_allclose(df_compact["L [m]"], df_expected["L [m]"], rtol = 1e-7)
+    pd.testing.assert_frame_equal(compact_input_frame(df_expected), compact_input_frame(df_compact), check_categorical = False)
+
+
+def test_unknown_extension_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match = "Unknown input file format"):
+        convert_input_file(data_input.data_file, str(tmp_path / "input.xlsx"))
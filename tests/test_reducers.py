@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from kernels import COL_T, COL_QDOT_LOSS
+from reducers import SectionReducer
+
+
+@pytest.fixture(scope = "module")
+def outputs():
+    rng = np.random.default_rng(9)
+    outputs = rng.normal(0.0, 1.0, (600, 25, 13))
+    outputs[:, :, COL_T] = 90 + 15 * outputs[:, :, COL_T]
+    outputs[:, :, COL_QDOT_LOSS] = np.exp(3 + outputs[:, :, COL_QDOT_LOSS])   # skewed, positive
+    return outputs
+
+
+def test_merged_reducers_equal_a_single_pass(outputs):
+    single = SectionReducer(25, n_buckets = 64)
+    single.update(outputs)
+
+    parts = [SectionReducer(25, n_buckets = 64) for _ in range(3)]
+    for part, batch in zip(parts, np.split(outputs, [50, 410])):               # uneven parts, several batches each
+        for block in np.array_split(batch, 4):
+            part.update(block)
+    merged = parts[0].merge(parts[1]).merge(parts[2])
+
+    np.testing.assert_array_equal(merged.count, single.count)
+    np.testing.assert_allclose(merged.mean(), single.mean(), rtol = 1e-12)
+    np.testing.assert_allclose(merged.std(), single.std(), rtol = 1e-10)
+    np.testing.assert_array_equal(merged.min(), single.min())
+    np.testing.assert_array_equal(merged.max(), single.max())
+    np.testing.assert_array_equal(merged.sketch.counts, single.sketch.counts)
+    for q in (0.05, 0.5, 0.95):
+        np.testing.assert_array_equal(merged.quantile(q), single.quantile(q))
+
+
+def test_statistics_match_numpy(outputs):
+    reducer = SectionReducer(25, columns = ("T [°C]", COL_QDOT_LOSS), n_buckets = 128)
+    reducer.update(outputs[:300])
+    reducer.update(outputs[300:])
+
+    for column in (COL_T, COL_QDOT_LOSS):
+        values = outputs[:, :, column]
+        np.testing.assert_allclose(reducer.mean(column), values.mean(axis = 0), rtol = 1e-12)
+        np.testing.assert_allclose(reducer.std(column), values.std(axis = 0, ddof = 1), rtol = 1e-10)
+        spread = values.max(axis = 0) - values.min(axis = 0)
+        for q in (0.05, 0.5, 0.95):
+            assert np.all(np.abs(reducer.quantile(q, column) - np.quantile(values, q, axis = 0)) <= 2 * spread / 128)
+    with pytest.raises(KeyError, match = "not reduced"):
+        reducer.mean("v [m/s]")
+    with pytest.raises(ValueError, match = "same sections"):
+        reducer.merge(SectionReducer(24, columns = ("T [°C]", COL_QDOT_LOSS)))
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+
+import data_input
+import data_output
+from branch import Branch
+from result_cache import ResultCache, calculate_input_hash, run_branch_cached
+
+
+def test_miss_after_hit_does_not_append_to_cached_frames(tmp_path):
+    cache = ResultCache(cache_dir = str(tmp_path))
+    frames_first = run_branch_cached(Branch(), cache)                          # miss ---> stored
+    frames_hit = run_branch_cached(Branch(), cache)                            # hit ---> restored frames in data_output
+
+    frames_miss = run_branch_cached(Branch(), use_cache = False)
+
+    for name in ("supply", "return", "system"):
+        assert len(frames_hit[name]) == len(frames_first[name])
+        assert len(frames_miss[name]) == len(frames_first[name])
+        np.testing.assert_allclose(frames_miss[name].to_numpy(dtype = np.float64), frames_first[name].to_numpy(dtype = np.float64))
+    assert len(data_output.df_supply_out) == len(frames_first["supply"])
+
+
+def test_max_iterations_is_part_of_the_key_and_diagnostics_are_restored(tmp_path):
+    assert calculate_input_hash(Branch(max_iterations = 1), data_input.df_input_data) != calculate_input_hash(Branch(max_iterations = 100), data_input.df_input_data)
+
+    cache = ResultCache(cache_dir = str(tmp_path))
+    network_miss = Branch(max_iterations = 1)
+    run_branch_cached(network_miss, cache)
+    network_hit = Branch(max_iterations = 1)
+    run_branch_cached(network_hit, cache)
+
+    for line in ("supply", "return"):
+        expected, restored = network_miss.diagnostics[line], network_hit.diagnostics[line]
+        np.testing.assert_array_equal(restored.iterations, expected.iterations)
+        np.testing.assert_array_equal(restored.residual, expected.residual)
+        np.testing.assert_array_equal(restored.clamped, expected.clamped)
+        assert restored.summary() == expected.summary()
+
+
+def test_truncated_entry_is_a_miss_and_is_removed(tmp_path):
+    cache = ResultCache(cache_dir = str(tmp_path))
+    frames = run_branch_cached(Branch(), cache)
+    key = calculate_input_hash(Branch(), data_input.df_input_data)
+    path = cache._entry_path(key)
+    with open(path, "r+b") as entry:                                           # interrupted write of the entry
+        entry.truncate(os.path.getsize(path) // 2)
+
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
+    frames_rerun = run_branch_cached(Branch(), cache)
+    assert len(frames_rerun["supply"]) == len(frames["supply"]) and cache.get(key) is not None
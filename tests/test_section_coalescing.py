@@ -0,0 +1,34 @@
+import numpy as np
+
+import data_input
+from compiled_network import compile
+from kernels import COL_T, COL_L_TOT, COL_QDOT_LOSS, COL_QDOT_CONSUMER_ABS, COL_QDOT_TOT
+from section_coalescing import expand_output, preprocess_branch
+from utils.readers import split_input_data
+
+
+def _start_values(out:np.ndarray, is_return:bool) -> float:
+    # Total heat flow at the start of the line from the first row of a solved line (see _solve_line() in kernels.py)
+    qdot_consumer_w = out[0, COL_QDOT_CONSUMER_ABS] if is_return else - out[0, COL_QDOT_CONSUMER_ABS]
+    return out[0, COL_QDOT_TOT] + out[0, COL_QDOT_LOSS] - qdot_consumer_w
+
+
+def test_expanded_total_heat_flow_matches_the_original_rows():
+    df_input_data = data_input.df_input_data
+    network = compile(df_input_data)
+    out_supply, out_return = network.solve()
+    df_new, mappings = preprocess_branch(df_input_data)
+    out_supply_new, out_return_new = compile(df_new).solve()
+    assert len(df_new) < len(df_input_data)                                    # rows were merged
+    iv = network.initial_values
+    l_branch_m = network.arrays_supply.l_m.sum()
+
+    for out, out_new, df_line, mapping, t_in_c, l_tot_m, is_return in (
+            (out_supply, out_supply_new, split_input_data(df_input_data)[0], mappings["supply"], iv.t_in_supply_c, 0.0, False),
+            (out_return, out_return_new, split_input_data(df_input_data)[1], mappings["return"], iv.t_in_return_c, l_branch_m, True)):
+        expanded = expand_output(out_new, mapping, df_line, t_in_c, l_tot_m, _start_values(out_new, is_return), is_return, iv.t_consumer_release_c)
+
+        np.testing.assert_allclose(expanded[:, COL_L_TOT], out[:, COL_L_TOT], atol = 1e-6)
+        np.testing.assert_allclose(expanded[:, COL_T], out[:, COL_T], atol = 1e-4)
+        qdot_scale_w = np.abs(out[:, COL_QDOT_LOSS]).sum()
+        assert np.abs(expanded[:, COL_QDOT_TOT] - out[:, COL_QDOT_TOT]).max() < 1e-3 * qdot_scale_w
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import checkpoint
+import data_input
+from checkpoint import Checkpoint
+from compiled_network import compile
+from sensitivity import BranchForwardModel, sobol_analysis
+
+
+def _ishigami(names, x, offset:float = 0.0):
+    return np.sin(x[:, 0]) + 7 * np.sin(x[:, 1]) ** 2 + 0.1 * x[:, 2] ** 4 * np.sin(x[:, 0]) + offset
+
+
+BOUNDS = {"x1": (-np.pi, np.pi), "x2": (-np.pi, np.pi), "x3": (-np.pi, np.pi)}
+
+
+def test_indices_do_not_depend_on_an_offset_of_the_output():
+    result = sobol_analysis(_ishigami, BOUNDS, n_base = 1024, n_bootstrap = 100, seed = 3)
+    result_offset = sobol_analysis(lambda names, x: _ishigami(names, x, offset = 100.0), BOUNDS, n_base = 1024, n_bootstrap = 100, seed = 3)
+
+    np.testing.assert_allclose(result_offset.indices.to_numpy(), result.indices.to_numpy(), atol = 1e-9)
+    np.testing.assert_allclose(result.indices["S1"].to_numpy(), [0.314, 0.442, 0.0], atol = 0.1)     # analytical values
+
+
+def test_checkpoint_of_another_model_is_not_resumed(tmp_path):
+    network = compile(data_input.df_input_data)
+    bounds = {"k_ins_w_per_mk": (0.02, 0.05)}
+    model_loss = BranchForwardModel(network.arrays_supply, network.arrays_return, network.initial_values)
+    model_share = BranchForwardModel(network.arrays_supply, network.arrays_return, network.initial_values, output = "Loss share [-]")
+    assert model_loss.fingerprint() == BranchForwardModel(network.arrays_supply, network.arrays_return, network.initial_values).fingerprint()
+
+    sobol_analysis(model_loss, bounds, n_base = 8, n_bootstrap = 0, seed = 0, checkpoint = Checkpoint(str(tmp_path), interval_s = 0))
+    with pytest.raises(ValueError, match = "another run"):
+        sobol_analysis(model_share, bounds, n_base = 8, n_bootstrap = 0, seed = 0, checkpoint = Checkpoint(str(tmp_path), interval_s = 0))
+
+
+def test_checkpoint_of_an_opaque_model_requires_a_key(tmp_path):
+    with pytest.raises(ValueError, match = "key"):
+        sobol_analysis(_ishigami, BOUNDS, n_base = 8, n_bootstrap = 0, seed = 0, checkpoint = Checkpoint(str(tmp_path / "no_key")))
+    result = sobol_analysis(_ishigami, BOUNDS, n_base = 8, n_bootstrap = 0, seed = 0, checkpoint = Checkpoint(str(tmp_path / "key"), key = "ishigami"))
+    assert result.n_evaluations == 8 * 5
+
+
+def test_checkpoint_of_another_solver_version_is_not_resumed(tmp_path, monkeypatch):
+    with Checkpoint(str(tmp_path), key = "run", interval_s = 0) as run_checkpoint:
+        run_checkpoint.save(0, y = np.zeros(3))
+    monkeypatch.setattr(checkpoint, "SOLVER_VERSION", "0.0.0")
+    with pytest.raises(ValueError, match = "solver version"):
+        Checkpoint(str(tmp_path), key = "run")
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from spatial_index import SpatialIndex
+from synthetic_network import generate_synthetic_branch
+
+
+@pytest.fixture(scope = "module")
+def line():
+    df_input_data = generate_synthetic_branch(2000, seed = 5)
+    df_line = df_input_data[df_input_data["Direction"] == "Supply"]
+    return df_line["Longitude"].to_numpy(), df_line["Latitude"].to_numpy(), SpatialIndex.from_frame(df_line, cell_size_m = 150.0)
+
+
+def test_bbox_query_equals_a_full_scan(line):
+    lon, lat, index = line
+    lon_min, lon_max = np.percentile(lon, [20, 60])
+    lat_min, lat_max = np.percentile(lat, [30, 90])
+
+    result = index.query_bbox(lon_min, lat_min, lon_max, lat_max)
+
+    expected = np.flatnonzero((lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max))
+    assert len(expected) > 0
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_radius_query_equals_a_full_scan_sorted_by_distance(line):
+    lon, lat, index = line
+    radius_m = 400.0
+
+    result, distance_m = index.query_radius(lon[700], lat[700], radius_m, return_distance = True)
+
+    x_m, y_m = index.project(lon, lat)
+    x0_m, y0_m = index.project(lon[700], lat[700])
+    expected_distance_m = np.hypot(x_m - x0_m, y_m - y0_m)
+    assert set(result) == set(np.flatnonzero(expected_distance_m <= radius_m))
+    assert result[0] == 700 and np.all(np.diff(distance_m) >= 0)
+    np.testing.assert_allclose(distance_m, expected_distance_m[result])
+    nearest, nearest_distance_m = index.nearest(lon[700], lat[700], k = 5)
+    np.testing.assert_allclose(nearest_distance_m, np.sort(expected_distance_m)[:5])
+
+
+def test_polygon_query_equals_a_full_scan(line):
+    lon, lat, index = line
+    (lon_a, lon_b), (lat_a, lat_b) = np.percentile(lon, [10, 80]), np.percentile(lat, [10, 80])
+    triangle = [(lon_a, lat_a), (lon_b, lat_a), (lon_a, lat_b)]
+
+    result = index.query_polygon(triangle)
+
+    below_hypotenuse = (lon - lon_a) / (lon_b - lon_a) + (lat - lat_a) / (lat_b - lat_a) < 1
+    expected = np.flatnonzero((lon > lon_a) & (lat > lat_a) & below_hypotenuse)
+    assert len(expected) > 0
+    np.testing.assert_array_equal(result, expected)
+    np.testing.assert_array_equal(index.query_polygon([(lon_a, lat_a), (lon_b, lat_a), (lon_b, lat_b), (lon_a, lat_b)]),
+                                  index.query_bbox(lon_a, lat_a, lon_b, lat_b))
+    with pytest.raises(ValueError, match = "at least 3 vertices"):
+        index.query_polygon(triangle[:2])
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from compiled_network import compile
+from kernels import numba, COL_T
+from synthetic_network import generate_synthetic_branch
+from transient import simulate_transient
+
+
+BACKENDS = ["python", pytest.param("numba", marks = pytest.mark.skipif(numba is None, reason = "numba is not installed"))]
+
+
+@pytest.fixture(scope = "module")
+def network():
+    return compile(generate_synthetic_branch(100, seed = 1))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_constant_inlet_stays_at_the_steady_state(network, backend):
+    iv = network.initial_values
+    out_supply, out_return = network.solve(backend = "python")
+
+    result = simulate_transient(network.arrays_supply, network.arrays_return, iv, np.full(20, iv.t_in_supply_c), backend = backend)
+
+    np.testing.assert_allclose(result.t_end_supply_c, result.t_end_supply_c[0], rtol = 1e-12)
+    assert result.t_end_supply_c[0] == pytest.approx(out_supply[-1, COL_T], abs = 0.01)   # plug flow vs. iterated steady-state solution
+    assert result.t_end_return_c[0] == pytest.approx(out_return[-1, COL_T], abs = 0.01)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_step_of_the_inlet_temperature_reaches_the_new_steady_state(network, backend):
+    iv = network.initial_values
+    dt_s = 60.0
+    t_new_c = iv.t_in_supply_c - 20
+    t_in_supply_c = np.where(np.arange(200) < 10, iv.t_in_supply_c, t_new_c)
+
+    result = simulate_transient(network.arrays_supply, network.arrays_return, iv, t_in_supply_c, dt_s = dt_s, backend = backend)
+    steady = simulate_transient(network.arrays_supply, network.arrays_return, iv, np.full(1, t_new_c), backend = backend)
+
+    n_delay = int(np.ceil(result.delay_supply_s[-1] / dt_s))                  # steps until the new temperature reaches the end
+    assert n_delay + 10 < 200
+    np.testing.assert_allclose(result.t_end_supply_c[:10], result.t_end_supply_c[0], rtol = 1e-12)
+    assert result.t_end_supply_c[10 + n_delay // 2] > steady.t_end_supply_c[0] + 1                 # front still on the way
+    assert np.all(np.diff(result.t_end_supply_c[10:]) <= 1e-9)                 # no overshoot
+    np.testing.assert_allclose(result.t_end_supply_c[-50:], steady.t_end_supply_c[0], rtol = 1e-9)
+    assert result.qdot_loss_supply_w[-1] == pytest.approx(steady.qdot_loss_supply_w[0], rel = 1e-9)
@@ -0,0 +1,42 @@
+import numpy as np
+from dataclasses import replace
+
+from compiled_network import compile
+from kernels import build_property_table, solve_line, COL_T, COL_QDOT_LOSS
+from model_param import TwinPipeCoeff
+from synthetic_network import generate_synthetic_branch
+from twin_pipe import build_twin_pipe_coupling, solve_branch_twin_pipe
+
+
+def test_section_gaining_heat_is_not_clamped_to_ambient():
+    network = compile(generate_synthetic_branch(20, seed = 1))
+    iv = network.initial_values
+    arrays = network.arrays_supply
+    t_amb_c = np.full(len(arrays), iv.t_in_supply_c + 20)                     # surroundings warmer than the fluid ---> heat gain
+    arrays = replace(arrays, t_amb_c = t_amb_c, mdot_takeoff_kg_per_s = np.zeros(len(arrays)))
+    table = build_property_table(iv.p_nominal_pa, iv.fluid, iv.t_in_supply_c - 1, t_amb_c.max() + 1)
+    mdot_kg_per_s = 0.2
+
+    out, diagnostics = solve_line(arrays, iv.t_in_supply_c, mdot_kg_per_s, 0.0, 0.0, table, iv.t_consumer_release_c, backend = "python",
+                                  return_diagnostics = True)
+
+    t_c = np.concatenate([[iv.t_in_supply_c], out[:, COL_T]])
+    assert not diagnostics.clamped.any()
+    assert np.all(np.diff(t_c) > 0) and np.all(t_c < t_amb_c[0])
+    assert np.all(out[:, COL_QDOT_LOSS] < 0)
+    # Energy balance of each section (heat gained = heat carried away by the fluid):
+    cp = np.interp(t_c[:-1], table.t_min_c + table.dt_c * np.arange(len(table.cp_ws_per_kgk)), table.cp_ws_per_kgk)
+    np.testing.assert_allclose(mdot_kg_per_s * cp * np.diff(t_c), -out[:, COL_QDOT_LOSS], rtol = 0.01)
+
+
+def test_twin_pipe_heat_gain_is_continuous():
+    network = compile(generate_synthetic_branch(300, seed = 0, location_share = {"channel": 0.3, "surface": 0.0, "soil": 0.7}))
+    coupling = build_twin_pipe_coupling(network.arrays_supply, network.arrays_return, TwinPipeCoeff(r_mutual_mk_per_w = 0.3))
+
+    out_supply, out_return, info = solve_branch_twin_pipe(network.arrays_supply, network.arrays_return, network.initial_values,
+                                                          coupling = coupling, relaxation = 0.5, max_coupling_iterations = 200)
+
+    assert info["converged"]
+    assert (out_return[:, COL_QDOT_LOSS] < 0).any()                            # return sections gain heat from the supply pipe
+    assert not info["diagnostics_return"].clamped.any()
+    assert np.abs(np.diff(out_return[:, COL_T])).max() < 2.0
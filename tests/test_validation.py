@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_input
+from synthetic_network import generate_synthetic_branch
+from utils.exceptions import InputValidationError
+from utils.readers import read_thickness_data
+from utils.validation import check_section_lengths, validate_input_frame
+
+
+def test_missing_lengths_are_filled_from_the_coordinates():
+    df_input_data = generate_synthetic_branch(200, seed = 3)
+    df_missing = df_input_data.copy()
+    df_missing.loc[1::7, "L [m]"] = np.nan
+
+    df_checked, report = check_section_lengths(df_missing)
+
+    assert report.empty
+    np.testing.assert_allclose(df_checked["L [m]"], df_input_data["L [m]"], rtol = 2e-3)      # flat-earth steps of the generator
+    assert df_missing["L [m]"].isna().any()                                    # the input frame is not modified
+
+    _, report = check_section_lengths(df_missing, fill_missing = False)
+    assert (report["issue"] == "missing length").sum() == df_missing["L [m]"].isna().sum()
+
+
+def test_lengths_inconsistent_with_the_coordinates_are_reported():
+    df_input_data = generate_synthetic_branch(200, seed = 3)
+    df_input_data.loc[[10, 20], "L [m]"] = [0.5 * df_input_data.loc[10, "L [m]"] - 10, 3 * df_input_data.loc[20, "L [m]"] + 10]
+
+    _, report = check_section_lengths(df_input_data)
+
+    assert report["row"].tolist() == [10, 20]
+    assert report["issue"].str.startswith(("shorter", "longer")).tolist() == [True, True]
+    with pytest.raises(ValueError, match = "2 section"):
+        check_section_lengths(df_input_data, raise_on_mismatch = True)
+    with pytest.raises(ValueError, match = "Invalid node convention"):
+        check_section_lengths(df_input_data, nodes = {"Return": "middle"})
+
+
+def test_reference_data_fails_the_length_check():
+    # The lengths of the reference data scatter widely around the distances between the nodes (e.g. row 2: 1.58 m stated, 21.6 m
+    # between the nodes). With the default node convention (supply: end nodes, return: start nodes) the same sections of both
+    # lines are flagged.
+    _, report = check_section_lengths(data_input.df_input_data)
+
+    assert report["Direction"].value_counts().to_dict() == {"Supply": 25, "Return": 25}
+    assert report.loc[report["row"] == 2, "L coordinates [m]"].item() == pytest.approx(21.6, abs = 0.1)
+
+
+def test_validation_report_lists_every_problem_with_its_row():
+    th_all = read_thickness_data("../data/insulation_thickness.json")
+    assert validate_input_frame(data_input.df_input_data, th_all).empty
+
+    df_input_data = data_input.df_input_data.copy()
+    df_input_data = df_input_data.astype({"Direction": object, "Insulation": np.float64})
+    df_input_data.loc[3, "Direction"] = "Suply"
+    df_input_data.loc[5, "L [m]"] = -1.0
+    df_input_data.loc[7, "Insulation"] = 1.5
+    df_input_data.loc[8, "DN [mm]"] = 33
+    df_input_data.loc[70, "mdot take-off [kg/s]"] = -0.1
+
+    report = validate_input_frame(df_input_data, th_all)
+
+    problems = {}
+    for row, column, issue in report[["row", "column", "issue"]].itertuples(index = False):
+        problems.setdefault((None if pd.isna(row) else row, column), []).append(issue)
+    assert set(problems) == {(3, "Direction"), (5, "L [m]"), (7, "Insulation"), (8, "DN [mm]"), (70, "mdot take-off [kg/s]"),
+                             (None, "mdot take-off [kg/s]")}
+    assert report["row"].isna().tolist()[0]                                    # problems of the whole frame first
+    assert problems[(None, "mdot take-off [kg/s]")][0].startswith("the return line has more consumers")
+    assert problems[(3, "Direction")][0].startswith("unknown direction")
+    assert problems[(5, "L [m]")] == ["length not positive"]
+    assert problems[(7, "Insulation")] == ["outside the range 0 ... 1"]
+    assert "DN not in the 'th_pipe' data" in problems[(8, "DN [mm]")]         # and in the insulation table of the row
+    assert problems[(70, "mdot take-off [kg/s]")][0].startswith("negative take-off on the return line")
+    assert report.loc[report["row"] == 5, "value"].item() == -1.0
+    with pytest.raises(InputValidationError) as error:
+        validate_input_frame(df_input_data, th_all, raise_on_error = True)
+    assert len(error.value.report) == len(report)
+
+
+def test_missing_column_is_reported_for_the_whole_frame():
+    report = validate_input_frame(data_input.df_input_data.drop(columns = "Insulation"))
+
+    assert len(report) == 1
+    assert report["row"].isna().all() and report["column"].item() == "Insulation" and report["issue"].item() == "missing column"